@@ -4,34 +4,90 @@ from pathlib import Path
 from flask import Flask
 from flask_cors import CORS
 from sqlalchemy.exc import OperationalError
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from . import compression
+from . import database
+from . import health
+from . import json_provider
+from . import metrics
+from .auth import hashing as password_hashing
+from .auth import reaper as token_reaper
+from .auth import throttle as login_throttle
 from .config import Config
-from .extensions import db
+from .extensions import db, token_cache
+from .files import derivatives
+from .files.storage import UploadRequest
+from .inventory import checkpointer as stock_checkpointer
+from .inventory import result_cache as inventory_result_cache
+from .jobs import runner as jobs_runner
+from .migrations import run_migrations
 
 
 def create_app() -> Flask:
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.request_class = UploadRequest
+    if app.config['PROXY_FIX_X_FOR'] > 0:
+        # Dietro nginx `remote_addr` sarebbe sempre il proxy: il limite per IP dei login
+        # userebbe una sola chiave per tutti. Si fida solo degli ultimi N hop di X-Forwarded-For.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'], x_proto=0, x_host=0)
 
-    CORS(app)
+    CORS(app, expose_headers=['ETag', 'X-Inventory-Version'])
+    metrics.init_app(app)
+    compression.init_app(app)
     db.init_app(app)
+    database.init_app(app, db)
+    token_cache.init_app(app)
+    json_provider.init_app(app)
+    password_hashing.init_app(app)
+    login_throttle.init_app(app)
+    token_reaper.init_app(app)
+    stock_checkpointer.init_app(app)
+    derivatives.init_app(app)
+    jobs_runner.init_app(app)
+    inventory_result_cache.init_app(app)
+    health.init_app(app)
 
-    with app.app_context():
-        from . import models  # noqa: F401
+    from . import models  # noqa: F401
 
-        _initialise_database(app)
+    if app.config['DB_BOOTSTRAP_ON_STARTUP']:
+        bootstrap_database(app)
 
     from .auth.routes import bp as auth_bp
     from .files import bp as files_bp
+    from .health import bp as health_bp
+    from .inventory.jobs import register_jobs
     from .inventory.routes import bp as inventory_bp
+    from .jobs import bp as jobs_bp
+    from .migrations import bp as migrations_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(files_bp, url_prefix='/api/files')
     app.register_blueprint(inventory_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
+    app.register_blueprint(migrations_bp)
+    app.register_blueprint(health_bp)
+    register_jobs()
 
     return app
 
 
+def bootstrap_database(app: Flask) -> None:
+    """Schema, migrazioni e indici; con gunicorn `preload_app` gira una volta nel master."""
+    from .inventory.search import ensure_search_indexes
+    from .inventory.versioning import ensure_version_counter
+
+    with app.app_context():
+        _initialise_database(app)
+        if app.config['MIGRATIONS_RUN_ON_STARTUP']:
+            run_migrations(db.engine)
+        ensure_search_indexes(db.engine)
+        ensure_version_counter()
+        # I worker nati da fork non devono ereditare le connessioni aperte qui.
+        database.dispose_engines(app, db)
+
+
 def _initialise_database(app: Flask) -> None:
     max_attempts = app.config.get('DB_INIT_MAX_RETRIES', 1)
     delay_seconds = app.config.get('DB_INIT_RETRY_DELAY', 1)
@@ -40,7 +96,8 @@ def _initialise_database(app: Flask) -> None:
 
     for attempt in range(1, max_attempts + 1):
         try:
-            db.create_all()
+            # Solo il primario: la replica riceve lo schema dalla replicazione.
+            db.create_all(bind=None)
             uploads_path.mkdir(parents=True, exist_ok=True)
             return
         except OperationalError as exc:
@@ -0,0 +1,238 @@
+"""Cache in-process dei token di accesso per evitare query ripetute.
+
+Logout e reset password invalidano subito la cache del worker che li serve;
+su PostgreSQL l'invalidazione arriva agli altri worker via `NOTIFY`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from flask import Flask
+from sqlalchemy.engine import Engine
+
+from ..notify import NotifyListener
+
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = 'token_revocations'
+# Chiavi per NOTIFY: il payload resta sotto il limite di 8000 byte.
+REVOCATION_BATCH_SIZE = 100
+
+
+@dataclass(frozen=True)
+class CachedIdentity:
+    user_id: int
+    username: str
+    expires_at: float
+
+
+class LocalCacheBackend:
+    """Dizionario LRU per processo, protetto da lock."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, CachedIdentity]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[CachedIdentity]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: CachedIdentity) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class NullCacheBackend:
+    """Backend che non memorizza nulla: disattiva la cache."""
+
+    evictions = 0
+
+    def get(self, key: str) -> Optional[CachedIdentity]:
+        return None
+
+    def set(self, key: str, value: CachedIdentity) -> None:
+        return None
+
+    def delete(self, key: str) -> None:
+        return None
+
+    def clear(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return 0
+
+
+CACHE_BACKENDS = {
+    'local': LocalCacheBackend,
+    'none': lambda max_entries: NullCacheBackend(),
+}
+
+
+def cache_key(token_value: str) -> str:
+    """Chiave della cache: il token in chiaro non finisce nelle notifiche."""
+    return hashlib.sha256(token_value.encode('utf-8')).hexdigest()
+
+
+def revocation_payloads(token_values: Iterable[str]) -> List[str]:
+    keys = [cache_key(token_value) for token_value in token_values]
+    return [
+        json.dumps(keys[start:start + REVOCATION_BATCH_SIZE], separators=(',', ':'))
+        for start in range(0, len(keys), REVOCATION_BATCH_SIZE)
+    ]
+
+
+class TokenCache:
+    """Associa token -> identità utente con TTL e invalidazione esplicita."""
+
+    def __init__(self) -> None:
+        self.backend = NullCacheBackend()
+        self.ttl_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        # Cambia a ogni invalidazione: una lettura dal database iniziata prima
+        # non può rimettere in cache un token appena revocato.
+        self.generation = 0
+        self._accepting = True
+        self._listener: Optional[NotifyListener] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        backend_name = app.config.get('TOKEN_CACHE_BACKEND', 'local')
+        factory = CACHE_BACKENDS.get(backend_name)
+        if factory is None:
+            raise RuntimeError(f'Backend cache token sconosciuto: {backend_name}')
+        self.backend = factory(app.config.get('TOKEN_CACHE_MAX_ENTRIES', 10000))
+        self.ttl_seconds = float(app.config.get('TOKEN_CACHE_TTL_SECONDS', 60))
+        self._accepting = True
+        self._listener = None
+        app.extensions['token_cache'] = self
+
+    def listen(self, engine: Engine) -> None:
+        """Su PostgreSQL avvia (una volta per worker) l'ascolto delle revoche."""
+        if engine.dialect.name != 'postgresql' or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            # Finché il LISTEN non è attivo una revoca da un altro worker andrebbe persa.
+            self._accepting = False
+            self._listener = NotifyListener(
+                engine,
+                REVOCATION_CHANNEL,
+                self._on_remote_revocation,
+                on_connect=self._on_listener_connected,
+                on_disconnect=self._on_listener_disconnected,
+                name='token-revocations-listener',
+            )
+            self._listener.start()
+
+    def get(self, token_value: str) -> Optional[CachedIdentity]:
+        key = cache_key(token_value)
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.time():
+            self.backend.delete(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def set(
+        self,
+        token_value: str,
+        user_id: int,
+        username: str,
+        token_expires_at: datetime,
+        generation: Optional[int] = None,
+    ) -> None:
+        """Memorizza l'identità; `generation` è quella letta prima della query sul token."""
+        if self.ttl_seconds <= 0 or not self._accepting:
+            return
+        # I token sono salvati in UTC naive: il confronto avviene sull'epoch UTC.
+        token_deadline = (token_expires_at - datetime(1970, 1, 1)).total_seconds()
+        expires_at = min(time.time() + self.ttl_seconds, token_deadline)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.backend.set(cache_key(token_value), CachedIdentity(user_id, username, expires_at))
+
+    def invalidate(self, token_values: Iterable[str]) -> None:
+        self._invalidate_keys([cache_key(token_value) for token_value in token_values])
+
+    def _invalidate_keys(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self.backend.delete(key)
+                self.invalidations += 1
+
+    def _on_remote_revocation(self, raw_payload: str) -> None:
+        try:
+            keys = json.loads(raw_payload)
+        except ValueError:
+            keys = None
+        if not isinstance(keys, list):
+            logger.warning('Revoca token non valida: %r', raw_payload)
+            self.clear()
+            return
+        self.remote_invalidations += len(keys)
+        self._invalidate_keys(str(key) for key in keys)
+
+    def _on_listener_connected(self, reconnected: bool) -> None:
+        # Le revoche arrivate prima del LISTEN non le abbiamo viste.
+        self.clear()
+        self._accepting = True
+
+    def _on_listener_disconnected(self) -> None:
+        self._accepting = False
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'invalidations': self.invalidations,
+            'remote_invalidations': self.remote_invalidations,
+        }
@@ -0,0 +1,173 @@
+"""Hash delle password in un pool di processi con coda limitata.
+
+PBKDF2 occupa la CPU per decine di millisecondi: eseguito nel thread della
+richiesta blocca il GIL e rallenta tutte le altre richieste del worker. Qui
+gira in processi separati; oltre `PASSWORD_HASH_MAX_PENDING` operazioni in
+attesa la richiesta viene rifiutata subito (`PasswordHasherBusy`) invece di
+accodarsi. Con `PASSWORD_HASH_WORKERS=0` l'hash resta nel thread corrente.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, TypeVar
+
+from flask import Flask, current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+T = TypeVar('T')
+
+
+class PasswordHasherBusy(Exception):
+    """Troppe operazioni di hash in attesa: riprovare più tardi."""
+
+
+def hash_method(password_hash: str) -> str:
+    """Parte iniziale dell'hash Werkzeug (`pbkdf2:sha256:260000`), senza salt né digest."""
+    return password_hash.split('$', 1)[0]
+
+
+def normalize_method(method: str) -> str:
+    """`pbkdf2:sha256` -> `pbkdf2:sha256:<iterazioni di default>`, come lo scrive Werkzeug."""
+    if method.startswith('pbkdf2') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+class PasswordHasher:
+    def __init__(self, method: str, workers: int, max_pending: int, timeout: float) -> None:
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return hash_method(password_hash) != self.method
+
+    def _run(self, func: Callable[..., T], *args) -> T:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+        with self._lock:
+            self.pending += 1
+        if self.workers <= 0:
+            try:
+                result = func(*args)
+            finally:
+                self._release_slot()
+            self._count_completed()
+            return result
+        try:
+            future: Future = self._get_executor().submit(func, *args)
+        except BrokenProcessPool:
+            self._release_slot()
+            self._reset_executor()
+            raise PasswordHasherBusy()
+        # Un hash già avviato non si può interrompere: lo slot resta occupato finché
+        # il processo non finisce davvero, anche se la richiesta ha smesso di aspettare.
+        future.add_done_callback(self._release_slot)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise PasswordHasherBusy()
+        except BrokenProcessPool:
+            # Un processo del pool è morto (es. OOM): il prossimo giro ne crea uno nuovo.
+            self._reset_executor()
+            raise PasswordHasherBusy()
+        self._count_completed()
+        return result
+
+    def _count_completed(self) -> None:
+        # Contato qui e non nel callback: un hash scaduto (`timed_out`) o annullato
+        # finisce comunque, ma il chiamante non ne ha ricevuto il risultato.
+        with self._lock:
+            self.completed += 1
+
+    def _release_slot(self, future: Optional[Future] = None) -> None:
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def start(self) -> None:
+        """Crea subito il pool e i suoi processi.
+
+        Va chiamata finché il processo ha un solo thread (gunicorn `post_fork`,
+        avvio di `python wsgi.py`): lì `fork` è sicuro e i figli non rieseguono
+        il modulo principale, che con `python wsgi.py` ricreerebbe l'app.
+        """
+        if self.workers <= 0:
+            return
+        # Con `fork` il primo task avvia tutti i processi del pool; un hash non
+        # valido (falso senza calcoli) fa anche importare werkzeug nei figli.
+        self._get_executor().submit(check_password_hash, '', '').result()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # Dopo un fork (es. gunicorn --preload) il pool del padre non è utilizzabile.
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+def _pool_context():
+    """`fork` solo senza altri thread: un fork con thread attivi (gthread) può lasciare
+    nel figlio lock presi per sempre. Altrimenti `forkserver`, che crea i figli da un
+    processo pulito."""
+    start_methods = multiprocessing.get_all_start_methods()
+    if 'fork' in start_methods and threading.active_count() == 1:
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else 'spawn')
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_HASH_WORKERS'],
+        app.config['PASSWORD_HASH_MAX_PENDING'],
+        app.config['PASSWORD_HASH_TIMEOUT_SECONDS'],
+    )
+
+
+def get_password_hasher() -> PasswordHasher:
+    return current_app.extensions['password_hasher']
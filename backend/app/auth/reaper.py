@@ -0,0 +1,114 @@
+"""Eliminazione periodica dei token scaduti, fuori dal percorso del login.
+
+Ogni processo avvia un thread che ogni `TOKEN_REAPER_INTERVAL_SECONDS`
+cancella i token scaduti a lotti di `TOKEN_REAPER_BATCH_SIZE` righe, un
+DELETE per lotto: transazioni brevi e nessuna riga caricata in Python.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from flask import Flask, current_app
+from sqlalchemy import delete, select
+
+from ..extensions import db
+from ..models import Token
+
+
+logger = logging.getLogger(__name__)
+
+
+def delete_expired_tokens(batch_size: int, now: Optional[datetime] = None) -> int:
+    """Cancella i token scaduti a lotti; restituisce quanti ne ha eliminati."""
+    now = now or datetime.utcnow()
+    batch = select(Token.id).where(Token.expires_at <= now).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Più worker possono girare insieme: ognuno salta le righe già prese da un altro.
+        batch = batch.with_for_update(skip_locked=True)
+    statement = delete(Token).where(Token.id.in_(batch.scalar_subquery())).execution_options(
+        synchronize_session=False
+    )
+    deleted = 0
+    while True:
+        count = db.session.execute(statement).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+class TokenReaper:
+    def __init__(self, app: Flask, interval_seconds: float, batch_size: int) -> None:
+        self.app = app
+        self.interval_seconds = interval_seconds
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.failures = 0
+        self.deleted_total = 0
+        self.last_deleted = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_seconds = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='token-reaper', daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                logger.exception('Pulizia dei token scaduti non riuscita')
+
+    def run_once(self) -> int:
+        started = time.monotonic()
+        deleted = delete_expired_tokens(self.batch_size)
+        with self._lock:
+            self.runs += 1
+            self.deleted_total += deleted
+            self.last_deleted = deleted
+            self.last_run_at = datetime.utcnow()
+            self.last_duration_seconds = time.monotonic() - started
+        if deleted:
+            logger.info('Eliminati %s token scaduti', deleted)
+        return deleted
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'runs': self.runs,
+                'failures': self.failures,
+                'deleted_total': self.deleted_total,
+                'last_deleted': self.last_deleted,
+                'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+                'last_duration_seconds': round(self.last_duration_seconds, 3),
+            }
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['token_reaper'] = TokenReaper(
+        app,
+        app.config['TOKEN_REAPER_INTERVAL_SECONDS'],
+        app.config['TOKEN_REAPER_BATCH_SIZE'],
+    )
+
+
+def get_token_reaper() -> TokenReaper:
+    return current_app.extensions['token_reaper']
@@ -1,22 +1,46 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 
 from .decorators import token_required
+from .hashing import PasswordHasherBusy
+from .reaper import get_token_reaper
 from .service import (
     authenticate_user,
     create_user,
     is_username_taken,
     issue_token,
     normalize_username,
-    purge_expired_tokens,
     revoke_token,
     reset_password,
     validate_password,
     validate_username,
 )
+from .throttle import get_login_throttle, ip_key, user_key
 
 bp = Blueprint('auth', __name__)
 
 
+def _retry_later(message: str, status: int, retry_after: int):
+    response = jsonify({'message': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@bp.before_app_request
+def start_token_reaper():
+    # Avvio pigro come per i job: i comandi CLI non avviano il thread.
+    get_token_reaper().start()
+
+
+@bp.errorhandler(PasswordHasherBusy)
+def handle_hasher_busy(exc):
+    return _retry_later(
+        'Server occupato, riprova tra qualche secondo',
+        503,
+        current_app.config['PASSWORD_HASH_RETRY_AFTER_SECONDS'],
+    )
+
+
 @bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json() or {}
@@ -48,11 +72,22 @@ def login():
     if not username or not password:
         return jsonify({'message': 'Dati mancanti'}), 400
 
+    throttle = get_login_throttle()
+    config = current_app.config
+    limits = {
+        user_key(normalize_username(username)): config['LOGIN_MAX_FAILURES_PER_USER'],
+        ip_key(request.remote_addr): config['LOGIN_MAX_FAILURES_PER_IP'],
+    }
+    retry_after = throttle.retry_after(limits)
+    if retry_after is not None:
+        return _retry_later('Troppi tentativi di accesso. Riprova più tardi.', 429, retry_after)
+
     user = authenticate_user(username, password)
     if not user:
+        throttle.record_failure(limits)
         return jsonify({'message': 'Credenziali non valide'}), 401
+    throttle.reset(user_key(normalize_username(username)))
 
-    purge_expired_tokens()
     token_value = issue_token(user)
     return jsonify({'message': 'Login avvenuto con successo', 'token': token_value}), 200
 
@@ -94,3 +129,12 @@ def reset_password_route():
         return jsonify({'message': 'Utente non trovato'}), 404
 
     return jsonify({'message': 'Password reimpostata. Effettua il login con le nuove credenziali.'}), 200
+
+
+@bp.cli.command('reap-tokens')
+def reap_tokens_command():
+    """Elimina subito i token scaduti (lo stesso lavoro del thread periodico)."""
+    reaper = get_token_reaper()
+    deleted = reaper.run_once()
+    stats = reaper.stats()
+    print(f"Token scaduti eliminati: {deleted} in {stats['last_duration_seconds']}s")
@@ -6,10 +6,13 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from flask import current_app
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import text
+from sqlalchemy.orm import make_transient_to_detached
 
-from ..extensions import db
+from ..extensions import db, token_cache
 from ..models import Token, User
+from .cache import REVOCATION_CHANNEL, revocation_payloads
+from .hashing import PasswordHasherBusy, get_password_hasher
 
 
 USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{3,64}$')
@@ -36,7 +39,8 @@ def validate_password(password: str) -> bool:
 
 
 def hash_password(password: str) -> str:
-    return generate_password_hash(password)
+    """Calcola l'hash nel pool dedicato; `PasswordHasherBusy` se la coda è piena."""
+    return get_password_hasher().hash(password)
 
 
 def create_user(username: str, password: str) -> User:
@@ -49,9 +53,19 @@ def create_user(username: str, password: str) -> User:
 
 def authenticate_user(username: str, password: str) -> Optional[User]:
     user = User.query.filter_by(username=normalize_username(username)).first()
-    if user and check_password_hash(user.password, password):
-        return user
-    return None
+    if not user:
+        return None
+    hasher = get_password_hasher()
+    if not hasher.verify(user.password, password):
+        return None
+    if hasher.needs_rehash(user.password):
+        # Il costo configurato è cambiato: aggiorna l'hash ora che conosciamo la password.
+        try:
+            user.password = hasher.hash(password)
+            db.session.commit()
+        except PasswordHasherBusy:
+            pass
+    return user
 
 
 def is_username_taken(username: str) -> bool:
@@ -71,21 +85,52 @@ def issue_token(user: User) -> str:
 def get_user_from_token(token_value: str) -> Optional[User]:
     if not token_value:
         return None
-    token = Token.query.filter_by(token=token_value).first()
-    if not token:
+    cached = token_cache.get(token_value)
+    if cached:
+        return _attach_cached_user(cached.user_id, cached.username)
+    token_cache.listen(db.engine)
+    generation = token_cache.generation
+    row = (
+        db.session.query(Token, User)
+        .join(User, Token.user_id == User.id)
+        .filter(Token.token == token_value)
+        .first()
+    )
+    if not row:
         return None
+    token, user = row
     if token.is_expired:
-        db.session.delete(token)
-        db.session.commit()
+        # Niente DELETE in lettura: i token scaduti li elimina il reaper.
         return None
-    return token.user
+    token_cache.set(token_value, user.id, user.username, token.expires_at, generation)
+    return user
+
+
+def _attach_cached_user(user_id: int, username: str) -> User:
+    """Ricostruisce l'utente in sessione senza interrogare il database."""
+    user = User(id=user_id, username=username)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def _publish_revocation(token_values) -> None:
+    """Avvisa gli altri worker nella transazione corrente: parte solo col commit."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for payload in revocation_payloads(token_values):
+        db.session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': REVOCATION_CHANNEL, 'payload': payload},
+        )
 
 
 def revoke_token(token_value: str) -> None:
     token = Token.query.filter_by(token=token_value).first()
     if token:
         db.session.delete(token)
+        _publish_revocation([token_value])
         db.session.commit()
+    token_cache.invalidate([token_value])
 
 
 def reset_password(username: str, new_password: str) -> bool:
@@ -94,16 +139,9 @@ def reset_password(username: str, new_password: str) -> bool:
     if not user:
         return False
     user.password = hash_password(new_password)
+    token_values = [value for (value,) in db.session.query(Token.token).filter_by(user_id=user.id)]
     Token.query.filter_by(user_id=user.id).delete()
+    _publish_revocation(token_values)
     db.session.commit()
+    token_cache.invalidate(token_values)
     return True
-
-
-def purge_expired_tokens() -> None:
-    now = datetime.utcnow()
-    expired_tokens = Token.query.filter(Token.expires_at <= now).all()
-    if not expired_tokens:
-        return
-    for token in expired_tokens:
-        db.session.delete(token)
-    db.session.commit()
@@ -0,0 +1,91 @@
+"""Limite ai tentativi di login falliti, per utente e per indirizzo IP.
+
+I contatori sono in memoria per processo (come la cache dei token): con più
+worker gunicorn il limite effettivo è moltiplicato per il numero di worker.
+Una chiave bloccata viene rifiutata prima di calcolare l'hash della password.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, Optional
+
+from flask import Flask, current_app
+
+
+class LoginThrottle:
+    def __init__(self, window_seconds: float, max_entries: int) -> None:
+        self.window_seconds = window_seconds
+        self.max_entries = max(1, max_entries)
+        self._failures: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.blocked = 0
+
+    def _recent(self, key: str, now: float) -> Optional[Deque[float]]:
+        attempts = self._failures.get(key)
+        if attempts is None:
+            return None
+        horizon = now - self.window_seconds
+        while attempts and attempts[0] <= horizon:
+            attempts.popleft()
+        if not attempts:
+            del self._failures[key]
+            return None
+        return attempts
+
+    def retry_after(self, limits: Dict[str, int]) -> Optional[int]:
+        """Secondi di attesa se una delle chiavi ha raggiunto il suo limite, altrimenti None."""
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for key, limit in limits.items():
+                attempts = self._recent(key, now)
+                if limit > 0 and attempts is not None and len(attempts) >= limit:
+                    # Si libera un tentativo quando scade il più vecchio fra gli ultimi `limit`.
+                    wait = max(wait, attempts[-limit] + self.window_seconds - now)
+            if wait > 0:
+                self.blocked += 1
+                return max(1, math.ceil(wait))
+        return None
+
+    def record_failure(self, keys: Iterable[str]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                attempts = self._recent(key, now)
+                if attempts is None:
+                    attempts = self._failures[key] = deque()
+                attempts.append(now)
+                self._failures.move_to_end(key)
+            while len(self._failures) > self.max_entries:
+                self._failures.popitem(last=False)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'tracked_keys': len(self._failures), 'blocked': self.blocked}
+
+
+def user_key(username: str) -> str:
+    return f'user:{username.lower()}'
+
+
+def ip_key(address: Optional[str]) -> str:
+    return f'ip:{address or "unknown"}'
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['login_throttle'] = LoginThrottle(
+        app.config['LOGIN_FAILURE_WINDOW_SECONDS'],
+        app.config['LOGIN_THROTTLE_MAX_ENTRIES'],
+    )
+
+
+def get_login_throttle() -> LoginThrottle:
+    return current_app.extensions['login_throttle']
@@ -0,0 +1,158 @@
+"""Compressione negoziata (zstd, brotli, gzip) delle risposte JSON, CSV e testo.
+
+Le risposte bufferizzate vengono compresse se superano
+`COMPRESSION_MIN_BYTES`; quelle in streaming (export) chunk per chunk, con
+un flush a ogni chunk così il client riceve i dati man mano. Sono esclusi
+gli allegati del blueprint files (immagini e PDF sono già compressi), gli
+stream SSE, i file inviati con `send_file` e le risposte parziali.
+
+brotli e zstd richiedono i pacchetti `Brotli` e `zstandard`; senza, resta gzip.
+"""
+
+from __future__ import annotations
+
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional
+
+from flask import Flask, Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dipende dall'installazione
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dipende dall'installazione
+    zstandard = None
+
+
+class _GzipCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def _available_codecs(config) -> Dict[str, Callable[[], object]]:
+    """Codifiche disponibili, in ordine di preferenza del server a parità di qualità."""
+    codecs: Dict[str, Callable[[], object]] = {}
+    if zstandard is not None:
+        codecs['zstd'] = lambda: _ZstdCompressor(config['COMPRESSION_ZSTD_LEVEL'])
+    if brotli is not None:
+        codecs['br'] = lambda: _BrotliCompressor(config['COMPRESSION_BROTLI_QUALITY'])
+    codecs['gzip'] = lambda: _GzipCompressor(config['COMPRESSION_GZIP_LEVEL'])
+    return codecs
+
+
+class ResponseCompressor:
+    def __init__(self, app: Flask) -> None:
+        config = app.config
+        self.min_bytes = config['COMPRESSION_MIN_BYTES']
+        self.mimetypes = frozenset(config['COMPRESSION_MIMETYPES'])
+        self.excluded_blueprints = frozenset(config['COMPRESSION_EXCLUDED_BLUEPRINTS'])
+        self.codecs = _available_codecs(config)
+        self.encodings: List[str] = list(self.codecs)
+
+    def _negotiate(self) -> Optional[str]:
+        encoding = request.accept_encodings.best_match(self.encodings)
+        return encoding if encoding in self.codecs else None
+
+    def _compressible(self, response: Response) -> bool:
+        return (
+            response.mimetype in self.mimetypes
+            and request.blueprint not in self.excluded_blueprints
+            and request.method != 'HEAD'
+            and 200 <= response.status_code < 300
+            and response.status_code not in (204, 206)
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            # Werkzeug 2.0 restituisce None per la direttiva senza valore.
+            and 'no-transform' not in response.cache_control
+        )
+
+    def process(self, response: Response) -> Response:
+        if not self._compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self._negotiate()
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            self._compress_stream(response, self.codecs[encoding]())
+        else:
+            body = response.get_data()
+            if len(body) < self.min_bytes:
+                return response
+            compressor = self.codecs[encoding]()
+            response.set_data(compressor.compress(body) + compressor.finish())
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # Rappresentazione diversa dai byte originali: un ETag forte non è più corretto.
+            response.set_etag(etag, weak=True)
+        return response
+
+    @staticmethod
+    def _compress_stream(response: Response, compressor) -> None:
+        source = response.response
+        chunks = response.iter_encoded()
+
+        def generate() -> Iterator[bytes]:
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+
+        response.response = generate()
+        response.headers.pop('Content-Length', None)
+        if hasattr(source, 'close'):
+            response.call_on_close(source.close)
+
+
+def _compress_response(response: Response) -> Response:
+    return current_app.extensions['response_compressor'].process(response)
+
+
+def init_app(app: Flask) -> None:
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+    app.extensions['response_compressor'] = ResponseCompressor(app)
+    app.after_request(_compress_response)
+
@@ -6,13 +6,110 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DEFAULT_DB_URI = 'postgresql+psycopg2://fastcharge:fastcharge@db:5432/fastcharge'
 
 
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, '1' if default else '0').lower() not in ('0', 'false', 'no')
+
+
+def _engine_options(database_url: str) -> dict:
+    """Opzioni del pool di connessioni; SQLite (sviluppo) usa i default di SQLAlchemy."""
+    if database_url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+    }
+
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'chiave_segreta')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', DEFAULT_DB_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else None
+    DB_REPLICA_MAX_TRACKED_USERS = int(os.getenv('DB_REPLICA_MAX_TRACKED_USERS', 10000))
+    DB_REPLICA_VERSION_CACHE_SECONDS = float(os.getenv('DB_REPLICA_VERSION_CACHE_SECONDS', 1))
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 15000))
+    DB_EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_EXPORT_STATEMENT_TIMEOUT_MS', 0))
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', str(BASE_DIR / 'uploads'))
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'webp'}
     TOKEN_TTL_SECONDS = int(os.getenv('TOKEN_TTL_SECONDS', 60 * 60 * 24))
     DB_INIT_MAX_RETRIES = int(os.getenv('DB_INIT_MAX_RETRIES', 10))
     DB_INIT_RETRY_DELAY = float(os.getenv('DB_INIT_RETRY_DELAY', 2))
     FILE_TOKEN_TTL_SECONDS = int(os.getenv('FILE_TOKEN_TTL_SECONDS', 60 * 60))
+    FILE_TOKEN_BUCKET_SECONDS = int(os.getenv('FILE_TOKEN_BUCKET_SECONDS', max(FILE_TOKEN_TTL_SECONDS // 4, 0)))
+    FILE_TOKEN_MEMO_MAX_ENTRIES = int(os.getenv('FILE_TOKEN_MEMO_MAX_ENTRIES', 50000))
+    TOKEN_CACHE_BACKEND = os.getenv('TOKEN_CACHE_BACKEND', 'local')
+    TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', 10000))
+    TOKEN_CACHE_TTL_SECONDS = float(os.getenv('TOKEN_CACHE_TTL_SECONDS', 60))
+    INVENTORY_PAGE_DEFAULT_LIMIT = int(os.getenv('INVENTORY_PAGE_DEFAULT_LIMIT', 100))
+    INVENTORY_PAGE_MAX_LIMIT = int(os.getenv('INVENTORY_PAGE_MAX_LIMIT', 500))
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+    INVENTORY_CACHE_MAX_ENTRIES = int(os.getenv('INVENTORY_CACHE_MAX_ENTRIES', 256))
+    INVENTORY_CACHE_MAX_BYTES = int(os.getenv('INVENTORY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    INVENTORY_CACHE_WAIT_SECONDS = float(os.getenv('INVENTORY_CACHE_WAIT_SECONDS', 30))
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))
+    SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', 20))
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+    IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+    MOVEMENTS_MAX_BATCH = int(os.getenv('MOVEMENTS_MAX_BATCH', 1000))
+    STOCK_CHECKPOINT_MIN_MOVEMENTS = int(os.getenv('STOCK_CHECKPOINT_MIN_MOVEMENTS', 50))
+    STOCK_CHECKPOINT_LAG_SECONDS = int(os.getenv('STOCK_CHECKPOINT_LAG_SECONDS', 300))
+    STOCK_CHECKPOINT_INTERVAL_SECONDS = float(os.getenv('STOCK_CHECKPOINT_INTERVAL_SECONDS', 900))
+    LOCATIONS_CACHE_TTL_SECONDS = float(os.getenv('LOCATIONS_CACHE_TTL_SECONDS', 30))
+    CHANGES_MAX_ITEMS = int(os.getenv('CHANGES_MAX_ITEMS', 1000))
+    EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+    # Ogni stream SSE occupa un thread del worker: il limite resta ben sotto GUNICORN_THREADS.
+    EVENTS_MAX_SUBSCRIBERS = int(os.getenv('EVENTS_MAX_SUBSCRIBERS', max(1, int(os.getenv('GUNICORN_THREADS', 16)) // 2)))
+    EVENTS_RETRY_AFTER_SECONDS = int(os.getenv('EVENTS_RETRY_AFTER_SECONDS', 30))
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+    EVENTS_MAX_STREAM_SECONDS = float(os.getenv('EVENTS_MAX_STREAM_SECONDS', 300))
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 512 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+    UPLOAD_SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL_SECONDS', 60 * 60 * 24))
+    UPLOAD_GC_GRACE_SECONDS = int(os.getenv('UPLOAD_GC_GRACE_SECONDS', 60 * 60))
+    THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', 256))
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_QUEUE_SIZE = int(os.getenv('THUMBNAIL_QUEUE_SIZE', 200))
+    FILES_ACCEL_REDIRECT_PREFIX = os.getenv('FILES_ACCEL_REDIRECT_PREFIX', '')
+    JOBS_FOLDER = os.getenv('JOBS_FOLDER', str(BASE_DIR / 'jobs'))
+    JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', 1))
+    JOBS_POLL_SECONDS = float(os.getenv('JOBS_POLL_SECONDS', 2))
+    JOBS_PROGRESS_INTERVAL = float(os.getenv('JOBS_PROGRESS_INTERVAL', 1))
+    JOBS_STALE_SECONDS = int(os.getenv('JOBS_STALE_SECONDS', 120))
+    JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+    JOBS_MAINTENANCE_SECONDS = int(os.getenv('JOBS_MAINTENANCE_SECONDS', 60))
+    JOBS_RESULT_TTL_SECONDS = int(os.getenv('JOBS_RESULT_TTL_SECONDS', 60 * 60 * 24))
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 8))
+    PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', 5))
+    PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.getenv('PASSWORD_HASH_RETRY_AFTER_SECONDS', 2))
+    LOGIN_MAX_FAILURES_PER_USER = int(os.getenv('LOGIN_MAX_FAILURES_PER_USER', 5))
+    LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', 20))
+    # Proxy fidati davanti al backend (l'nginx del frontend = 1); 0 = client diretti.
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
+    LOGIN_FAILURE_WINDOW_SECONDS = float(os.getenv('LOGIN_FAILURE_WINDOW_SECONDS', 300))
+    LOGIN_THROTTLE_MAX_ENTRIES = int(os.getenv('LOGIN_THROTTLE_MAX_ENTRIES', 10000))
+    TOKEN_REAPER_INTERVAL_SECONDS = float(os.getenv('TOKEN_REAPER_INTERVAL_SECONDS', 300))
+    TOKEN_REAPER_BATCH_SIZE = int(os.getenv('TOKEN_REAPER_BATCH_SIZE', 1000))
+    DB_BOOTSTRAP_ON_STARTUP = _env_flag('DB_BOOTSTRAP_ON_STARTUP', True)
+    MIGRATIONS_RUN_ON_STARTUP = _env_flag('MIGRATIONS_RUN_ON_STARTUP', True)
+    HEALTH_DB_CHECK_SECONDS = float(os.getenv('HEALTH_DB_CHECK_SECONDS', 10))
+    METRICS_ENABLED = _env_flag('METRICS_ENABLED', True)
+    METRICS_BEARER_TOKEN = os.getenv('METRICS_BEARER_TOKEN', '')
+    METRICS_DIR = os.getenv('METRICS_DIR', '')
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+    METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 10))
+    SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 0))
+    COMPRESSION_ENABLED = _env_flag('COMPRESSION_ENABLED', True)
+    COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', 3))
+    COMPRESSION_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+    # Allegati: immagini e PDF sono già compressi.
+    COMPRESSION_EXCLUDED_BLUEPRINTS = {'files'}
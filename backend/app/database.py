@@ -0,0 +1,208 @@
+"""Letture sulla replica e timeout delle query per richiesta.
+
+Le route di sola lettura marcate con `read_replica` leggono dalla replica
+(`DATABASE_REPLICA_URL`) solo se questa ha già raggiunto la versione
+dell'inventario scritta per ultima dall'utente: il client la invia in
+`X-Inventory-Min-Version` e ogni worker ricorda anche le scritture che ha
+servito. Altrimenti, o se la replica non risponde, si legge dal primario.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from flask import Flask, current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm, text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+MIN_VERSION_HEADER = 'X-Inventory-Min-Version'
+
+F = TypeVar('F', bound=Callable)
+
+
+def _replica_selected() -> bool:
+    return has_app_context() and g.get('db_read_replica', False)
+
+
+class RoutingSession(SignallingSession):
+    """Sessione che manda le letture alla replica quando la richiesta lo consente."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if _replica_selected() and not self._flushing and not getattr(clause, 'is_dml', False):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    def __init__(self, max_entries: int, version_ttl_seconds: float) -> None:
+        self.max_entries = max(1, max_entries)
+        self.version_ttl_seconds = version_ttl_seconds
+        self._last_writes: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # (istante della lettura, versione o None se la replica non risponde)
+        self._replica_state: Optional[Tuple[float, Optional[int]]] = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.replica_errors = 0
+        self.version_checks = 0
+
+    def note_write(self, username: str, version: int) -> None:
+        with self._lock:
+            self._last_writes[username] = max(version, self._last_writes.get(username, 0))
+            self._last_writes.move_to_end(username)
+            while len(self._last_writes) > self.max_entries:
+                self._last_writes.popitem(last=False)
+
+    def required_version(self, username: str, client_version: Optional[str]) -> int:
+        with self._lock:
+            required = self._last_writes.get(username, 0)
+        try:
+            required = max(required, int(client_version or 0))
+        except ValueError:
+            pass
+        return required
+
+    def _fresh_state(self) -> Optional[Tuple[float, Optional[int]]]:
+        state = self._replica_state
+        if state is not None and time.monotonic() - state[0] < self.version_ttl_seconds:
+            return state
+        return None
+
+    def replica_version(self) -> Optional[int]:
+        """Versione della replica, riletta al più una volta ogni `DB_REPLICA_VERSION_CACHE_SECONDS`.
+
+        La versione della replica cresce soltanto: un valore in cache può far
+        leggere dal primario più del necessario, mai dati più vecchi del richiesto.
+        """
+        state = self._fresh_state()
+        if state is not None:
+            return state[1]
+        # Una sola lettura alla volta: chi arriva nel frattempo usa il valore precedente.
+        if not self._refresh_lock.acquire(blocking=self._replica_state is None):
+            return self._replica_state[1]
+        try:
+            state = self._fresh_state()
+            if state is None:
+                state = self._replica_state = (time.monotonic(), self._read_replica_version())
+            return state[1]
+        finally:
+            self._refresh_lock.release()
+
+    def _read_replica_version(self) -> Optional[int]:
+        from .inventory.versioning import VERSION_ROW_ID
+
+        with self._lock:
+            self.version_checks += 1
+
+        engine = get_state(current_app).db.get_engine(current_app, bind=REPLICA_BIND)
+        try:
+            with engine.connect() as connection:
+                value = connection.execute(
+                    text('SELECT value FROM inventory_version WHERE id = :id'), {'id': VERSION_ROW_ID}
+                ).scalar()
+        except SQLAlchemyError:
+            with self._lock:
+                self.replica_errors += 1
+            logger.warning('Replica non raggiungibile, lettura dal primario', exc_info=True)
+            return None
+        return None if value is None else int(value)
+
+    def use_replica(self, username: str, client_version: Optional[str]) -> bool:
+        required = self.required_version(username, client_version)
+        # La lettura della versione fa anche da controllo di salute della replica.
+        replica_version = self.replica_version()
+        use = replica_version is not None and replica_version >= required
+        with self._lock:
+            if use:
+                self.replica_reads += 1
+            else:
+                self.primary_reads += 1
+        return use
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'tracked_users': len(self._last_writes),
+                'replica_reads': self.replica_reads,
+                'primary_reads': self.primary_reads,
+                'replica_errors': self.replica_errors,
+                'version_checks': self.version_checks,
+            }
+
+
+def get_replica_router() -> Optional[ReplicaRouter]:
+    return current_app.extensions.get('replica_router')
+
+
+def read_replica(func: F) -> F:
+    """Legge dalla replica se aggiornata; va applicato sotto `token_required`."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        router = get_replica_router()
+        if router is not None and router.use_replica(g.current_user.username, request.headers.get(MIN_VERSION_HEADER)):
+            g.db_read_replica = True
+        return func(*args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def note_write(username: str, version: int) -> None:
+    router = get_replica_router()
+    if router is not None:
+        router.note_write(username, version)
+
+
+def statement_timeout(config_key: str) -> Callable[[F], F]:
+    """Sostituisce `DB_STATEMENT_TIMEOUT_MS` per una route (es. export lunghi)."""
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            g.statement_timeout_ms = current_app.config[config_key]
+            return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def _apply_statement_timeout(session, transaction, connection) -> None:
+    # Solo durante le richieste: job e comandi CLI non hanno limite.
+    if connection.dialect.name != 'postgresql' or not has_request_context():
+        return
+    timeout_ms = int(g.get('statement_timeout_ms', current_app.config['DB_STATEMENT_TIMEOUT_MS']))
+    if timeout_ms > 0:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout_ms}')
+
+
+def dispose_engines(app: Flask, db: SQLAlchemy) -> None:
+    """Chiude le connessioni nel pool del primario e della replica (prima di un fork)."""
+    for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or {}):
+        db.get_engine(app, bind=bind).dispose()
+
+
+def init_app(app: Flask, db: SQLAlchemy) -> None:
+    if not event.contains(db.session, 'after_begin', _apply_statement_timeout):
+        event.listen(db.session, 'after_begin', _apply_statement_timeout)
+    if (app.config.get('SQLALCHEMY_BINDS') or {}).get(REPLICA_BIND):
+        app.extensions['replica_router'] = ReplicaRouter(
+            app.config['DB_REPLICA_MAX_TRACKED_USERS'],
+            app.config['DB_REPLICA_VERSION_CACHE_SECONDS'],
+        )
@@ -1,4 +1,6 @@
-from flask_sqlalchemy import SQLAlchemy
+from .auth.cache import TokenCache
+from .database import RoutingSQLAlchemy
 
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+token_cache = TokenCache()
@@ -0,0 +1,163 @@
+"""Miniature WebP degli allegati, generate in background e salvate su disco.
+
+La miniatura di `<foto>` vive in `UPLOAD_FOLDER/derived/<foto>.thumb<N>.webp`:
+il nome deriva dall'allegato, quindi chi la serve sa sempre da quale file
+rigenerarla. Pillow è opzionale; senza Pillow le miniature sono disattivate.
+Le anteprime dei PDF (prima pagina) richiedono `pdftoppm` (poppler-utils).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import FrozenSet, Optional, Set
+
+from flask import Flask, current_app
+
+from ..utils import IMAGE_EXTENSIONS, thumbnail_key, thumbnail_source
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - dipende dall'installazione
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+PDF_RENDER_TIMEOUT_SECONDS = 30
+
+
+class DerivativeWorker:
+    """Pool limitato di thread: i lavori oltre `queue_size` vengono scartati.
+
+    Un lavoro scartato non va perso: la miniatura mancante viene richiesta
+    di nuovo quando un client prova a scaricarla.
+    """
+
+    def __init__(self, upload_folder: str, size: int, workers: int, queue_size: int) -> None:
+        self.upload_folder = Path(upload_folder).resolve()
+        self.size = size
+        self.pdftoppm = shutil.which('pdftoppm')
+        kinds = {'image'}
+        if self.pdftoppm:
+            kinds.add('pdf')
+        self.supported_kinds: FrozenSet[str] = frozenset(kinds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def supports(self, filename: str) -> bool:
+        return _kind(filename) in self.supported_kinds
+
+    def submit(self, filename: str) -> bool:
+        """Accoda la miniatura di `filename`; False se la coda è piena o non serve."""
+        if not self.supports(filename):
+            return False
+        with self._lock:
+            if filename in self._pending:
+                return True
+            if not self._slots.acquire(blocking=False):
+                return False
+            self._pending.add(filename)
+        self._executor.submit(self._run, filename)
+        return True
+
+    def _run(self, filename: str) -> None:
+        try:
+            source = (self.upload_folder / filename).resolve()
+            target = (self.upload_folder / thumbnail_key(filename, self.size)).resolve()
+            if not (self._inside_upload_folder(source) and self._inside_upload_folder(target)):
+                logger.warning('Miniatura rifiutata: %s è fuori dalla cartella upload', filename)
+                return
+            if source.exists() and not target.exists():
+                self.render(source, target)
+        except Exception:
+            logger.exception('Miniatura non generata per %s', filename)
+        finally:
+            with self._lock:
+                self._pending.discard(filename)
+            self._slots.release()
+
+    def _inside_upload_folder(self, path: Path) -> bool:
+        return path != self.upload_folder and self.upload_folder in path.parents
+
+    def render(self, source: Path, target: Path) -> None:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if _kind(source.name) == 'pdf':
+            with tempfile.TemporaryDirectory(dir=target.parent) as workdir:
+                prefix = os.path.join(workdir, 'page')
+                subprocess.run(
+                    [self.pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-png',
+                     '-scale-to', str(self.size * 2), str(source), prefix],
+                    check=True,
+                    capture_output=True,
+                    timeout=PDF_RENDER_TIMEOUT_SECONDS,
+                )
+                self._write_webp(Path(prefix + '.png'), target)
+            return
+        self._write_webp(source, target)
+
+    def _write_webp(self, source: Path, target: Path) -> None:
+        with Image.open(source) as image:
+            # Per i JPEG decodifica già ridotto: molto meno lavoro sulle foto da telefono.
+            image.draft('RGB', (self.size, self.size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((self.size, self.size))
+            if image.mode not in ('RGB', 'RGBA'):
+                transparent = 'A' in image.getbands() or 'transparency' in image.info
+                image = image.convert('RGBA' if transparent else 'RGB')
+            fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix='.thumb-', suffix='.webp')
+            try:
+                with os.fdopen(fd, 'wb') as output:
+                    image.save(output, 'WEBP', quality=80, method=4)
+                os.replace(temp_path, target)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+
+def _kind(filename: str) -> Optional[str]:
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension == 'pdf':
+        return 'pdf'
+    return None
+
+
+def init_app(app: Flask) -> None:
+    size = app.config['THUMBNAIL_SIZE']
+    if Image is None or size <= 0:
+        return
+    app.extensions['derivatives'] = DerivativeWorker(
+        app.config['UPLOAD_FOLDER'],
+        size,
+        app.config['THUMBNAIL_WORKERS'],
+        app.config['THUMBNAIL_QUEUE_SIZE'],
+    )
+
+
+def get_derivative_worker() -> Optional[DerivativeWorker]:
+    return current_app.extensions.get('derivatives')
+
+
+def schedule_derivatives(filename: Optional[str]) -> None:
+    worker = get_derivative_worker()
+    if worker is not None and filename:
+        worker.submit(filename)
+
+
+def regenerate_missing(thumbnail: str) -> bool:
+    """Per una miniatura assente riaccoda la generazione; False se il nome non è una miniatura."""
+    worker = get_derivative_worker()
+    source = thumbnail_source(thumbnail)
+    if worker is None or source is None:
+        return False
+    return worker.submit(source)
@@ -1,9 +1,23 @@
+import mimetypes
 from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
 
-from flask import Blueprint, current_app, jsonify, send_from_directory
+from flask import Blueprint, current_app, g, jsonify, request, send_from_directory
+from werkzeug.exceptions import NotFound
 
 from ..auth.decorators import token_required
-from ..utils import resolve_file_token
+from ..utils import resolve_file_token, thumbnail_source
+from .derivatives import regenerate_missing
+from .storage import (
+    UploadOffsetMismatch,
+    append_chunk,
+    collect_garbage,
+    create_upload_session,
+    discard_upload_session,
+    get_upload_session,
+    is_blob_key,
+)
 
 bp = Blueprint('files', __name__)
 
@@ -18,8 +32,157 @@ def serve_uploaded_file(file_token: str):
         return jsonify({'message': str(exc)}), 400
 
     uploads_dir = Path(current_app.config['UPLOAD_FOLDER'])
-    file_path = uploads_dir / filename
-    if not file_path.exists():
-        return jsonify({'message': 'File non trovato'}), 404
+    accel_prefix = current_app.config['FILES_ACCEL_REDIRECT_PREFIX']
+    if accel_prefix and request.headers.get('X-Files-Offload'):
+        # Solo le miniature vanno controllate qui: se mancano vanno rigenerate.
+        if thumbnail_source(filename) is None or (uploads_dir / filename).is_file():
+            return _with_cache_headers(_accel_redirect(accel_prefix, filename))
+        return _missing_file(filename)
 
-    return send_from_directory(uploads_dir, filename, as_attachment=False)
+    try:
+        response = send_from_directory(
+            uploads_dir,
+            filename,
+            as_attachment=False,
+            etag=_content_etag(filename) or True,
+            max_age=None,
+        )
+    except NotFound:
+        return _missing_file(filename)
+    response.accept_ranges = 'bytes'
+    return _with_cache_headers(response)
+
+
+def _content_etag(filename: str) -> Optional[str]:
+    """ETag forte dall'hash nel nome per i file indirizzati per contenuto."""
+    source = thumbnail_source(filename)
+    key = source or filename
+    if not is_blob_key(key):
+        return None
+    digest = Path(key).stem
+    # Miniature: `<sha256>-thumb256`.
+    return digest if source is None else f"{digest}-{filename.rsplit('.', 2)[-2]}"
+
+
+def _accel_redirect(prefix: str, filename: str):
+    response = current_app.response_class()
+    response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(filename)
+    response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return response
+
+
+def _with_cache_headers(response):
+    # Il token identifica un contenuto che non cambia: la cache del browser
+    # può riusarlo senza rivalidare finché il link è valido.
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['FILE_TOKEN_TTL_SECONDS']
+    response.cache_control.immutable = True
+    response.headers.pop('Expires', None)
+    return response
+
+
+def _missing_file(filename: str):
+    if regenerate_missing(filename):
+        response = jsonify({'message': 'Anteprima in preparazione'})
+        response.headers['Retry-After'] = '2'
+        return response, 404
+    return jsonify({'message': 'File non trovato'}), 404
+
+
+def _upload_status(session_id: str, size: int, received: int):
+    return {'id': session_id, 'size': size, 'offset': received}
+
+
+def _declared_size(value: object) -> int:
+    """Dimensione dichiarata dal client: intero (o stringa di cifre), mai bool o float."""
+    if isinstance(value, str) and value.strip().isdecimal():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError('Dimensione file non valida')
+
+
+@bp.post('/uploads')
+@token_required
+def start_chunked_upload():
+    """Apre un upload a blocchi ripristinabile: `{filename, size}`."""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'message': 'Dati mancanti'}), 400
+    try:
+        size = _declared_size(payload.get('size'))
+        session = create_upload_session(
+            str(payload.get('filename') or ''),
+            size,
+            g.current_user.username,
+            current_app.config['UPLOAD_MAX_BYTES'],
+        )
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+    status = _upload_status(session.id, session.size, 0)
+    status['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(status), 201
+
+
+@bp.get('/uploads/<string:session_id>')
+@token_required
+def get_chunked_upload(session_id: str):
+    """Byte già ricevuti: il client riprende da `offset`."""
+    session = get_upload_session(session_id, g.current_user.username)
+    if not session:
+        return jsonify({'message': 'Upload non trovato'}), 404
+    return jsonify(_upload_status(session.id, session.size, session.received)), 200
+
+
+@bp.patch('/uploads/<string:session_id>')
+@token_required
+def append_chunked_upload(session_id: str):
+    """Aggiunge un blocco (corpo grezzo) all'offset indicato in `Upload-Offset`."""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'message': 'Intestazione Upload-Offset mancante o non valida'}), 400
+
+    session = get_upload_session(session_id, g.current_user.username, lock=True)
+    if not session:
+        return jsonify({'message': 'Upload non trovato'}), 404
+    size = session.size
+    try:
+        received, key = append_chunk(session, offset, request.stream)
+    except UploadOffsetMismatch as exc:
+        status = _upload_status(session_id, size, exc.received)
+        status['message'] = 'Offset non corrispondente, riprendi dai byte già ricevuti'
+        return jsonify(status), 409
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    status = _upload_status(session_id, size, received)
+    status['complete'] = key is not None
+    if key:
+        status['key'] = key
+    return jsonify(status), 200
+
+
+@bp.delete('/uploads/<string:session_id>')
+@token_required
+def cancel_chunked_upload(session_id: str):
+    session = get_upload_session(session_id, g.current_user.username)
+    if not session:
+        return jsonify({'message': 'Upload non trovato'}), 404
+    discard_upload_session(session)
+    return jsonify({'message': 'Upload annullato'}), 200
+
+
+@bp.cli.command('gc')
+def collect_garbage_command():
+    """Elimina i file non più referenziati e gli upload a blocchi abbandonati."""
+    stats = collect_garbage(
+        current_app.config['UPLOAD_GC_GRACE_SECONDS'],
+        current_app.config['UPLOAD_SESSION_TTL_SECONDS'],
+    )
+    print(
+        f"File rimossi: {stats['files_removed']} ({stats['bytes_freed']} byte), "
+        f"upload scaduti: {stats['sessions_expired']}, temporanei: {stats['temp_files_removed']}"
+    )
@@ -0,0 +1,385 @@
+"""Archivio dei file caricati indirizzato per contenuto.
+
+Ogni file è salvato una sola volta in `UPLOAD_FOLDER/objects/ab/cd/<sha256>.<ext>`.
+Gli upload vengono scritti su disco a blocchi mentre se ne calcola l'hash e
+poi collegati (hard link) al percorso definitivo, senza una seconda copia.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from flask import Request, current_app
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import FileStorage
+
+from ..extensions import db
+from ..models import StoredFile, UploadSession
+from ..utils import allowed_file
+from .derivatives import schedule_derivatives
+
+
+BLOB_PREFIX = 'objects'
+TEMP_DIR = '.tmp'
+PARTIAL_DIR = '.partial'
+COPY_CHUNK_SIZE = 1024 * 1024
+GC_BATCH_SIZE = 500
+
+_BLOB_KEY = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.[a-z0-9]+$')
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, received: int) -> None:
+        super().__init__(received)
+        self.received = received
+
+
+def upload_root() -> Path:
+    return Path(current_app.config['UPLOAD_FOLDER'])
+
+
+def _work_dir(name: str) -> Path:
+    path = upload_root() / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def blob_key(digest: str, extension: str) -> str:
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
+def is_blob_key(value: Optional[str]) -> bool:
+    return bool(value) and _BLOB_KEY.match(value) is not None
+
+
+def _extension(filename: str) -> str:
+    return filename.rsplit('.', 1)[1].lower()
+
+
+class HashingSpool:
+    """File temporaneo nella cartella upload che calcola lo sha256 durante la scrittura."""
+
+    def __init__(self, directory: Path) -> None:
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def name(self) -> str:
+        return self._file.name
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+    def __enter__(self) -> 'HashingSpool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+
+
+class UploadRequest(Request):
+    """Request che scrive i file multipart direttamente su disco calcolandone l'hash."""
+
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None,
+    ) -> BinaryIO:
+        return HashingSpool(_work_dir(TEMP_DIR))  # type: ignore[return-value]
+
+
+def _register_blob(key: str, digest: str, size: int) -> None:
+    """Crea la riga del file o ne rinnova `updated_at` (rimanda la garbage collection)."""
+    now = datetime.utcnow()
+    values = {'key': key, 'sha256': digest, 'size': size, 'ref_count': 0, 'created_at': now, 'updated_at': now}
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = dialect_insert(StoredFile).values(**values)
+        statement = statement.on_conflict_do_update(index_elements=['key'], set_={'updated_at': now})
+        db.session.execute(statement)
+        return
+    touched = db.session.execute(
+        update(StoredFile).where(StoredFile.key == key).values(updated_at=now)
+    ).rowcount
+    if not touched:
+        db.session.execute(insert(StoredFile).values(**values))
+
+
+def _materialize(source: str, key: str) -> None:
+    destination = upload_root() / key
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, destination)
+        return
+    except FileExistsError:
+        # Riutilizzato: aggiorna mtime così la GC non lo scambia per un residuo.
+        os.utime(destination)
+        return
+    except OSError:
+        pass
+    # Filesystem senza hard link: copia in un temporaneo e rinomina atomicamente.
+    fd, temp_path = tempfile.mkstemp(dir=destination.parent, prefix='.blob-')
+    with os.fdopen(fd, 'wb') as target, open(source, 'rb') as origin:
+        shutil.copyfileobj(origin, target, COPY_CHUNK_SIZE)
+    os.replace(temp_path, destination)
+
+
+def _store(source: str, digest: str, size: int, extension: str) -> str:
+    # Prima la riga (che attende un'eventuale GC in corso), poi il file.
+    key = blob_key(digest, extension)
+    _register_blob(key, digest, size)
+    _materialize(source, key)
+    schedule_derivatives(key)
+    return key
+
+
+def save_uploaded_file(file: Optional[FileStorage]) -> Optional[str]:
+    """Salva l'allegato nella sessione corrente e ne restituisce la chiave."""
+    if not file or not file.filename:
+        return None
+    if not allowed_file(file.filename):
+        raise ValueError('Estensione file non consentita')
+    extension = _extension(file.filename)
+
+    spool = file.stream
+    if isinstance(spool, HashingSpool):
+        spool.flush()
+        return _store(spool.name, spool.hexdigest(), spool.size, extension)
+
+    with HashingSpool(_work_dir(TEMP_DIR)) as spool:
+        shutil.copyfileobj(file.stream, spool, COPY_CHUNK_SIZE)
+        spool.flush()
+        return _store(spool.name, spool.hexdigest(), spool.size, extension)
+
+
+def acquire_file(key: Optional[str]) -> None:
+    """Aggiunge un riferimento al file; i nomi legacy (non indirizzati) sono ignorati."""
+    if not is_blob_key(key):
+        return
+    updated = db.session.execute(
+        update(StoredFile)
+        .where(StoredFile.key == key)
+        .values(ref_count=StoredFile.ref_count + 1, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        raise ValueError('Allegato non trovato, caricalo di nuovo')
+
+
+def release_file(key: Optional[str]) -> None:
+    if not is_blob_key(key):
+        return
+    db.session.execute(
+        update(StoredFile)
+        .where(StoredFile.key == key, StoredFile.ref_count > 0)
+        .values(ref_count=StoredFile.ref_count - 1, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _partial_path(session_id: str) -> Path:
+    return _work_dir(PARTIAL_DIR) / session_id
+
+
+def create_upload_session(filename: str, size: int, username: str, max_bytes: int) -> UploadSession:
+    if not filename or not allowed_file(filename):
+        raise ValueError('Estensione file non consentita')
+    if size <= 0:
+        raise ValueError('Dimensione file non valida')
+    if size > max_bytes:
+        raise ValueError(f'File troppo grande (massimo {max_bytes} byte)')
+
+    session = UploadSession(id=uuid.uuid4().hex, filename=filename, size=size, created_by=username)
+    _partial_path(session.id).touch()
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def get_upload_session(session_id: str, username: str, lock: bool = False) -> Optional[UploadSession]:
+    query = UploadSession.query.filter_by(id=session_id, created_by=username)
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+
+def append_chunk(session: UploadSession, offset: int, stream: BinaryIO) -> Tuple[int, Optional[str]]:
+    """Scrive un blocco a partire da `offset`; all'ultimo blocco archivia il file.
+
+    La sessione deve essere stata letta con `lock=True`. Restituisce i byte
+    ricevuti e, a upload completato, la chiave del file.
+    """
+    if offset != session.received:
+        db.session.rollback()
+        raise UploadOffsetMismatch(session.received)
+
+    remaining = session.size - offset
+    path = _partial_path(session.id)
+    written = 0
+    with open(path, 'r+b') as target:
+        target.seek(offset)
+        while True:
+            chunk = stream.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > remaining:
+                db.session.rollback()
+                raise ValueError('Il blocco supera la dimensione dichiarata del file')
+            target.write(chunk)
+        # Scarta eventuali byte di un tentativo precedente non confermato.
+        target.truncate(offset + written)
+
+    received = offset + written
+    session.received = received
+    session.updated_at = datetime.utcnow()
+    if received < session.size:
+        db.session.commit()
+        return received, None
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    key = _store(str(path), digest.hexdigest(), session.size, _extension(session.filename))
+    db.session.delete(session)
+    db.session.commit()
+    path.unlink(missing_ok=True)
+    return received, key
+
+
+def discard_upload_session(session: UploadSession) -> None:
+    db.session.delete(session)
+    db.session.commit()
+    _partial_path(session.id).unlink(missing_ok=True)
+
+
+def _unlink(path: Path) -> int:
+    try:
+        size = path.stat().st_size
+        path.unlink()
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _remove_derivatives(key: str) -> int:
+    freed = 0
+    derived = upload_root() / 'derived' / key
+    for path in derived.parent.glob(f'{derived.name}.thumb*.webp'):
+        freed += _unlink(path)
+    return freed
+
+
+def _collect_orphans(horizon: datetime) -> Tuple[int, int]:
+    removed = freed = 0
+    while True:
+        query = (
+            db.session.query(StoredFile.key)
+            .filter(StoredFile.ref_count <= 0, StoredFile.updated_at < horizon)
+            .order_by(StoredFile.key)
+            .limit(GC_BATCH_SIZE)
+        )
+        if db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        keys = [key for (key,) in query]
+        if not keys:
+            return removed, freed
+        db.session.query(StoredFile).filter(StoredFile.key.in_(keys)).delete(synchronize_session=False)
+        # I file spariscono prima del commit: un upload concorrente dello
+        # stesso contenuto attende il lock sulla riga e poi lo ricrea.
+        for key in keys:
+            freed += _unlink(upload_root() / key)
+            freed += _remove_derivatives(key)
+        db.session.commit()
+        removed += len(keys)
+
+
+def _collect_untracked(horizon: datetime) -> Tuple[int, int]:
+    """File in objects/ senza riga (transazione annullata dopo il salvataggio)."""
+    root = upload_root()
+    blobs = root / BLOB_PREFIX
+    if not blobs.is_dir():
+        return 0, 0
+    cutoff = horizon.timestamp()
+    removed = freed = 0
+    candidates: Dict[str, Path] = {}
+
+    def flush() -> None:
+        nonlocal removed, freed
+        known = {
+            key for (key,) in db.session.query(StoredFile.key).filter(StoredFile.key.in_(list(candidates)))
+        }
+        for key, path in candidates.items():
+            if key not in known:
+                freed += _unlink(path) + _remove_derivatives(key)
+                removed += 1
+        db.session.rollback()
+        candidates.clear()
+
+    for path in blobs.glob('*/*/*'):
+        if path.name.startswith('.') or path.stat().st_mtime >= cutoff:
+            continue
+        candidates[path.relative_to(root).as_posix()] = path
+        if len(candidates) >= GC_BATCH_SIZE:
+            flush()
+    if candidates:
+        flush()
+    return removed, freed
+
+
+def _collect_sessions(horizon: datetime) -> int:
+    expired = [session_id for (session_id,) in (
+        db.session.query(UploadSession.id).filter(UploadSession.updated_at < horizon)
+    )]
+    if expired:
+        db.session.query(UploadSession).filter(UploadSession.id.in_(expired)).delete(synchronize_session=False)
+        db.session.commit()
+        for session_id in expired:
+            _partial_path(session_id).unlink(missing_ok=True)
+    return len(expired)
+
+
+def _collect_temp_files(cutoff: float) -> int:
+    removed = 0
+    for path in _work_dir(TEMP_DIR).iterdir():
+        if path.stat().st_mtime < cutoff:
+            _unlink(path)
+            removed += 1
+    return removed
+
+
+def collect_garbage(grace_seconds: int, session_ttl_seconds: int) -> Dict[str, int]:
+    """Rimuove file senza riferimenti, upload a blocchi abbandonati e temporanei."""
+    now = datetime.utcnow()
+    horizon = now - timedelta(seconds=grace_seconds)
+    orphans, orphan_bytes = _collect_orphans(horizon)
+    untracked, untracked_bytes = _collect_untracked(horizon)
+    return {
+        'files_removed': orphans + untracked,
+        'bytes_freed': orphan_bytes + untracked_bytes,
+        'sessions_expired': _collect_sessions(now - timedelta(seconds=session_ttl_seconds)),
+        'temp_files_removed': _collect_temp_files(time.time() - grace_seconds),
+    }
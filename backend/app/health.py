@@ -0,0 +1,81 @@
+"""Sonde per orchestratori e load balancer, fuori da `/api` e senza autenticazione.
+
+`/healthz` (liveness) risponde finché il processo serve richieste e non
+tocca mai il database. `/readyz` (readiness) verifica il database al più
+una volta ogni `HEALTH_DB_CHECK_SECONDS` per worker: le sonde intermedie
+ricevono l'ultimo esito.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from flask import Blueprint, Flask, current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .extensions import db
+
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('health', __name__)
+
+
+class ReadinessCheck:
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._ready: Optional[bool] = None
+        self._checked_at = 0.0
+        self.checks = 0
+        self.failures = 0
+
+    def is_ready(self) -> bool:
+        if self._ready is not None and time.monotonic() - self._checked_at < self.interval_seconds:
+            return self._ready
+        # Una sola verifica alla volta: chi arriva nel frattempo usa l'esito precedente.
+        if not self._lock.acquire(blocking=self._ready is None):
+            return bool(self._ready)
+        try:
+            ready = self._ping()
+            self._ready = ready
+            self._checked_at = time.monotonic()
+            self.checks += 1
+            if not ready:
+                self.failures += 1
+            return ready
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _ping() -> bool:
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return True
+        except SQLAlchemyError:
+            logger.warning('Database non raggiungibile dalla sonda di readiness', exc_info=True)
+            return False
+
+    def stats(self) -> Dict[str, object]:
+        return {'ready': bool(self._ready), 'checks': self.checks, 'failures': self.failures}
+
+
+@bp.route('/healthz', methods=['GET'])
+def liveness():
+    return jsonify({'status': 'ok'}), 200
+
+
+@bp.route('/readyz', methods=['GET'])
+def readiness():
+    if not current_app.extensions['readiness_check'].is_ready():
+        return jsonify({'status': 'unavailable', 'message': 'Database non raggiungibile'}), 503
+    return jsonify({'status': 'ok'}), 200
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['readiness_check'] = ReadinessCheck(app.config['HEALTH_DB_CHECK_SECONDS'])
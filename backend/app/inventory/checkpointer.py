@@ -0,0 +1,103 @@
+"""Checkpoint periodici delle giacenze, come la pulizia dei token.
+
+Ogni processo avvia un thread che ogni `STOCK_CHECKPOINT_INTERVAL_SECONDS`
+registra i saldi iniziali mancanti e i nuovi checkpoint (`checkpoint_stock`).
+Su PostgreSQL un advisory lock lascia il lavoro a un solo worker per volta;
+gli altri saltano il giro.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from flask import Flask, current_app
+
+from .ledger import checkpoint_stock
+
+
+logger = logging.getLogger(__name__)
+
+
+class StockCheckpointer:
+    def __init__(self, app: Flask, interval_seconds: float, min_movements: int, lag_seconds: int) -> None:
+        self.app = app
+        self.interval_seconds = interval_seconds
+        self.min_movements = max(1, min_movements)
+        self.lag_seconds = lag_seconds
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.opened_total = 0
+        self.created_total = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_seconds = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='stock-checkpointer', daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                logger.exception('Creazione dei checkpoint di magazzino non riuscita')
+
+    def run_once(self) -> Optional[int]:
+        """Un giro di checkpoint; None se un altro processo lo sta già facendo."""
+        started = time.monotonic()
+        result = checkpoint_stock(self.min_movements, self.lag_seconds)
+        with self._lock:
+            if result is None:
+                self.skipped += 1
+                return None
+            opened, created = result
+            self.runs += 1
+            self.opened_total += opened
+            self.created_total += created
+            self.last_run_at = datetime.utcnow()
+            self.last_duration_seconds = time.monotonic() - started
+        if opened or created:
+            logger.info('Registrati %s saldi iniziali e %s checkpoint', opened, created)
+        return created
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'runs': self.runs,
+                'skipped': self.skipped,
+                'failures': self.failures,
+                'opened_total': self.opened_total,
+                'created_total': self.created_total,
+                'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+                'last_duration_seconds': round(self.last_duration_seconds, 3),
+            }
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['stock_checkpointer'] = StockCheckpointer(
+        app,
+        app.config['STOCK_CHECKPOINT_INTERVAL_SECONDS'],
+        app.config['STOCK_CHECKPOINT_MIN_MOVEMENTS'],
+        app.config['STOCK_CHECKPOINT_LAG_SECONDS'],
+    )
+
+
+def get_stock_checkpointer() -> StockCheckpointer:
+    return current_app.extensions['stock_checkpointer']
@@ -0,0 +1,189 @@
+"""Notifiche push (Server-Sent Events) sulle modifiche dell'inventario.
+
+Ogni worker ha un broker in memoria con una coda limitata per iscritto: chi
+legge lentamente perde gli eventi in eccesso e riceve un `resync`, senza mai
+bloccare le scritture. Su PostgreSQL gli eventi passano da `NOTIFY`, così
+arrivano a tutti i worker e solo dopo il commit della transazione.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from ..extensions import db
+from ..notify import NotifyListener
+
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'inventory_events'
+MAX_EVENT_IDS = 100
+RESYNC_EVENT = {'type': 'resync'}
+
+EVENT_CREATED = 'created'
+EVENT_UPDATED = 'updated'
+EVENT_DELETED = 'deleted'
+EVENT_MOVEMENTS = 'movements'
+EVENT_IMPORT = 'import'
+
+_PENDING_KEY = 'inventory_events'
+
+
+class SubscriberLimitReached(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, queue_size: int) -> None:
+        self.queue: 'queue.Queue[Dict[str, object]]' = queue.Queue(maxsize=queue_size)
+
+    def offer(self, payload: Dict[str, object]) -> None:
+        """Accoda senza bloccare; se la coda è piena la svuota e chiede un resync."""
+        try:
+            self.queue.put_nowait(payload)
+            return
+        except queue.Full:
+            pass
+        with self.queue.mutex:
+            self.queue.queue.clear()
+        self.queue.put_nowait(RESYNC_EVENT)
+
+
+class InventoryEventBroker:
+    def __init__(self, queue_size: int, max_subscribers: int) -> None:
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._listener: Optional[NotifyListener] = None
+
+    def subscribe(self, engine: Engine) -> Subscription:
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise SubscriberLimitReached()
+            subscription = Subscription(self.queue_size)
+            self._subscribers.add(subscription)
+            if engine.dialect.name == 'postgresql' and self._listener is None:
+                self._listener = NotifyListener(
+                    engine,
+                    NOTIFY_CHANNEL,
+                    self._publish_notification,
+                    on_connect=self._listener_connected,
+                    name='inventory-events-listener',
+                )
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Idempotente: la stessa iscrizione può essere chiusa da più percorsi."""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, payload: Dict[str, object]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(payload)
+
+    def _publish_notification(self, raw_payload: str) -> None:
+        try:
+            self.publish(json.loads(raw_payload))
+        except ValueError:
+            logger.warning('Evento inventario non valido: %r', raw_payload)
+
+    def _listener_connected(self, reconnected: bool) -> None:
+        if reconnected:
+            # Durante la disconnessione potremmo aver perso eventi.
+            self.publish(RESYNC_EVENT)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'listener': self._listener is not None and self._listener.is_alive(),
+            }
+
+
+def get_event_broker() -> InventoryEventBroker:
+    broker = current_app.extensions.get('inventory_events')
+    if broker is None:
+        broker = InventoryEventBroker(
+            current_app.config['EVENTS_QUEUE_SIZE'],
+            current_app.config['EVENTS_MAX_SUBSCRIBERS'],
+        )
+        current_app.extensions['inventory_events'] = broker
+    return broker
+
+
+def notify_inventory_change(kind: str, ids: Optional[Iterable[int]], version: Optional[int]) -> None:
+    """Prepara l'evento nella transazione corrente: parte solo se il commit riesce.
+
+    Gli id vengono omessi oltre `MAX_EVENT_IDS` (limite di NOTIFY): il client
+    recupera comunque le modifiche da `/api/inventory/changes`.
+    """
+    ids = list(ids) if ids is not None else None
+    payload = {
+        'type': kind,
+        'ids': ids if ids is not None and len(ids) <= MAX_EVENT_IDS else None,
+        'version': version,
+    }
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': NOTIFY_CHANNEL, 'payload': json.dumps(payload, separators=(',', ':'))},
+        )
+        return
+    db.session.info.setdefault(_PENDING_KEY, []).append((get_event_broker(), payload))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_pending(session) -> None:
+    pending: List = session.info.pop(_PENDING_KEY, [])
+    for broker, payload in pending:
+        broker.publish(payload)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def format_event(payload: Dict[str, object]) -> str:
+    lines = [f"event: {payload['type']}"]
+    if payload.get('version') is not None:
+        lines.append(f"id: {payload['version']}")
+    lines.append('data: ' + json.dumps(payload, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def event_stream(
+    broker: InventoryEventBroker,
+    subscription: Subscription,
+    heartbeat_seconds: float,
+    max_seconds: float,
+) -> Iterator[str]:
+    """Genera il flusso SSE; chiude dopo `max_seconds` così il client si riautentica."""
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                payload = subscription.queue.get(timeout=min(heartbeat_seconds, remaining))
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(payload)
+    finally:
+        broker.unsubscribe(subscription)
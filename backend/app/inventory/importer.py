@@ -0,0 +1,367 @@
+"""Import massivo dell'inventario: staging via COPY e upsert set-based."""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from ..extensions import db
+from ..models import Inventory
+from ..utils import safe_int
+from .export import EXPORT_FIELDS
+from .events import EVENT_IMPORT, notify_inventory_change
+from .ledger import KIND_IMPORT
+from .versioning import current_inventory_version, next_inventory_version
+
+
+STAGING_TABLE = 'inventory_import_staging'
+STAGING_COLUMNS = ('line',) + tuple(field for field, _ in EXPORT_FIELDS)
+
+# Intestazioni accettate nel CSV: etichette dell'export o nomi dei campi.
+HEADER_ALIASES = {header: field for field, header in EXPORT_FIELDS}
+HEADER_ALIASES.update({field: field for field, _ in EXPORT_FIELDS})
+
+STRING_LIMITS = {
+    field: getattr(Inventory, field).type.length
+    for field, _ in EXPORT_FIELDS
+    if field != 'quantita'
+}
+
+StagingRow = Tuple[int, str, Optional[str], Optional[str], Optional[int], Optional[str], Optional[str]]
+
+
+class ImportReport:
+    """Raccoglie gli errori per riga fino a un massimo configurabile."""
+
+    def __init__(self, max_errors: int) -> None:
+        self.max_errors = max_errors
+        self.errors: List[Dict[str, object]] = []
+        self.error_count = 0
+        self.valid_rows = 0
+
+    def add_error(self, line: int, codice_articolo: Optional[str], message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'codice_articolo': codice_articolo, 'message': message})
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'valid_rows': self.valid_rows,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def iter_csv_records(stream: io.TextIOBase) -> Iterator[Tuple[int, Dict[str, object]]]:
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    fields = [HEADER_ALIASES.get(name.strip()) for name in header]
+    if 'codice_articolo' not in fields:
+        raise ValueError('Intestazione CSV non valida: manca Codice Articolo')
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        record = {field: value for field, value in zip(fields, values) if field}
+        yield reader.line_num, record
+
+
+def iter_ndjson_records(stream: io.TextIOBase) -> Iterator[Tuple[int, Dict[str, object]]]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, {'__error__': 'JSON non valido'}
+            continue
+        if not isinstance(record, dict):
+            yield line_number, {'__error__': 'Ogni riga deve essere un oggetto JSON'}
+            continue
+        yield line_number, record
+
+
+IMPORT_READERS = {
+    'csv': iter_csv_records,
+    'ndjson': iter_ndjson_records,
+}
+
+
+def _clean_text(value: object) -> Optional[str]:
+    if value is None:
+        return None
+    text_value = str(value).strip()
+    return text_value or None
+
+
+def validate_records(
+    records: Iterable[Tuple[int, Dict[str, object]]],
+    report: ImportReport,
+) -> Iterator[StagingRow]:
+    """Valida ogni record e produce solo le righe da caricare in staging."""
+    seen_codes: Dict[str, int] = {}
+    for line, record in records:
+        codice = _clean_text(record.get('codice_articolo'))
+        if '__error__' in record:
+            report.add_error(line, codice, str(record['__error__']))
+            continue
+        if not codice:
+            report.add_error(line, None, 'Codice articolo mancante')
+            continue
+        if codice in seen_codes:
+            report.add_error(line, codice, f'Codice duplicato nel file (già presente alla riga {seen_codes[codice]})')
+            continue
+
+        values: Dict[str, object] = {'codice_articolo': codice}
+        try:
+            raw_quantita = record.get('quantita')
+            values['quantita'] = None if _clean_text(raw_quantita) is None else safe_int(raw_quantita)
+        except ValueError as exc:
+            report.add_error(line, codice, str(exc))
+            continue
+        if values['quantita'] is not None and values['quantita'] < 0:
+            report.add_error(line, codice, 'La quantità deve essere maggiore o uguale a zero')
+            continue
+
+        too_long = None
+        for field, limit in STRING_LIMITS.items():
+            value = codice if field == 'codice_articolo' else _clean_text(record.get(field))
+            if value is not None and limit and len(value) > limit:
+                too_long = field
+                break
+            values[field] = value
+        if too_long:
+            report.add_error(line, codice, f'Valore troppo lungo per {too_long}')
+            continue
+
+        seen_codes[codice] = line
+        report.valid_rows += 1
+        yield (
+            line,
+            codice,
+            values['descrizione'],
+            values['unita_misura'],
+            values['quantita'],
+            values['locazione'],
+            values['data_ingresso'],
+        )
+
+
+class _CopyStream:
+    """File-like in sola lettura che genera il CSV per COPY al bisogno."""
+
+    def __init__(self, rows: Iterable[StagingRow]) -> None:
+        self._rows = iter(rows)
+        self._buffer = ''
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(['' if value is None else value for value in row])
+            self._buffer += self._text.getvalue()
+            self._text.seek(0)
+            self._text.truncate(0)
+        if size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+_STAGING_DDL = (
+    f'CREATE TEMP TABLE {STAGING_TABLE} ('
+    'line integer, codice_articolo varchar(50), descrizione varchar(200), '
+    'unita_misura varchar(20), quantita integer, locazione varchar(100), '
+    'data_ingresso varchar(50), existing integer)'
+)
+
+
+def _create_staging_table(connection) -> None:
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(_STAGING_DDL + ' ON COMMIT DROP'))
+        return
+    connection.execute(text(f'DROP TABLE IF EXISTS temp.{STAGING_TABLE}'))
+    connection.execute(text(_STAGING_DDL))
+
+
+def _load_staging(connection, rows: Iterable[StagingRow], batch_size: int) -> None:
+    if connection.dialect.name == 'postgresql':
+        # COPY sulla stessa connessione della sessione, quindi nella stessa transazione.
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                _CopyStream(rows),
+            )
+        finally:
+            cursor.close()
+        return
+
+    statement = text(
+        f"INSERT INTO {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) "
+        f"VALUES ({', '.join(':' + column for column in STAGING_COLUMNS)})"
+    )
+    batch: List[Dict[str, object]] = []
+    for row in rows:
+        batch.append(dict(zip(STAGING_COLUMNS, row)))
+        if len(batch) >= batch_size:
+            connection.execute(statement, batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+
+
+# Le colonne vuote nel file non sovrascrivono i valori esistenti. Una quantità
+# presente diventa la nuova giacenza: carico viene rettificato così che
+# quantita resti carico - scarico.
+_UPDATE_ASSIGNMENTS = (
+    'descrizione = COALESCE(s.descrizione, inventory.descrizione), '
+    'unita_misura = COALESCE(s.unita_misura, inventory.unita_misura), '
+    'locazione = COALESCE(s.locazione, inventory.locazione), '
+    'data_ingresso = COALESCE(s.data_ingresso, inventory.data_ingresso), '
+    'carico = CASE WHEN s.quantita IS NULL THEN inventory.carico '
+    'ELSE COALESCE(inventory.scarico, 0) + s.quantita END, '
+    'quantita = COALESCE(s.quantita, inventory.quantita), '
+    'modified_by = :username'
+)
+
+_INSERT_COLUMNS = (
+    'codice_articolo, descrizione, unita_misura, quantita, locazione, '
+    'data_ingresso, carico, scarico, created_by, version'
+)
+# La versione definitiva arriva con l'ultimo UPDATE, dopo il contatore.
+_INSERT_VALUES = (
+    's.codice_articolo, s.descrizione, s.unita_misura, COALESCE(s.quantita, 0), '
+    's.locazione, s.data_ingresso, COALESCE(s.quantita, 0), 0, :username, 0'
+)
+
+
+_LEDGER_INSERT = (
+    'INSERT INTO stock_movement '
+    '(inventory_id, codice_articolo, kind, carico, scarico, created_at, created_by) '
+)
+
+
+def _upsert_from_staging(connection, username: str) -> Tuple[int, int]:
+    params = {
+        'username': username,
+        'kind': KIND_IMPORT,
+        'now': datetime.utcnow(),
+    }
+    connection.execute(text(
+        f'UPDATE {STAGING_TABLE} SET existing = 1 '
+        f'WHERE EXISTS (SELECT 1 FROM inventory i WHERE i.codice_articolo = {STAGING_TABLE}.codice_articolo)'
+    ))
+    updated, total = connection.execute(text(
+        f'SELECT COUNT(existing), COUNT(*) FROM {STAGING_TABLE}'
+    )).one()
+
+    # Rettifiche di giacenza sugli articoli esistenti, calcolate prima dell'upsert.
+    connection.execute(text(
+        _LEDGER_INSERT +
+        'SELECT i.id, i.codice_articolo, :kind, '
+        '(COALESCE(i.scarico, 0) + s.quantita) - COALESCE(i.carico, 0), 0, :now, :username '
+        f'FROM inventory i JOIN {STAGING_TABLE} s ON i.codice_articolo = s.codice_articolo '
+        'WHERE s.quantita IS NOT NULL AND COALESCE(i.scarico, 0) + s.quantita <> COALESCE(i.carico, 0)'
+    ), params)
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            f'WITH updated AS ('
+            f'UPDATE inventory SET {_UPDATE_ASSIGNMENTS} FROM {STAGING_TABLE} s '
+            f'WHERE inventory.codice_articolo = s.codice_articolo '
+            f'RETURNING inventory.codice_articolo) '
+            f'INSERT INTO inventory ({_INSERT_COLUMNS}) '
+            f'SELECT {_INSERT_VALUES} FROM {STAGING_TABLE} s '
+            f'WHERE s.codice_articolo NOT IN (SELECT codice_articolo FROM updated) '
+            f'ORDER BY s.line'
+        ), params)
+    else:
+        connection.execute(text(
+            f'UPDATE inventory SET {_UPDATE_ASSIGNMENTS} FROM {STAGING_TABLE} s '
+            f'WHERE inventory.codice_articolo = s.codice_articolo'
+        ), params)
+        connection.execute(text(
+            f'INSERT INTO inventory ({_INSERT_COLUMNS}) '
+            f'SELECT {_INSERT_VALUES} FROM {STAGING_TABLE} s '
+            f'WHERE s.existing IS NULL '
+            f'ORDER BY s.line'
+        ), params)
+
+    connection.execute(text(
+        _LEDGER_INSERT +
+        'SELECT i.id, i.codice_articolo, :kind, COALESCE(s.quantita, 0), 0, :now, :username '
+        f'FROM inventory i JOIN {STAGING_TABLE} s ON i.codice_articolo = s.codice_articolo '
+        'WHERE s.existing IS NULL'
+    ), params)
+
+    # Gli articoli sono già scritti e bloccati: il contatore di versione viene
+    # per ultimo, come negli altri writer (ordine dei lock articoli -> contatore).
+    if total:
+        connection.execute(text(
+            'UPDATE inventory SET version = :version '
+            f'WHERE codice_articolo IN (SELECT codice_articolo FROM {STAGING_TABLE})'
+        ), {'version': next_inventory_version()})
+
+    if connection.dialect.name != 'postgresql':
+        connection.execute(text(f'DROP TABLE IF EXISTS temp.{STAGING_TABLE}'))
+    return total - updated, updated
+
+
+def import_inventory(
+    stream: io.TextIOBase,
+    import_format: str,
+    username: str,
+    batch_size: int,
+    max_errors: int,
+) -> Dict[str, object]:
+    """Valida, carica in staging e applica l'upsert in un'unica transazione."""
+    reader = IMPORT_READERS[import_format]
+    report = ImportReport(max_errors)
+    connection = db.session.connection()
+    try:
+        if connection.dialect.name == 'postgresql':
+            # Serializza gli import concorrenti ed evita doppi inserimenti dello stesso codice.
+            connection.execute(text('LOCK TABLE inventory IN SHARE ROW EXCLUSIVE MODE'))
+        _create_staging_table(connection)
+        _load_staging(connection, validate_records(reader(stream), report), batch_size)
+        inserted, updated = _upsert_from_staging(connection, username)
+        if inserted or updated:
+            notify_inventory_change(EVENT_IMPORT, None, current_inventory_version())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    result = {'inserted': inserted, 'updated': updated}
+    result.update(report.as_dict())
+    return result
+
+
+def detect_import_format(explicit: Optional[str], content_type: str, filename: Optional[str]) -> str:
+    if explicit:
+        return explicit.lower()
+    if filename and '.' in filename:
+        extension = filename.rsplit('.', 1)[1].lower()
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+        if extension == 'csv':
+            return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+
+def supported_import_formats() -> Sequence[str]:
+    return tuple(IMPORT_READERS)
@@ -0,0 +1,115 @@
+"""Export e import dell'inventario come job in background (vedi `app.jobs`)."""
+
+from __future__ import annotations
+
+import io
+from typing import Callable, Dict, Iterable, Iterator, Sequence
+
+from flask import current_app, request
+
+from ..extensions import db
+from ..jobs.runner import INPUT_SUFFIX, JobContext, job_file, register_job_kind
+from ..models import Inventory
+from .export import EXPORT_COLUMNS, EXPORT_FORMATS
+from .importer import detect_import_format, import_inventory, supported_import_formats
+from .locations import get_location_cache
+from .queries import FILTER_PARAMS, apply_filters
+
+
+def prepare_export(job_id: str) -> Dict[str, object]:
+    payload = request.get_json(silent=True) or {}
+    params = payload.get('params') or {}
+    export_format = str(params.get('format') or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Formato export non supportato: {export_format}')
+    filters = {name: str(params[name]) for name in FILTER_PARAMS if params.get(name) is not None}
+    return {'format': export_format, 'filters': filters}
+
+
+def _counting(rows: Iterable[Sequence[object]], report: Callable[[int], None]) -> Iterator[Sequence[object]]:
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        report(done)
+
+
+def run_export(context: JobContext) -> Dict[str, object]:
+    export_format = context.params['format']
+    serializer, mimetype, extension = EXPORT_FORMATS[export_format]
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+
+    query = apply_filters(db.session.query(*EXPORT_COLUMNS), context.params.get('filters') or {})
+    total = query.count()
+    context.progress(0, total, force=True)
+    exported = 0
+
+    def report(done: int) -> None:
+        nonlocal exported
+        exported = done
+        context.progress(done, total)
+
+    rows = _counting(query.order_by(Inventory.id).yield_per(chunk_size), report)
+    with open(context.result_path, 'wb') as output:
+        for chunk in serializer(rows, chunk_size):
+            output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    context.progress(exported, total, force=True)
+    context.set_result_file(f'inventario.{extension}', mimetype)
+    return {'rows': exported, 'format': export_format}
+
+
+def prepare_import(job_id: str) -> Dict[str, object]:
+    uploaded_file = request.files.get('file')
+    if not uploaded_file:
+        raise ValueError('File mancante')
+    import_format = detect_import_format(request.form.get('format'), '', uploaded_file.filename)
+    if import_format not in supported_import_formats():
+        raise ValueError(f'Formato import non supportato: {import_format}')
+    uploaded_file.save(str(job_file(job_id, INPUT_SUFFIX)))
+    return {'format': import_format, 'filename': uploaded_file.filename}
+
+
+class _ProgressReader(io.RawIOBase):
+    """Segnala i byte letti dal file di input, per l'avanzamento dell'import."""
+
+    def __init__(self, raw: io.BufferedIOBase, report: Callable[[int], None]) -> None:
+        self._raw = raw
+        self._report = report
+        self._read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self._raw.readinto(buffer)
+        self._read += count
+        self._report(self._read)
+        return count
+
+
+def run_import(context: JobContext) -> Dict[str, object]:
+    path = context.input_path
+    total = path.stat().st_size
+    context.progress(0, total, force=True)
+    # Su SQLite l'import tiene il database bloccato: l'avanzamento si vede solo alla fine.
+    track = db.engine.dialect.name != 'sqlite'
+
+    with open(path, 'rb') as raw:
+        binary = _ProgressReader(raw, lambda done: context.progress(done, total)) if track else raw
+        text_stream = io.TextIOWrapper(io.BufferedReader(binary) if track else binary, encoding='utf-8-sig', newline='')
+        result = import_inventory(
+            text_stream,
+            context.params['format'],
+            context.created_by,
+            batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+            max_errors=current_app.config['IMPORT_MAX_ERRORS'],
+        )
+    context.progress(total, total, force=True)
+    # Il job non passa dall'after_request del blueprint inventario.
+    get_location_cache().invalidate()
+    return result
+
+
+def register_jobs() -> None:
+    register_job_kind('export', prepare_export, run_export)
+    register_job_kind('import', prepare_import, run_import)
@@ -0,0 +1,256 @@
+"""Registro dei movimenti di magazzino e checkpoint per le giacenze storiche."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, text
+
+from ..extensions import db
+from ..models import Inventory, StockCheckpoint, StockMovement
+
+
+KIND_CREATION = 'creazione'
+KIND_UPDATE = 'modifica'
+KIND_MOVEMENT = 'movimento'
+KIND_IMPORT = 'import'
+KIND_DELETION = 'eliminazione'
+KIND_OPENING = 'saldo_iniziale'
+
+# Chiave fissa per pg_try_advisory_xact_lock: un solo processo alla volta crea checkpoint.
+CHECKPOINT_LOCK_ID = 0x73746F636B
+
+
+def record_movement(item: Inventory, carico: int, scarico: int, kind: str, username: Optional[str]) -> None:
+    """Aggiunge un movimento alla sessione corrente (l'articolo deve avere un id)."""
+    db.session.add(StockMovement(
+        inventory_id=item.id,
+        codice_articolo=item.codice_articolo,
+        kind=kind,
+        carico=carico,
+        scarico=scarico,
+        created_by=username,
+    ))
+
+
+def record_movements(rows: Iterable[Dict[str, object]], kind: str, username: Optional[str]) -> None:
+    """Inserimento massivo di movimenti: ogni riga ha inventory_id, codice_articolo, carico, scarico."""
+    now = datetime.utcnow()
+    payload = [
+        dict(row, kind=kind, created_by=username, created_at=now)
+        for row in rows
+    ]
+    if payload:
+        db.session.execute(insert(StockMovement), payload)
+
+
+def record_deletion(item: Inventory, username: Optional[str]) -> None:
+    """Azzera i totali dell'articolo nel registro prima dell'eliminazione."""
+    record_movement(item, -(item.carico or 0), -(item.scarico or 0), KIND_DELETION, username)
+
+
+def _nearest_checkpoint(item_id: int, at: datetime) -> Optional[StockCheckpoint]:
+    return (
+        StockCheckpoint.query
+        .filter(StockCheckpoint.inventory_id == item_id, StockCheckpoint.as_of <= at)
+        .order_by(StockCheckpoint.as_of.desc(), StockCheckpoint.movement_id.desc())
+        .first()
+    )
+
+
+def item_has_history(item_id: int) -> bool:
+    """Vero se l'articolo ha movimenti nel registro, anche se nel frattempo è stato eliminato."""
+    return db.session.query(StockMovement.id).filter(StockMovement.inventory_id == item_id).first() is not None
+
+
+def stock_as_of(item_id: int, at: datetime) -> Dict[str, object]:
+    """Giacenza dell'articolo all'istante `at`: checkpoint più vicino + movimenti successivi."""
+    checkpoint = _nearest_checkpoint(item_id, at)
+    base_carico = checkpoint.carico if checkpoint else 0
+    base_scarico = checkpoint.scarico if checkpoint else 0
+    after_id = checkpoint.movement_id if checkpoint else 0
+
+    carico, scarico = (
+        db.session.query(
+            func.coalesce(func.sum(StockMovement.carico), 0),
+            func.coalesce(func.sum(StockMovement.scarico), 0),
+        )
+        .filter(
+            StockMovement.inventory_id == item_id,
+            StockMovement.id > after_id,
+            StockMovement.created_at <= at,
+        )
+        .one()
+    )
+    total_carico = base_carico + int(carico)
+    total_scarico = base_scarico + int(scarico)
+    return {
+        'id': item_id,
+        'at': at.isoformat(),
+        'carico': total_carico,
+        'scarico': total_scarico,
+        'quantita': total_carico - total_scarico,
+        'checkpoint_movement_id': checkpoint.movement_id if checkpoint else None,
+    }
+
+
+def movement_to_dict(movement: StockMovement) -> Dict[str, object]:
+    return {
+        'id': movement.id,
+        'inventory_id': movement.inventory_id,
+        'codice_articolo': movement.codice_articolo,
+        'kind': movement.kind,
+        'carico': movement.carico,
+        'scarico': movement.scarico,
+        'created_at': movement.created_at.isoformat(),
+        'created_by': movement.created_by,
+    }
+
+
+def movement_history(
+    item_id: int,
+    limit: int,
+    before_id: Optional[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Tuple[List[StockMovement], bool]:
+    """Movimenti dal più recente, paginati per id decrescente."""
+    query = StockMovement.query.filter(StockMovement.inventory_id == item_id)
+    if before_id is not None:
+        query = query.filter(StockMovement.id < before_id)
+    if since is not None:
+        query = query.filter(StockMovement.created_at >= since)
+    if until is not None:
+        query = query.filter(StockMovement.created_at <= until)
+    rows = query.order_by(StockMovement.id.desc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def backfill_opening_balances() -> int:
+    """Registra un saldo iniziale per gli articoli senza alcun movimento (senza commit)."""
+    missing = (
+        db.session.query(Inventory.id, Inventory.codice_articolo, Inventory.carico, Inventory.scarico)
+        .filter(~db.session.query(StockMovement.id).filter(StockMovement.inventory_id == Inventory.id).exists())
+        .all()
+    )
+    record_movements(
+        (
+            {'inventory_id': item_id, 'codice_articolo': codice, 'carico': carico or 0, 'scarico': scarico or 0}
+            for item_id, codice, carico, scarico in missing
+        ),
+        KIND_OPENING,
+        None,
+    )
+    return len(missing)
+
+
+def create_checkpoints(min_movements: int, lag_seconds: int) -> int:
+    """Crea un checkpoint per gli articoli con almeno `min_movements` movimenti dall'ultimo.
+
+    Considera solo i movimenti più vecchi di `lag_seconds`: un id più basso di
+    una transazione ancora aperta non deve finire dietro a un checkpoint. Il
+    commit spetta al chiamante (vedi `checkpoint_stock`).
+    """
+    horizon = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    latest = (
+        db.session.query(
+            StockCheckpoint.inventory_id.label('inventory_id'),
+            func.max(StockCheckpoint.movement_id).label('movement_id'),
+        )
+        .group_by(StockCheckpoint.inventory_id)
+        .subquery()
+    )
+    pending = (
+        db.session.query(
+            StockMovement.inventory_id,
+            func.coalesce(latest.c.movement_id, 0),
+            func.sum(StockMovement.carico),
+            func.sum(StockMovement.scarico),
+            func.max(StockMovement.id),
+        )
+        .outerjoin(latest, latest.c.inventory_id == StockMovement.inventory_id)
+        .filter(
+            StockMovement.id > func.coalesce(latest.c.movement_id, 0),
+            StockMovement.created_at <= horizon,
+        )
+        .group_by(StockMovement.inventory_id, latest.c.movement_id)
+        .having(func.count(StockMovement.id) >= min_movements)
+        .all()
+    )
+    if not pending:
+        return 0
+
+    previous_ids = [previous_id for _, previous_id, _, _, _ in pending if previous_id]
+    previous: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    if previous_ids:
+        for inventory_id, movement_id, carico, scarico in (
+            db.session.query(
+                StockCheckpoint.inventory_id,
+                StockCheckpoint.movement_id,
+                StockCheckpoint.carico,
+                StockCheckpoint.scarico,
+            )
+            .filter(StockCheckpoint.movement_id.in_(previous_ids))
+        ):
+            previous[(inventory_id, movement_id)] = (carico, scarico)
+
+    last_ids = [last_id for _, _, _, _, last_id in pending]
+    as_of_by_id = dict(
+        db.session.query(StockMovement.id, StockMovement.created_at)
+        .filter(StockMovement.id.in_(last_ids))
+    )
+
+    checkpoints = []
+    for inventory_id, previous_id, carico, scarico, last_id in pending:
+        base_carico, base_scarico = previous.get((inventory_id, previous_id), (0, 0))
+        checkpoints.append({
+            'inventory_id': inventory_id,
+            'movement_id': last_id,
+            'as_of': as_of_by_id[last_id],
+            'carico': base_carico + int(carico),
+            'scarico': base_scarico + int(scarico),
+        })
+    db.session.execute(insert(StockCheckpoint), checkpoints)
+    return len(checkpoints)
+
+
+def checkpoint_stock(min_movements: int, lag_seconds: int) -> Optional[Tuple[int, int]]:
+    """Saldi iniziali mancanti e nuovi checkpoint in un'unica transazione.
+
+    Restituisce (saldi registrati, checkpoint creati). Su PostgreSQL, se un altro
+    processo sta già facendo lo stesso lavoro, restituisce None senza scrivere.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        acquired = db.session.execute(
+            text('SELECT pg_try_advisory_xact_lock(:id)'),
+            {'id': CHECKPOINT_LOCK_ID},
+        ).scalar()
+        if not acquired:
+            db.session.rollback()
+            return None
+    try:
+        opened = backfill_opening_balances()
+        created = create_checkpoints(min_movements, lag_seconds)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return opened, created
+
+
+def parse_timestamp(value: Optional[str], end_of_day: bool = False) -> Optional[datetime]:
+    """Accetta date ISO (`2024-05-01` o `2024-05-01T12:00:00`), in UTC."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError as exc:
+        raise ValueError('Data non valida, usa il formato ISO (AAAA-MM-GG)') from exc
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    if end_of_day and len(value.strip()) == 10:
+        # Come limite superiore una data senza orario include tutta la giornata.
+        parsed = parsed + timedelta(days=1) - timedelta(microseconds=1)
+    return parsed
+
@@ -0,0 +1,149 @@
+"""Albero delle locazioni con conteggi e quantità aggregati nel database."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from ..extensions import db
+from ..models import Inventory
+from .versioning import current_inventory_version
+
+
+PATH_SEPARATOR = '/'
+UNASSIGNED_LABEL = 'Senza locazione'
+
+
+def _split_path(location: Optional[str]) -> List[str]:
+    if not location:
+        return []
+    return [part.strip() for part in location.split(PATH_SEPARATOR) if part.strip()]
+
+
+def _new_node(name: str, path: str) -> Dict[str, object]:
+    return {
+        'name': name,
+        'path': path,
+        'article_count': 0,
+        'total_quantity': 0,
+        'direct_article_count': 0,
+        'direct_quantity': 0,
+        'children': {},
+    }
+
+
+def _freeze(nodes: Dict[str, Dict[str, object]]) -> List[Dict[str, object]]:
+    frozen = []
+    for name in sorted(nodes, key=str.casefold):
+        node = dict(nodes[name])
+        node['children'] = _freeze(node['children'])
+        frozen.append(node)
+    return frozen
+
+
+def build_location_tree() -> Dict[str, object]:
+    """Raggruppa per locazione in SQL e somma i valori risalendo il percorso."""
+    rows = (
+        db.session.query(
+            Inventory.locazione,
+            func.count(Inventory.id),
+            func.coalesce(func.sum(Inventory.quantita), 0),
+        )
+        .group_by(Inventory.locazione)
+        .all()
+    )
+
+    roots: Dict[str, Dict[str, object]] = {}
+    unassigned = None
+    for location, article_count, total_quantity in rows:
+        article_count = int(article_count)
+        total_quantity = int(total_quantity)
+        parts = _split_path(location)
+        if not parts:
+            if unassigned is None:
+                unassigned = _new_node(UNASSIGNED_LABEL, '')
+            for key in ('article_count', 'direct_article_count'):
+                unassigned[key] += article_count
+            for key in ('total_quantity', 'direct_quantity'):
+                unassigned[key] += total_quantity
+            continue
+
+        level = roots
+        for depth, part in enumerate(parts):
+            path = PATH_SEPARATOR.join(parts[:depth + 1])
+            node = level.setdefault(part, _new_node(part, path))
+            node['article_count'] += article_count
+            node['total_quantity'] += total_quantity
+            if depth == len(parts) - 1:
+                node['direct_article_count'] += article_count
+                node['direct_quantity'] += total_quantity
+            level = node['children']
+
+    locations = _freeze(roots)
+    if unassigned is not None:
+        unassigned['children'] = []
+        locations.append(unassigned)
+    return {
+        'locations': locations,
+        'article_count': sum(node['article_count'] for node in locations),
+        'total_quantity': sum(node['total_quantity'] for node in locations),
+    }
+
+
+class LocationTreeCache:
+    """Cache a voce singola legata alla versione dell'inventario.
+
+    Una scrittura da qualunque worker cambia la versione e rende vecchio
+    l'albero in cache; il TTL resta come limite massimo. Le scritture servite
+    da questo processo svuotano anche subito la cache (generazione), così un
+    albero calcolato prima della scrittura non viene salvato dopo.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._value: Optional[Dict[str, object]] = None
+        self._version: Optional[int] = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, version: int) -> Tuple[Optional[Dict[str, object]], int]:
+        with self._lock:
+            if self._value is not None and self._version == version and self._expires_at > time.monotonic():
+                return self._value, self._generation
+            return None, self._generation
+
+    def set(self, value: Dict[str, object], version: int, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._value = value
+            self._version = version
+            self._expires_at = time.monotonic() + self.ttl_seconds
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+            self._generation += 1
+
+
+def get_location_cache() -> LocationTreeCache:
+    cache = current_app.extensions.get('location_cache')
+    if cache is None:
+        cache = LocationTreeCache(current_app.config.get('LOCATIONS_CACHE_TTL_SECONDS', 30))
+        current_app.extensions['location_cache'] = cache
+    return cache
+
+
+def cached_location_tree() -> Dict[str, object]:
+    cache = get_location_cache()
+    version = current_inventory_version()
+    tree, generation = cache.get(version)
+    if tree is None:
+        tree = build_location_tree()
+        cache.set(tree, version, generation)
+    return tree
@@ -0,0 +1,183 @@
+"""Movimenti di magazzino (carico/scarico) applicati con aritmetica lato SQL."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, bindparam, column, func, or_, update, values
+
+from ..extensions import db
+from ..models import Inventory
+from ..utils import safe_int
+from .events import EVENT_MOVEMENTS, notify_inventory_change
+from .ledger import KIND_MOVEMENT, record_movements
+from .versioning import next_inventory_version
+
+
+@dataclass
+class Movement:
+    line: int
+    item_id: Optional[int]
+    codice_articolo: Optional[str]
+    carico: int
+    scarico: int
+
+
+def stock_delta_assignments(carico_delta, scarico_delta) -> Dict[str, object]:
+    """Assegnazioni SET che sommano i delta ai totali correnti senza rileggerli."""
+    carico = func.coalesce(Inventory.carico, 0) + carico_delta
+    scarico = func.coalesce(Inventory.scarico, 0) + scarico_delta
+    return {'carico': carico, 'scarico': scarico, 'quantita': carico - scarico}
+
+
+def parse_movements(payload: object, max_batch: int) -> Tuple[List[Movement], List[Dict[str, object]]]:
+    entries = payload.get('movements') if isinstance(payload, dict) else payload
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('Nessun movimento da registrare')
+    if len(entries) > max_batch:
+        raise ValueError(f'Troppi movimenti in una richiesta (massimo {max_batch})')
+
+    movements: List[Movement] = []
+    errors: List[Dict[str, object]] = []
+    for line, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors.append({'index': line, 'message': 'Movimento non valido'})
+            continue
+        item_id = entry.get('id')
+        codice = entry.get('codice_articolo')
+        if (item_id in (None, '')) == (codice in (None, '')):
+            errors.append({'index': line, 'message': 'Indica id oppure codice_articolo'})
+            continue
+        try:
+            parsed_id = safe_int(item_id) if item_id not in (None, '') else None
+            carico = safe_int(entry.get('carico'))
+            scarico = safe_int(entry.get('scarico'))
+        except ValueError as exc:
+            errors.append({'index': line, 'message': str(exc)})
+            continue
+        if carico < 0 or scarico < 0:
+            errors.append({'index': line, 'message': 'Carico e scarico devono essere maggiori o uguali a zero'})
+            continue
+        if carico == 0 and scarico == 0:
+            errors.append({'index': line, 'message': 'Movimento senza carico né scarico'})
+            continue
+        movements.append(Movement(line, parsed_id, str(codice).strip() if codice else None, carico, scarico))
+    return movements, errors
+
+
+def _lock_targets(movements: Sequence[Movement]) -> List[Tuple[int, str]]:
+    """Risolve e blocca gli articoli coinvolti in ordine di id crescente."""
+    ids = {movement.item_id for movement in movements if movement.item_id is not None}
+    codes = {movement.codice_articolo for movement in movements if movement.codice_articolo}
+    conditions = []
+    if ids:
+        conditions.append(Inventory.id.in_(ids))
+    if codes:
+        conditions.append(Inventory.codice_articolo.in_(codes))
+    # L'ordine fisso dei lock evita deadlock tra batch concorrenti sugli stessi articoli.
+    return (
+        db.session.query(Inventory.id, Inventory.codice_articolo)
+        .filter(or_(*conditions))
+        .order_by(Inventory.id)
+        .with_for_update()
+        .all()
+    )
+
+
+def apply_movements(movements: Sequence[Movement], username: str):
+    """Applica il batch in un'unica transazione; tutto o niente.
+
+    Restituisce (articoli aggiornati, errori). Con errori non viene scritto nulla.
+    """
+    targets = _lock_targets(movements)
+    ids_found = {item_id for item_id, _ in targets}
+    ids_by_code: Dict[str, List[int]] = {}
+    code_by_id: Dict[int, str] = {}
+    for item_id, codice in targets:
+        ids_by_code.setdefault(codice, []).append(item_id)
+        code_by_id[item_id] = codice
+
+    errors: List[Dict[str, object]] = []
+    deltas: Dict[int, List[int]] = {}
+    ledger_rows: List[Dict[str, object]] = []
+    for movement in movements:
+        if movement.item_id is not None:
+            target_id = movement.item_id if movement.item_id in ids_found else None
+        else:
+            matches = ids_by_code.get(movement.codice_articolo, [])
+            if len(matches) > 1:
+                errors.append({'index': movement.line, 'message': 'Codice articolo ambiguo'})
+                continue
+            target_id = matches[0] if matches else None
+        if target_id is None:
+            errors.append({'index': movement.line, 'message': 'Articolo non trovato'})
+            continue
+        delta = deltas.setdefault(target_id, [0, 0])
+        delta[0] += movement.carico
+        delta[1] += movement.scarico
+        ledger_rows.append({
+            'inventory_id': target_id,
+            'codice_articolo': code_by_id[target_id],
+            'carico': movement.carico,
+            'scarico': movement.scarico,
+        })
+
+    if errors:
+        db.session.rollback()
+        return [], errors
+
+    ordered = sorted(deltas.items())
+    # I lock sugli articoli sono già presi: il contatore di versione viene per ultimo.
+    version = next_inventory_version()
+    if db.engine.dialect.name == 'postgresql':
+        delta_table = values(
+            column('id', Integer),
+            column('carico', Integer),
+            column('scarico', Integer),
+            name='delta',
+        ).data([(item_id, carico, scarico) for item_id, (carico, scarico) in ordered])
+        statement = (
+            update(Inventory)
+            .where(Inventory.id == delta_table.c.id)
+            .values(
+                modified_by=username,
+                version=version,
+                **stock_delta_assignments(delta_table.c.carico, delta_table.c.scarico),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(statement)
+    else:
+        statement = (
+            update(Inventory)
+            .where(Inventory.id == bindparam('target_id'))
+            .values(
+                modified_by=bindparam('username'),
+                version=version,
+                **stock_delta_assignments(bindparam('carico_delta'), bindparam('scarico_delta')),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(statement, [
+            {'target_id': item_id, 'carico_delta': carico, 'scarico_delta': scarico, 'username': username}
+            for item_id, (carico, scarico) in ordered
+        ])
+
+    record_movements(ledger_rows, KIND_MOVEMENT, username)
+    notify_inventory_change(EVENT_MOVEMENTS, [item_id for item_id, _ in ordered], version)
+
+    rows = (
+        db.session.query(
+            Inventory.id,
+            Inventory.codice_articolo,
+            Inventory.carico,
+            Inventory.scarico,
+            Inventory.quantita,
+        )
+        .filter(Inventory.id.in_([item_id for item_id, _ in ordered]))
+        .order_by(Inventory.id)
+        .all()
+    )
+    db.session.commit()
+    return [dict(row._mapping) for row in rows], []
@@ -0,0 +1,166 @@
+"""Filtri, ordinamento e paginazione keyset per l'elenco dell'inventario."""
+
+from __future__ import annotations
+
+import base64
+import json
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+
+from ..models import Inventory
+from ..utils import _build_attachment_payload
+
+
+SORTABLE_COLUMNS = {
+    'id': Inventory.id,
+    'codice_articolo': Inventory.codice_articolo,
+    'descrizione': Inventory.descrizione,
+    'quantita': Inventory.quantita,
+    'locazione': Inventory.locazione,
+    'data_ingresso': Inventory.data_ingresso,
+}
+
+# Campi esposti da inventory_to_dict(include_tracking=True), nello stesso ordine.
+LIST_FIELDS = (
+    'id',
+    'codice_articolo',
+    'descrizione',
+    'unita_misura',
+    'quantita',
+    'locazione',
+    'data_ingresso',
+    'attachment',
+    'created_by',
+    'modified_by',
+)
+
+# L'allegato deriva da foto + codice_articolo, non da una colonna dedicata.
+ATTACHMENT_COLUMNS = ('foto', 'codice_articolo')
+
+
+FILTER_PARAMS = ('codice_articolo', 'descrizione', 'locazione', 'locazione_exact')
+
+
+def apply_filters(query, args: Mapping[str, str]):
+    codice = args.get('codice_articolo')
+    descrizione = args.get('descrizione')
+    locazione = args.get('locazione')
+
+    if codice:
+        query = query.filter(Inventory.codice_articolo.ilike(f"%{codice}%"))
+    if descrizione:
+        query = query.filter(Inventory.descrizione.ilike(f"%{descrizione}%"))
+    if locazione:
+        query = query.filter(Inventory.locazione.ilike(f"%{locazione}%"))
+
+    # Corrispondenza esatta usata dalla vista ad albero; vuoto = senza locazione.
+    locazione_exact = args.get('locazione_exact')
+    if locazione_exact is not None:
+        if locazione_exact.strip():
+            query = query.filter(Inventory.locazione == locazione_exact.strip())
+        else:
+            query = query.filter(or_(Inventory.locazione.is_(None), Inventory.locazione == ''))
+    return query
+
+
+def parse_sort(value: Optional[str]) -> Tuple[str, bool]:
+    """Interpreta `sort=campo` o `sort=-campo` restituendo (campo, discendente)."""
+    text = (value or 'id').strip()
+    descending = text.startswith('-')
+    name = text.lstrip('-+')
+    if name not in SORTABLE_COLUMNS:
+        raise ValueError(f'Ordinamento non supportato: {name}')
+    return name, descending
+
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Campi non supportati: {', '.join(unknown)}")
+    return [field for field in LIST_FIELDS if field in fields]
+
+
+def parse_limit(value: Optional[str], max_limit: int) -> Optional[int]:
+    if value in (None, ''):
+        return None
+    try:
+        limit = int(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError('Parametro limit non valido') from exc
+    if limit <= 0:
+        raise ValueError('Parametro limit non valido')
+    return min(limit, max_limit)
+
+
+def encode_cursor(sort_name: str, descending: bool, sort_value: object, item_id: int) -> str:
+    payload = {'s': ('-' if descending else '') + sort_name, 'v': sort_value, 'id': item_id}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_name: str, descending: bool) -> Tuple[object, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        expected_sort = ('-' if descending else '') + sort_name
+        if payload['s'] != expected_sort or not isinstance(payload['id'], int):
+            raise ValueError
+        return payload['v'], payload['id']
+    except (ValueError, KeyError, TypeError) as exc:
+        raise ValueError('Cursore non valido') from exc
+
+
+def apply_keyset(query, sort_name: str, descending: bool, cursor: Optional[Tuple[object, int]]):
+    """Ordina per (colonna, id) con i NULL in coda e riprende dopo il cursore."""
+    column = SORTABLE_COLUMNS[sort_name]
+    if sort_name == 'id':
+        if cursor is not None:
+            _, last_id = cursor
+            query = query.filter(Inventory.id < last_id if descending else Inventory.id > last_id)
+        return query.order_by(Inventory.id.desc() if descending else Inventory.id.asc())
+
+    if cursor is not None:
+        last_value, last_id = cursor
+        id_after = Inventory.id < last_id if descending else Inventory.id > last_id
+        if last_value is None:
+            query = query.filter(and_(column.is_(None), id_after))
+        else:
+            value_after = column < last_value if descending else column > last_value
+            query = query.filter(or_(
+                value_after,
+                and_(column == last_value, id_after),
+                column.is_(None),
+            ))
+
+    if descending:
+        return query.order_by(column.desc().nullslast(), Inventory.id.desc())
+    return query.order_by(column.asc().nullslast(), Inventory.id.asc())
+
+
+def projection_columns(fields: Sequence[str], sort_name: str) -> List[str]:
+    """Colonne minime da caricare per i campi richiesti e per il cursore."""
+    columns: List[str] = ['id']
+    for field in fields:
+        names = ATTACHMENT_COLUMNS if field == 'attachment' else (field,)
+        for name in names:
+            if name not in columns:
+                columns.append(name)
+    if sort_name not in columns:
+        columns.append(sort_name)
+    return columns
+
+
+def row_to_projection(row, fields: Sequence[str], token_bucket: Optional[int] = None) -> Dict[str, object]:
+    data: Dict[str, object] = {}
+    for field in fields:
+        if field == 'attachment':
+            attachment_payload = _build_attachment_payload(row, token_bucket)
+            if attachment_payload:
+                data['attachment'] = attachment_payload
+        else:
+            data[field] = getattr(row, field)
+    return data
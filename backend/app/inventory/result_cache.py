@@ -0,0 +1,127 @@
+"""Cache per processo delle risposte di elenco e dettaglio articoli.
+
+Le voci sono i corpi JSON già codificati, indicizzati dai parametri
+normalizzati e dall'ETag (versione dell'inventario + finestra dei token
+file): una scrittura da qualunque worker cambia la versione e rende
+irraggiungibili le voci vecchie. Le scritture servite da questo processo
+svuotano anche subito la cache (generazione), così un risultato calcolato
+prima della scrittura non viene salvato dopo.
+
+Richieste concorrenti con la stessa chiave eseguono una sola query
+(singleflight): le altre aspettano il risultato della prima.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from flask import Flask, current_app
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.body: Optional[bytes] = None
+
+
+class InventoryResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, wait_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.wait_seconds = wait_seconds
+        self._entries: "OrderedDict[Tuple[int, Hashable], bytes]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, Hashable], _Flight] = {}
+        self._generation = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """Corpo in cache per `key`, altrimenti lo calcola una sola volta; None non viene salvato."""
+        if not self.enabled:
+            return compute()
+        with self._lock:
+            full_key = (self._generation, key)
+            body = self._entries.get(full_key)
+            if body is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return body
+            flight = self._inflight.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[full_key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Se la prima richiesta fallisce o non finisce in tempo si procede da soli.
+            if flight.done.wait(self.wait_seconds) and flight.body is not None:
+                return flight.body
+            return compute()
+
+        try:
+            body = compute()
+            flight.body = body
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            flight.done.set()
+        if body is not None:
+            self._store(full_key, body)
+        return body
+
+    def _store(self, full_key: Tuple[int, Hashable], body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if full_key[0] != self._generation or full_key in self._entries:
+                return
+            self._entries[full_key] = body
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                # Le richieste accodate a un calcolo in corso contano come hit.
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['inventory_result_cache'] = InventoryResultCache(
+        app.config['INVENTORY_CACHE_MAX_ENTRIES'],
+        app.config['INVENTORY_CACHE_MAX_BYTES'],
+        app.config['INVENTORY_CACHE_WAIT_SECONDS'],
+    )
+
+
+def get_result_cache() -> InventoryResultCache:
+    return current_app.extensions['inventory_result_cache']
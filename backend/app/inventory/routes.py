@@ -1,48 +1,304 @@
-import csv
-from io import StringIO
+import io
+from datetime import datetime
+from typing import Optional
 
 from flask import (
     Blueprint,
     Response,
+    current_app,
     g,
     jsonify,
     request,
+    stream_with_context,
 )
+from sqlalchemy.exc import IntegrityError
 
 from ..auth.decorators import token_required
+from ..database import note_write, read_replica, statement_timeout
 from ..extensions import db
+from ..files.storage import acquire_file, is_blob_key, release_file, save_uploaded_file
+from ..json_provider import json_response
 from ..models import Inventory
-from ..utils import extract_inventory_payload, inventory_to_dict, save_uploaded_file
+from ..utils import (
+    INVENTORY_LIST_COLUMNS,
+    current_file_token_bucket,
+    extract_inventory_payload,
+    inventory_rows_to_dicts,
+    inventory_to_dict,
+)
+from .checkpointer import get_stock_checkpointer
+from .events import (
+    EVENT_CREATED,
+    EVENT_DELETED,
+    EVENT_UPDATED,
+    SubscriberLimitReached,
+    event_stream,
+    get_event_broker,
+    notify_inventory_change,
+)
+from .export import EXPORT_COLUMNS, EXPORT_FORMATS
+from .importer import detect_import_format, import_inventory, supported_import_formats
+from .ledger import (
+    KIND_CREATION,
+    KIND_UPDATE,
+    checkpoint_stock,
+    item_has_history,
+    movement_history,
+    movement_to_dict,
+    parse_timestamp,
+    record_deletion,
+    record_movement,
+    stock_as_of,
+)
+from .locations import cached_location_tree, get_location_cache
+from .movements import apply_movements, parse_movements, stock_delta_assignments
+from .queries import (
+    apply_filters,
+    apply_keyset,
+    decode_cursor,
+    encode_cursor,
+    parse_fields,
+    parse_limit,
+    parse_sort,
+    projection_columns,
+    row_to_projection,
+)
+from .result_cache import get_result_cache
+from .search import search_inventory
+from .versioning import (
+    changes_since,
+    current_inventory_version,
+    inventory_etag,
+    item_version,
+    next_inventory_version,
+    record_tombstone,
+)
 
 bp = Blueprint('inventory', __name__)
 
+WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+
+def _foto_reference(value, current: Optional[str] = None) -> Optional[str]:
+    """Allegato indicato per nome nel payload: solo chiavi dell'archivio (o quello già presente)."""
+    if value is None or value == '':
+        return None
+    if value != current and not (isinstance(value, str) and is_blob_key(value)):
+        raise ValueError('Allegato non valido, caricalo di nuovo')
+    return value
+
+
+def _not_modified(etag: str):
+    """Risposta 304 se il client ha già la rappresentazione `etag`, altrimenti None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = current_app.response_class(status=304)
+    _set_validators(response, etag)
+    return response
+
+
+def _cached_json(body: bytes):
+    return current_app.response_class(body, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+def _set_validators(response, etag: str):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@bp.before_app_request
+def start_stock_checkpointer():
+    # Avvio pigro come per il reaper dei token: i comandi CLI non avviano il thread.
+    get_stock_checkpointer().start()
+
+
+@bp.after_request
+def invalidate_caches_after_write(response):
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        get_location_cache().invalidate()
+        get_result_cache().invalidate()
+        written_version = g.get('inventory_write_version')
+        if written_version is not None:
+            # Il client lo rimanda in X-Inventory-Min-Version: legge le proprie scritture.
+            response.headers['X-Inventory-Version'] = str(written_version)
+            note_write(g.current_user.username, written_version)
+    return response
+
 
 @bp.route('/inventory', methods=['GET'])
 @token_required
+@read_replica
 def list_inventory():
-    query = Inventory.query
-    codice = request.args.get('codice_articolo')
-    descrizione = request.args.get('descrizione')
-    locazione = request.args.get('locazione')
+    """Elenca gli articoli; con `limit` o `cursor` restituisce una pagina keyset."""
+    try:
+        sort_name, descending = parse_sort(request.args.get('sort'))
+        fields = parse_fields(request.args.get('fields'))
+        limit = parse_limit(request.args.get('limit'), current_app.config['INVENTORY_PAGE_MAX_LIMIT'])
+        raw_cursor = request.args.get('cursor')
+        cursor = decode_cursor(raw_cursor, sort_name, descending) if raw_cursor else None
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    version = current_inventory_version()
+    etag = inventory_etag(version)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    paginated = limit is not None or cursor is not None
+    if paginated and limit is None:
+        limit = current_app.config['INVENTORY_PAGE_DEFAULT_LIMIT']
 
-    if codice:
-        query = query.filter(Inventory.codice_articolo.ilike(f"%{codice}%"))
-    if descrizione:
-        query = query.filter(Inventory.descrizione.ilike(f"%{descrizione}%"))
-    if locazione:
-        query = query.filter(Inventory.locazione.ilike(f"%{locazione}%"))
+    def build_body() -> bytes:
+        # Tuple di colonne e non oggetti Inventory: niente identity map né stato ORM per riga.
+        if fields is None:
+            names = list(INVENTORY_LIST_COLUMNS)
+            if sort_name not in names:
+                names.append(sort_name)
+        else:
+            names = projection_columns(fields, sort_name)
+        query = db.session.query(*[getattr(Inventory, name) for name in names])
+        query = apply_filters(query, request.args)
+        if paginated or request.args.get('sort'):
+            query = apply_keyset(query, sort_name, descending, cursor)
 
-    items = query.all()
-    return jsonify([inventory_to_dict(item, include_tracking=True) for item in items]), 200
+        has_more = False
+        if paginated:
+            rows = query.limit(limit + 1).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        else:
+            rows = query.all()
+
+        if fields is None:
+            items = inventory_rows_to_dicts(rows, include_tracking=True)
+        else:
+            token_bucket = current_file_token_bucket()
+            items = [row_to_projection(row, fields, token_bucket) for row in rows]
+
+        if not paginated:
+            return json_response(items).get_data()
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(sort_name, descending, getattr(last, sort_name), last.id)
+        return json_response({'items': items, 'next_cursor': next_cursor}).get_data()
+
+    # Le schede aperte chiedono gli stessi elenchi: chiave = ETag + parametri normalizzati.
+    cache_key = ('list', etag, tuple(sorted(request.args.items(multi=True))))
+    response = _cached_json(get_result_cache().get_or_compute(cache_key, build_body))
+    response.headers['X-Inventory-Version'] = str(version)
+    return _set_validators(response, etag), 200
+
+
+@bp.route('/inventory/locations', methods=['GET'])
+@token_required
+def list_locations():
+    """Albero delle locazioni (`A/Scaffale3/Ripiano2`) con conteggi e quantità aggregati."""
+    return jsonify(cached_location_tree()), 200
+
+
+@bp.route('/inventory/search', methods=['GET'])
+@token_required
+def search_inventory_items():
+    """Ricerca per rilevanza su codice, descrizione e locazione."""
+    term = (request.args.get('q') or '').strip()
+    if not term:
+        return jsonify({'message': 'Parametro q mancante'}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'), current_app.config['INVENTORY_PAGE_MAX_LIMIT'])
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+    if limit is None:
+        limit = current_app.config['SEARCH_DEFAULT_LIMIT']
+
+    results = []
+    token_bucket = current_file_token_bucket()
+    for item, score in search_inventory(term, limit):
+        data = inventory_to_dict(item, include_tracking=True, token_bucket=token_bucket)
+        data['score'] = round(score, 4)
+        results.append(data)
+    return jsonify(results), 200
 
 
 @bp.route('/inventory/<int:item_id>', methods=['GET'])
 @token_required
+@read_replica
 def get_inventory_item(item_id: int):
-    item = Inventory.query.get(item_id)
-    if not item:
+    version = item_version(item_id)
+    if version is None:
+        return jsonify({'message': 'Articolo non trovato'}), 404
+    etag = inventory_etag(version, scope=f'item{item_id}')
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    def build_body() -> Optional[bytes]:
+        item = Inventory.query.get(item_id)
+        return json_response(inventory_to_dict(item)).get_data() if item else None
+
+    body = get_result_cache().get_or_compute(('item', item_id, etag), build_body)
+    if body is None:
         return jsonify({'message': 'Articolo non trovato'}), 404
-    return jsonify(inventory_to_dict(item)), 200
+    return _set_validators(_cached_json(body), etag), 200
+
+
+@bp.route('/inventory/stream', methods=['GET'])
+@token_required
+def stream_inventory_events():
+    """Canale Server-Sent Events con le modifiche all'inventario."""
+    broker = get_event_broker()
+    try:
+        subscription = broker.subscribe(db.engine)
+    except SubscriberLimitReached:
+        # Il client ripiega sul feed delle modifiche finché non si libera un posto.
+        response = jsonify({'message': 'Troppe connessioni aperte, riprova più tardi'})
+        response.headers['Retry-After'] = str(current_app.config['EVENTS_RETRY_AFTER_SECONDS'])
+        return response, 503
+
+    # Il generatore non usa il contesto della richiesta: la connessione al
+    # database torna nel pool prima che inizi lo streaming.
+    stream = event_stream(
+        broker,
+        subscription,
+        current_app.config['EVENTS_HEARTBEAT_SECONDS'],
+        current_app.config['EVENTS_MAX_STREAM_SECONDS'],
+    )
+    # Il `finally` di un generatore mai avviato non viene eseguito: il posto si
+    # libera anche alla chiusura della risposta, o nel teardown se la risposta
+    # non parte (p.es. un hook `after_request` fallisce).
+    g.event_subscription = (broker, subscription)
+    response = Response(stream, mimetype='text/event-stream')
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.teardown_request
+def release_failed_event_subscription(exc: Optional[BaseException]) -> None:
+    opened = g.pop('event_subscription', None)
+    if opened is not None and exc is not None:
+        broker, subscription = opened
+        broker.unsubscribe(subscription)
+
+
+@bp.route('/inventory/changes', methods=['GET'])
+@token_required
+def list_inventory_changes():
+    """Feed incrementale: articoli modificati ed eliminati dopo la versione `since`."""
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'message': 'Parametro since non valido'}), 400
+    if since < 0:
+        return jsonify({'message': 'Parametro since non valido'}), 400
+
+    changes = changes_since(since, current_app.config['CHANGES_MAX_ITEMS'])
+    response = jsonify(changes)
+    response.headers['X-Inventory-Version'] = str(changes['version'])
+    return response, 200
 
 
 @bp.route('/inventory', methods=['POST'])
@@ -61,12 +317,14 @@ def add_inventory():
     if payload['carico'] < 0 or payload['scarico'] < 0:
         return jsonify({'message': 'Carico e scarico devono essere maggiori o uguali a zero'}), 400
 
-    foto_filename = payload.get('foto')
     try:
+        foto_filename = _foto_reference(payload.get('foto'))
         saved_filename = save_uploaded_file(uploaded_file)
         if saved_filename:
             foto_filename = saved_filename
+        acquire_file(foto_filename)
     except ValueError as exc:
+        db.session.rollback()
         return jsonify({'message': str(exc)}), 400
 
     quantita = payload['carico'] - payload['scarico']
@@ -84,6 +342,15 @@ def add_inventory():
         created_by=g.current_user.username,
     )
     db.session.add(new_item)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Inserimento concorrente dello stesso codice: lo blocca l'indice univoco.
+        db.session.rollback()
+        return jsonify({'message': 'Prodotto già esistente'}), 400
+    record_movement(new_item, payload['carico'], payload['scarico'], KIND_CREATION, g.current_user.username)
+    new_item.version = next_inventory_version()
+    notify_inventory_change(EVENT_CREATED, [new_item.id], new_item.version)
     db.session.commit()
     return jsonify({'message': 'Articolo aggiunto con successo'}), 201
 
@@ -114,56 +381,183 @@ def update_inventory(item_id: int):
     if payload.get('data_ingresso'):
         item.data_ingresso = payload['data_ingresso']
 
-    item.carico += payload['carico']
-    item.scarico += payload['scarico']
-    item.quantita = item.carico - item.scarico
+    # Aritmetica lato SQL: movimenti concorrenti sullo stesso articolo non si sovrascrivono.
+    for attribute, expression in stock_delta_assignments(payload['carico'], payload['scarico']).items():
+        setattr(item, attribute, expression)
+    if payload['carico'] or payload['scarico']:
+        record_movement(item, payload['carico'], payload['scarico'], KIND_UPDATE, g.current_user.username)
 
     try:
+        new_foto = _foto_reference(payload.get('foto'), item.foto) if not uploaded_file else None
         saved_filename = save_uploaded_file(uploaded_file)
         if saved_filename:
-            item.foto = saved_filename
+            new_foto = saved_filename
+        if new_foto and new_foto != item.foto:
+            acquire_file(new_foto)
+            release_file(item.foto)
+            item.foto = new_foto
     except ValueError as exc:
+        db.session.rollback()
         return jsonify({'message': str(exc)}), 400
 
-    if payload.get('foto') and not uploaded_file:
-        item.foto = payload['foto']
-
     item.modified_by = g.current_user.username
 
+    # Prima la riga dell'articolo, poi il contatore di versione (ordine dei lock fisso).
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Codice articolo già usato da un altro articolo'}), 400
+    item.version = next_inventory_version()
+    notify_inventory_change(EVENT_UPDATED, [item.id], item.version)
     db.session.commit()
     return jsonify({'message': 'Articolo aggiornato con successo'}), 200
 
 
+@bp.route('/inventory/movements', methods=['POST'])
+@token_required
+def register_movements():
+    """Registra un batch di carichi/scarichi in un'unica transazione."""
+    try:
+        movements, errors = parse_movements(
+            request.get_json(silent=True),
+            current_app.config['MOVEMENTS_MAX_BATCH'],
+        )
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+    if errors:
+        return jsonify({'message': 'Movimenti non validi', 'errors': errors}), 400
+
+    items, errors = apply_movements(movements, g.current_user.username)
+    if errors:
+        return jsonify({'message': 'Movimenti non applicati', 'errors': errors}), 400
+    return jsonify({'message': 'Movimenti registrati', 'items': items}), 200
+
+
+def _item_known(item_id: int) -> bool:
+    # Gli articoli eliminati restano consultabili finché hanno movimenti nel registro.
+    return item_version(item_id) is not None or item_has_history(item_id)
+
+
+@bp.route('/inventory/<int:item_id>/stock', methods=['GET'])
+@token_required
+def get_stock_as_of(item_id: int):
+    """Giacenza di un articolo a una certa data (`at`, default adesso)."""
+    try:
+        at = parse_timestamp(request.args.get('at'), end_of_day=True) or datetime.utcnow()
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+    if not _item_known(item_id):
+        return jsonify({'message': 'Articolo non trovato'}), 404
+    return jsonify(stock_as_of(item_id, at)), 200
+
+
+@bp.route('/inventory/<int:item_id>/movements', methods=['GET'])
+@token_required
+def list_item_movements(item_id: int):
+    """Storico movimenti di un articolo, dal più recente, con paginazione a cursore."""
+    try:
+        limit = parse_limit(request.args.get('limit'), current_app.config['INVENTORY_PAGE_MAX_LIMIT'])
+        raw_cursor = request.args.get('cursor')
+        before_id = decode_cursor(raw_cursor, 'movement', True)[1] if raw_cursor else None
+        since = parse_timestamp(request.args.get('since'))
+        until = parse_timestamp(request.args.get('until'), end_of_day=True)
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+    if not _item_known(item_id):
+        return jsonify({'message': 'Articolo non trovato'}), 404
+
+    movements, has_more = movement_history(
+        item_id,
+        limit or current_app.config['INVENTORY_PAGE_DEFAULT_LIMIT'],
+        before_id,
+        since,
+        until,
+    )
+    next_cursor = encode_cursor('movement', True, None, movements[-1].id) if has_more else None
+    return jsonify({'items': [movement_to_dict(movement) for movement in movements], 'next_cursor': next_cursor}), 200
+
+
 @bp.route('/inventory/<int:item_id>', methods=['DELETE'])
 @token_required
 def delete_inventory(item_id: int):
     item = Inventory.query.get(item_id)
     if not item:
         return jsonify({'message': 'Articolo non trovato'}), 404
+    record_deletion(item, g.current_user.username)
+    release_file(item.foto)
     db.session.delete(item)
+    db.session.flush()
+    version = next_inventory_version()
+    record_tombstone(item, version)
+    notify_inventory_change(EVENT_DELETED, [item_id], version)
     db.session.commit()
     return jsonify({'message': 'Articolo eliminato con successo'}), 200
 
 
 @bp.route('/inventory/export', methods=['GET'])
+@statement_timeout('DB_EXPORT_STATEMENT_TIMEOUT_MS')
 @token_required
+@read_replica
 def export_inventory():
-    items = Inventory.query.all()
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['Codice Articolo', 'Descrizione', 'Unità Misura', 'Quantità', 'Locazione', 'Data Ingresso'])
-    for item in items:
-        writer.writerow([
-            item.codice_articolo,
-            item.descrizione,
-            item.unita_misura,
-            item.quantita,
-            item.locazione,
-            item.data_ingresso,
-        ])
-    output = si.getvalue()
-    si.close()
-
-    response = Response(output, mimetype='text/csv')
-    response.headers['Content-Disposition'] = 'attachment; filename=inventario.csv'
+    """Esporta l'inventario in streaming, con gli stessi filtri dell'elenco."""
+    export_format = (request.args.get('format') or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'message': f'Formato export non supportato: {export_format}'}), 400
+    serializer, mimetype, extension = EXPORT_FORMATS[export_format]
+
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    query = apply_filters(db.session.query(*EXPORT_COLUMNS), request.args)
+    rows = query.order_by(Inventory.id).yield_per(chunk_size)
+
+    response = Response(stream_with_context(serializer(rows, chunk_size)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=inventario.{extension}'
     return response
+
+
+@bp.cli.command('stock-checkpoint')
+def stock_checkpoint_command():
+    """Registra i saldi iniziali mancanti e crea i checkpoint delle giacenze."""
+    result = checkpoint_stock(
+        current_app.config['STOCK_CHECKPOINT_MIN_MOVEMENTS'],
+        current_app.config['STOCK_CHECKPOINT_LAG_SECONDS'],
+    )
+    if result is None:
+        print('Checkpoint già in corso in un altro processo')
+        return
+    opened, created = result
+    print(f'Saldi iniziali registrati: {opened}, checkpoint creati: {created}')
+
+
+@bp.route('/inventory/import', methods=['POST'])
+@token_required
+def import_inventory_items():
+    """Importa articoli da CSV/NDJSON nel formato dell'export (upsert per codice)."""
+    is_form_data = (request.content_type or '').startswith('multipart/form-data')
+    uploaded_file = request.files.get('file') if is_form_data else None
+    if is_form_data and not uploaded_file:
+        return jsonify({'message': 'File mancante'}), 400
+
+    import_format = detect_import_format(
+        request.args.get('format'),
+        request.content_type or '',
+        uploaded_file.filename if uploaded_file else None,
+    )
+    if import_format not in supported_import_formats():
+        return jsonify({'message': f'Formato import non supportato: {import_format}'}), 400
+
+    binary_stream = uploaded_file.stream if uploaded_file else request.stream
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    try:
+        result = import_inventory(
+            text_stream,
+            import_format,
+            g.current_user.username,
+            batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+            max_errors=current_app.config['IMPORT_MAX_ERRORS'],
+        )
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
+    result['message'] = 'Import completato'
+    return jsonify(result), 200
@@ -0,0 +1,86 @@
+"""Ricerca testuale sull'inventario con indici trigram su PostgreSQL."""
+
+from __future__ import annotations
+
+from typing import List, Tuple
+
+from sqlalchemy import case, func, literal, or_, text
+from sqlalchemy.engine import Engine
+
+from ..extensions import db
+from ..models import Inventory
+
+
+SEARCH_COLUMNS = ('codice_articolo', 'descrizione', 'locazione')
+
+# Gli indici GIN trigram accelerano sia gli ILIKE '%...%' di list_inventory
+# sia l'operatore di similarità usato dalla ricerca.
+TRIGRAM_INDEXES = tuple(
+    (f'ix_inventory_{column}_trgm', column) for column in SEARCH_COLUMNS
+)
+
+
+def ensure_search_indexes(engine: Engine) -> None:
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as connection:
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        for index_name, column in TRIGRAM_INDEXES:
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS {index_name} '
+                f'ON inventory USING gin ({column} gin_trgm_ops)'
+            ))
+
+
+def drop_search_indexes(engine: Engine) -> None:
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as connection:
+        for index_name, _ in TRIGRAM_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _field_score(column, term: str, pattern: str, weight: int):
+    """Punteggio per campo: uguaglianza > prefisso > sottostringa."""
+    return case(
+        (func.lower(column) == term.lower(), 5 * weight),
+        (column.ilike(f'{_escape_like(term)}%', escape='\\'), 2 * weight),
+        (column.ilike(pattern, escape='\\'), weight),
+        else_=0,
+    )
+
+
+def search_inventory(term: str, limit: int) -> List[Tuple[Inventory, float]]:
+    """Cerca `term` nei tre campi testuali e ordina per rilevanza."""
+    pattern = f'%{_escape_like(term)}%'
+    weights = {'codice_articolo': 10, 'descrizione': 4, 'locazione': 2}
+    columns = {name: getattr(Inventory, name) for name in SEARCH_COLUMNS}
+
+    score = sum(
+        (_field_score(columns[name], term, pattern, weights[name]) for name in SEARCH_COLUMNS),
+        literal(0),
+    )
+    matches = [columns[name].ilike(pattern, escape='\\') for name in SEARCH_COLUMNS]
+
+    if db.engine.dialect.name == 'postgresql':
+        # Su PostgreSQL la similarità trigram affina il ranking e tollera refusi.
+        score = score + sum(
+            (func.coalesce(func.word_similarity(term, columns[name]), 0) * weights[name]
+             for name in SEARCH_COLUMNS),
+            literal(0),
+        )
+        matches.extend(columns[name].op('%>')(term) for name in SEARCH_COLUMNS)
+
+    ranked_score = score.label('score')
+    rows = (
+        db.session.query(Inventory, ranked_score)
+        .filter(or_(*matches))
+        .order_by(ranked_score.desc(), Inventory.id.asc())
+        .limit(limit)
+        .all()
+    )
+    return [(item, float(item_score)) for item, item_score in rows]
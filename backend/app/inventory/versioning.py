@@ -0,0 +1,103 @@
+"""Versione monotona dell'inventario, ETag e feed delle modifiche (`?since=`)."""
+
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+from flask import g, has_request_context
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import Inventory, InventoryTombstone, InventoryVersion
+from ..utils import current_file_token_window, inventory_list_to_dicts
+
+
+VERSION_ROW_ID = 1
+
+
+def ensure_version_counter() -> None:
+    """Crea la riga del contatore; la colonna `inventory.version` arriva dalle migrazioni."""
+    if db.session.get(InventoryVersion, VERSION_ROW_ID) is None:
+        db.session.add(InventoryVersion(id=VERSION_ROW_ID, value=0))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Un altro worker l'ha appena creato.
+            db.session.rollback()
+
+
+def current_inventory_version() -> int:
+    value = db.session.query(InventoryVersion.value).filter_by(id=VERSION_ROW_ID).scalar()
+    return int(value or 0)
+
+
+def next_inventory_version() -> int:
+    """Incrementa il contatore nella transazione corrente.
+
+    Il lock sulla riga resta fino al commit, quindi le versioni diventano
+    visibili nello stesso ordine in cui vengono assegnate e un client che
+    chiede `since=N` non può saltare modifiche. Va chiamata per ultima, dopo
+    aver già scritto/bloccato gli articoli, così l'ordine dei lock è sempre
+    articoli -> contatore.
+    """
+    db.session.execute(
+        text('UPDATE inventory_version SET value = value + 1 WHERE id = :id'),
+        {'id': VERSION_ROW_ID},
+    )
+    version = current_inventory_version()
+    if has_request_context():
+        g.inventory_write_version = version
+    return version
+
+
+def record_tombstone(item: Inventory, version: int) -> None:
+    db.session.add(InventoryTombstone(
+        inventory_id=item.id,
+        codice_articolo=item.codice_articolo,
+        version=version,
+    ))
+
+
+def inventory_etag(version: int, scope: str = 'inv') -> str:
+    # I token degli allegati scadono: la finestra fa parte del contenuto, così né il
+    # 304 né la cache delle risposte restituiscono link già scaduti.
+    return f'{scope}-{version}-{current_file_token_window()}'
+
+
+def item_version(item_id: int) -> Optional[int]:
+    value = db.session.query(Inventory.version).filter_by(id=item_id).scalar()
+    return None if value is None else int(value)
+
+
+def changes_since(since: int, max_items: int) -> Dict[str, object]:
+    """Articoli modificati e id eliminati dopo la versione `since`.
+
+    Se le modifiche superano `max_items` il client deve riscaricare l'elenco.
+    """
+    version = current_inventory_version()
+    items = (
+        Inventory.query
+        .filter(Inventory.version > since)
+        .order_by(Inventory.version, Inventory.id)
+        .limit(max_items + 1)
+        .all()
+    )
+    if len(items) > max_items:
+        return {'version': version, 'full_resync': True, 'items': [], 'deleted': []}
+
+    # SQLite può riassegnare l'id di un articolo eliminato: vale la riga viva.
+    live_ids = {item.id for item in items}
+    deleted = [
+        inventory_id
+        for (inventory_id,) in db.session.query(InventoryTombstone.inventory_id)
+        .filter(InventoryTombstone.version > since)
+        .order_by(InventoryTombstone.version)
+        if inventory_id not in live_ids
+    ]
+    return {
+        'version': max([version] + [int(item.version) for item in items]),
+        'full_resync': False,
+        'items': inventory_list_to_dicts(items, include_tracking=True),
+        'deleted': deleted,
+    }
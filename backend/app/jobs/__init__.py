@@ -0,0 +1,3 @@
+"""Job in background (export, import) con coda su database e worker locali."""
+
+from .routes import bp  # noqa: F401
@@ -0,0 +1,106 @@
+import json
+from typing import Dict
+
+from flask import Blueprint, g, jsonify, request, send_file, url_for
+
+from ..auth.decorators import token_required
+from ..models import Job
+from .runner import (
+    RESULT_SUFFIX,
+    STATUS_SUCCEEDED,
+    create_job,
+    get_job_pool,
+    job_file,
+)
+
+bp = Blueprint('jobs', __name__)
+
+
+@bp.before_app_request
+def start_job_workers():
+    # Avvio pigro: i comandi CLI che creano l'app non devono eseguire job.
+    get_job_pool().start()
+
+
+def job_to_dict(job: Job) -> Dict[str, object]:
+    percent = None
+    if job.total:
+        percent = min(100, round(job.progress * 100 / job.total))
+    elif job.status == STATUS_SUCCEEDED:
+        percent = 100
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': {'done': job.progress, 'total': job.total, 'percent': percent},
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == STATUS_SUCCEEDED and job.result_filename:
+        data['result_url'] = url_for('jobs.download_job_result', job_id=job.id)
+    return data
+
+
+def _own_job(job_id: str):
+    return Job.query.filter_by(id=job_id, created_by=g.current_user.username).first()
+
+
+@bp.route('/jobs', methods=['POST'])
+@token_required
+def create_job_endpoint():
+    """Accoda un job: JSON `{kind, params}` oppure multipart con `kind` e `file`."""
+    is_form_data = (request.content_type or '').startswith('multipart/form-data')
+    source = request.form if is_form_data else (request.get_json(silent=True) or {})
+    try:
+        job = create_job(source.get('kind'), g.current_user.username)
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+    response = jsonify(job_to_dict(job))
+    response.headers['Location'] = url_for('jobs.get_job', job_id=job.id)
+    return response, 202
+
+
+@bp.route('/jobs/<string:job_id>', methods=['GET'])
+@token_required
+def get_job(job_id: str):
+    job = _own_job(job_id)
+    if not job:
+        return jsonify({'message': 'Job non trovato'}), 404
+    return jsonify(job_to_dict(job)), 200
+
+
+@bp.route('/jobs/<string:job_id>/result', methods=['GET'])
+@token_required
+def download_job_result(job_id: str):
+    job = _own_job(job_id)
+    if not job:
+        return jsonify({'message': 'Job non trovato'}), 404
+    if job.status != STATUS_SUCCEEDED or not job.result_filename:
+        return jsonify({'message': 'Risultato non disponibile'}), 409
+    path = job_file(job.id, RESULT_SUFFIX)
+    if not path.exists():
+        return jsonify({'message': 'Risultato scaduto'}), 410
+    return send_file(
+        path,
+        mimetype=job.result_mimetype,
+        as_attachment=True,
+        download_name=job.result_filename,
+        max_age=None,
+    )
+
+
+@bp.cli.command('worker')
+def run_job_worker():
+    """Esegue i job in primo piano (processo dedicato, ad es. con JOBS_WORKERS=0 sul web)."""
+    pool = get_job_pool()
+    if pool.workers <= 0:
+        pool.workers = 1
+    pool.start()
+    print(f'Worker job avviato ({pool.workers} thread), Ctrl+C per uscire')
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pass
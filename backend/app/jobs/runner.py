@@ -0,0 +1,314 @@
+"""Job in background: tabella `job` come coda e thread locali come worker.
+
+Non serve un broker esterno: ogni processo gunicorn avvia `JOBS_WORKERS`
+thread che si contendono i job in coda con un UPDATE condizionato (vince chi
+cambia lo stato da `queued` a `running`). In alternativa i web worker possono
+lasciare il lavoro a un processo dedicato (`flask jobs worker`).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+from flask import Flask, current_app
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+from ..extensions import db
+from ..models import Job
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+INPUT_SUFFIX = '.input'
+RESULT_SUFFIX = '.result'
+
+
+@dataclass(frozen=True)
+class JobKind:
+    # Legge la richiesta corrente e restituisce i parametri del job (ValueError se non validi).
+    prepare: Callable[[str], Dict[str, object]]
+    run: Callable[['JobContext'], Dict[str, object]]
+
+
+JOB_KINDS: Dict[str, JobKind] = {}
+
+
+def register_job_kind(
+    name: str,
+    prepare: Callable[[str], Dict[str, object]],
+    run: Callable[['JobContext'], Dict[str, object]],
+) -> None:
+    JOB_KINDS[name] = JobKind(prepare, run)
+
+
+def jobs_folder() -> Path:
+    path = Path(current_app.config['JOBS_FOLDER'])
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def job_file(job_id: str, suffix: str) -> Path:
+    return jobs_folder() / f'{job_id}{suffix}'
+
+
+class JobContext:
+    """Quello che un job vede di sé: parametri, avanzamento e file di risultato."""
+
+    def __init__(self, job: Job, progress_interval: float) -> None:
+        self.id = job.id
+        self.kind = job.kind
+        self.params = json.loads(job.params or '{}')
+        self.created_by = job.created_by
+        self.result_filename: Optional[str] = None
+        self.result_mimetype: Optional[str] = None
+        self._progress_interval = progress_interval
+        self._last_progress = 0.0
+
+    @property
+    def input_path(self) -> Path:
+        return job_file(self.id, INPUT_SUFFIX)
+
+    @property
+    def result_path(self) -> Path:
+        return job_file(self.id, RESULT_SUFFIX)
+
+    def set_result_file(self, filename: str, mimetype: str) -> None:
+        self.result_filename = filename
+        self.result_mimetype = mimetype
+
+    def progress(self, done: int, total: Optional[int] = None, force: bool = False) -> None:
+        """Aggiorna l'avanzamento al massimo una volta ogni `JOBS_PROGRESS_INTERVAL` secondi.
+
+        Usa una connessione propria: non deve finire nella transazione del job.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_progress < self._progress_interval:
+            return
+        self._last_progress = now
+        values = {'progress': done, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['total'] = total
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(update(Job).where(Job.id == self.id).values(**values))
+        except OperationalError:
+            # Su SQLite il job può avere il database bloccato in scrittura.
+            logger.debug('Avanzamento del job %s non aggiornato', self.id)
+
+
+def create_job(kind_name: Optional[str], username: str) -> Job:
+    kind = JOB_KINDS.get(kind_name or '')
+    if kind is None:
+        raise ValueError(f'Tipo di job non supportato: {kind_name}')
+    job_id = uuid.uuid4().hex
+    params = kind.prepare(job_id)
+    job = Job(id=job_id, kind=kind_name, params=json.dumps(params), status=STATUS_QUEUED, created_by=username)
+    db.session.add(job)
+    db.session.commit()
+    pool = current_app.extensions.get('job_pool')
+    if pool is not None:
+        pool.wake()
+    return job
+
+
+def claim_next_job() -> Optional[str]:
+    candidates = [
+        job_id for (job_id,) in (
+            db.session.query(Job.id)
+            .filter(Job.status == STATUS_QUEUED)
+            .order_by(Job.created_at)
+            .limit(5)
+        )
+    ]
+    for job_id in candidates:
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == STATUS_QUEUED)
+            .values(status=STATUS_RUNNING, started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+    db.session.rollback()
+    return None
+
+
+def execute_job(job_id: str, progress_interval: float) -> None:
+    job = db.session.get(Job, job_id)
+    kind = JOB_KINDS.get(job.kind)
+    context = JobContext(job, progress_interval)
+    db.session.commit()
+
+    values: Dict[str, object]
+    try:
+        if kind is None:
+            raise ValueError(f'Tipo di job non supportato: {job.kind}')
+        summary = kind.run(context)
+    except Exception as exc:
+        db.session.rollback()
+        if not isinstance(exc, ValueError):
+            logger.exception('Job %s (%s) fallito', job_id, context.kind)
+        values = {
+            'status': STATUS_FAILED,
+            'error': str(exc) if isinstance(exc, ValueError) else 'Errore interno durante il job',
+        }
+        context.result_path.unlink(missing_ok=True)
+    else:
+        values = {
+            'status': STATUS_SUCCEEDED,
+            'result': json.dumps(summary),
+            'result_filename': context.result_filename,
+            'result_mimetype': context.result_mimetype,
+        }
+    finally:
+        context.input_path.unlink(missing_ok=True)
+
+    values['finished_at'] = datetime.utcnow()
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(**values).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def requeue_stale_jobs(stale_seconds: int, max_attempts: int) -> int:
+    """Job `running` senza heartbeat (processo morto): di nuovo in coda o falliti."""
+    horizon = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    stale = (Job.status == STATUS_RUNNING, Job.heartbeat_at < horizon)
+    requeued = db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts < max_attempts)
+        .values(status=STATUS_QUEUED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= max_attempts)
+        .values(status=STATUS_FAILED, error='Job interrotto troppe volte', finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return requeued
+
+
+def purge_finished_jobs(ttl_seconds: int) -> int:
+    horizon = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    expired = [
+        job_id for (job_id,) in (
+            db.session.query(Job.id).filter(Job.status.in_(FINISHED_STATUSES), Job.finished_at < horizon)
+        )
+    ]
+    if expired:
+        db.session.query(Job).filter(Job.id.in_(expired)).delete(synchronize_session=False)
+        db.session.commit()
+        for job_id in expired:
+            job_file(job_id, RESULT_SUFFIX).unlink(missing_ok=True)
+    return len(expired)
+
+
+class JobPool:
+    """Thread worker del processo corrente, avviati alla prima richiesta."""
+
+    def __init__(self, app: Flask, workers: int) -> None:
+        self.app = app
+        self.workers = workers
+        self._wake = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        self._running: Set[str] = set()
+        self._threads: List[threading.Thread] = []
+        self._last_maintenance = 0.0
+
+    def start(self) -> None:
+        if self._started or self.workers <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for index in range(self.workers):
+                self._spawn(self._work_loop, f'jobs-worker-{index}')
+            self._spawn(self._heartbeat_loop, 'jobs-heartbeat')
+
+    def _spawn(self, target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _work_loop(self) -> None:
+        config = self.app.config
+        while True:
+            try:
+                with self.app.app_context():
+                    self._maintenance()
+                    job_id = claim_next_job()
+                    if job_id is not None:
+                        with self._lock:
+                            self._running.add(job_id)
+                        try:
+                            execute_job(job_id, config['JOBS_PROGRESS_INTERVAL'])
+                        finally:
+                            with self._lock:
+                                self._running.discard(job_id)
+                        continue
+            except Exception:
+                logger.exception('Errore nel worker dei job')
+            self._wake.wait(config['JOBS_POLL_SECONDS'])
+            self._wake.clear()
+
+    def _maintenance(self) -> None:
+        config = self.app.config
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_maintenance < config['JOBS_MAINTENANCE_SECONDS']:
+                return
+            self._last_maintenance = now
+        requeue_stale_jobs(config['JOBS_STALE_SECONDS'], config['JOBS_MAX_ATTEMPTS'])
+        purge_finished_jobs(config['JOBS_RESULT_TTL_SECONDS'])
+
+    def _heartbeat_loop(self) -> None:
+        interval = max(1.0, self.app.config['JOBS_STALE_SECONDS'] / 4)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    connection.execute(
+                        update(Job).where(Job.id.in_(running)).values(heartbeat_at=datetime.utcnow())
+                    )
+            except OperationalError:
+                logger.debug('Heartbeat dei job non aggiornato')
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['job_pool'] = JobPool(app, app.config['JOBS_WORKERS'])
+
+
+def get_job_pool() -> JobPool:
+    return current_app.extensions['job_pool']
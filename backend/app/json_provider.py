@@ -0,0 +1,95 @@
+"""Codifica JSON delle risposte grandi (elenchi dell'inventario).
+
+`JSON_PROVIDER=auto` usa orjson se installato, altrimenti l'encoder di Flask.
+L'output è identico byte per byte a quello di `jsonify` (chiavi ordinate,
+caratteri non ASCII come `\\uXXXX`, newline finale): client ed ETag non
+vedono differenze cambiando provider. orjson formatta i float in modo diverso
+(`1e16` invece di `1e+16`): le risposte che ne contengono passano all'encoder
+di Flask. Fanno eccezione NaN e infiniti, che non sono JSON valido: orjson li
+scrive come `null`.
+"""
+
+from __future__ import annotations
+
+import re
+
+from flask import Flask, current_app, json, jsonify
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dipende dall'installazione
+    orjson = None
+
+
+# `ensure_ascii` di json escapa tutto ciò che è fuori da ' '..'~': orjson ha già
+# escapato i caratteri di controllo, restano DEL e i caratteri non ASCII.
+_UNESCAPED_BYTES = re.compile(rb'[\x7f-\xff]')
+_UNESCAPED_CHARS = re.compile('[\x7f-\U0010ffff]')
+# Un numero con parte decimale o esponente dopo `:`, `[` o `,`. Può scattare
+# anche dentro una stringa: in quel caso si perde solo la velocità di orjson.
+_FLOAT_TOKEN = re.compile(rb'(?:^|[:,\[])-?\d+[.e]')
+
+
+def _escape_char(match: re.Match) -> str:
+    code = ord(match.group())
+    if code < 0x10000:
+        return f'\\u{code:04x}'
+    code -= 0x10000
+    return f'\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}'
+
+
+class StdlibJSONProvider:
+    name = 'stdlib'
+
+    def dumps(self, payload: object) -> bytes:
+        return (json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class OrjsonJSONProvider:
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        self._fallback = StdlibJSONProvider()
+
+    def dumps(self, payload: object) -> bytes:
+        config = current_app.config
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE
+        if config['JSON_SORT_KEYS']:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            data = orjson.dumps(payload, default=current_app.json_encoder().default, option=option)
+        except orjson.JSONEncodeError:
+            # Es. interi oltre i 64 bit: l'encoder di Flask li gestisce.
+            return self._fallback.dumps(payload)
+        if _FLOAT_TOKEN.search(data):
+            return self._fallback.dumps(payload)
+        if config['JSON_AS_ASCII'] and _UNESCAPED_BYTES.search(data):
+            data = _UNESCAPED_CHARS.sub(_escape_char, data.decode('utf-8')).encode('ascii')
+        return data
+
+
+def _create_provider(name: str):
+    if name == 'stdlib' or (name == 'auto' and orjson is None):
+        return StdlibJSONProvider()
+    if name in ('auto', 'orjson'):
+        if orjson is None:
+            raise RuntimeError('JSON_PROVIDER=orjson richiede il pacchetto orjson')
+        return OrjsonJSONProvider()
+    raise RuntimeError(f'JSON_PROVIDER non supportato: {name}')
+
+
+def json_response(payload: object):
+    """Come `jsonify`, ma codificato dal provider configurato."""
+    config = current_app.config
+    if config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug:
+        return jsonify(payload)
+    provider = get_json_provider()
+    return current_app.response_class(provider.dumps(payload), mimetype=config['JSONIFY_MIMETYPE'])
+
+
+def get_json_provider():
+    return current_app.extensions['json_provider']
+
+
+def init_app(app: Flask) -> None:
+    app.extensions['json_provider'] = _create_provider(app.config['JSON_PROVIDER'].lower())
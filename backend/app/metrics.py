@@ -0,0 +1,318 @@
+"""Metriche delle richieste e delle query SQL, esposte su `/metrics` (formato Prometheus).
+
+Per ogni endpoint si registrano latenza, numero e tempo delle query SQL della
+richiesta; una richiesta che ripete la stessa query più di
+`METRICS_N_PLUS_ONE_THRESHOLD` volte viene segnalata come probabile N+1.
+Con `SLOW_REQUEST_MS` le richieste lente finiscono nel log con le query eseguite.
+
+Le metriche sono per processo. Con più worker gunicorn impostare
+`METRICS_DIR`: ogni worker vi salva periodicamente le proprie e `/metrics`
+restituisce la somma di tutti i file.
+"""
+
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import Flask, Response, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'gestionale_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SLOW_LOG_MAX_STATEMENTS = 50
+
+# nome -> (tipo, descrizione, bucket)
+METRICS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    'http_requests_total': ('counter', 'Richieste HTTP servite', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Durata delle richieste fino alla risposta (esclusi i corpi in streaming)', LATENCY_BUCKETS,
+    ),
+    'http_slow_requests_total': ('counter', 'Richieste oltre SLOW_REQUEST_MS', None),
+    'db_queries_per_request': ('histogram', 'Query SQL eseguite da una richiesta', QUERY_COUNT_BUCKETS),
+    'db_query_seconds_per_request': ('histogram', 'Tempo SQL totale di una richiesta', LATENCY_BUCKETS),
+    'db_n_plus_one_requests_total': (
+        'counter', 'Richieste che ripetono la stessa query oltre METRICS_N_PLUS_ONE_THRESHOLD', None,
+    ),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # Per istogramma: conteggi per bucket (+Inf in coda), somma, numero osservazioni.
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        buckets = METRICS[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            data = series.get(key)
+            if data is None:
+                data = series[key] = [0.0] * (len(buckets) + 3)
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, List]]:
+        with self._lock:
+            return {
+                'counters': {
+                    name: [[dict(key), value] for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                'histograms': {
+                    name: [[dict(key), list(data)] for key, data in series.items()]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def dump(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.metrics-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as output:
+                json.dump(self.snapshot(), output)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict[str, List]]]) -> Dict[str, Dict[str, List]]:
+    counters: Dict[str, Dict[LabelKey, float]] = {}
+    histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.get('counters', {}).items():
+            target = counters.setdefault(name, {})
+            for labels, value in series:
+                key = tuple(sorted(labels.items()))
+                target[key] = target.get(key, 0) + value
+        for name, series in snapshot.get('histograms', {}).items():
+            target_histogram = histograms.setdefault(name, {})
+            for labels, data in series:
+                key = tuple(sorted(labels.items()))
+                current = target_histogram.get(key)
+                target_histogram[key] = data if current is None else [a + b for a, b in zip(current, data)]
+    return {
+        'counters': {name: [[dict(k), v] for k, v in series.items()] for name, series in counters.items()},
+        'histograms': {name: [[dict(k), d] for k, d in series.items()] for name, series in histograms.items()},
+    }
+
+
+def _escape(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render(snapshot: Dict[str, Dict[str, List]], gauges: Dict[str, List[Tuple[Dict[str, object], float]]]) -> str:
+    lines: List[str] = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = snapshot['counters' if kind == 'counter' else 'histograms'].get(name)
+        if not series:
+            continue
+        full_name = METRIC_PREFIX + name
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0.0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-2]):
+                cumulative += count
+                bucket_labels = dict(labels, le=bound if bound == '+Inf' else _format_value(bound))
+                lines.append(f'{full_name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}')
+            lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(value[-2])}')
+            lines.append(f'{full_name}_count{_format_labels(labels)} {_format_value(value[-1])}')
+    for name, samples in sorted(gauges.items()):
+        full_name = METRIC_PREFIX + name
+        lines.append(f'# TYPE {full_name} gauge')
+        for labels, value in samples:
+            lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """Query SQL della richiesta corrente, raccolte dagli eventi dell'engine."""
+
+    def __init__(self, capture: bool) -> None:
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+        self.captured: Optional[List[Tuple[str, float]]] = [] if capture else None
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.queries += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if self.captured is not None and len(self.captured) < SLOW_LOG_MAX_STATEMENTS:
+            self.captured.append((statement, seconds))
+
+
+def _current_stats() -> Optional[RequestStats]:
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current_stats() is not None:
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = _current_stats()
+    started = conn.info.get('_query_started')
+    if stats is None or not started:
+        return
+    stats.record(statement, time.perf_counter() - started.pop())
+
+
+def _start_request() -> None:
+    g._request_stats = RequestStats(capture=current_app.config['SLOW_REQUEST_MS'] > 0)
+    collector = current_app.extensions['metrics']
+    collector.start_flusher()
+
+
+def _finish_request(response: Response) -> Response:
+    stats: Optional[RequestStats] = g.pop('_request_stats', None)
+    if stats is None:
+        return response
+    config = current_app.config
+    duration = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'none'
+    registry: MetricsRegistry = current_app.extensions['metrics'].registry
+
+    registry.inc('http_requests_total', {'method': request.method, 'endpoint': endpoint, 'status': str(response.status_code)})
+    registry.observe('http_request_duration_seconds', {'method': request.method, 'endpoint': endpoint}, duration)
+    registry.observe('db_queries_per_request', {'endpoint': endpoint}, stats.queries)
+    registry.observe('db_query_seconds_per_request', {'endpoint': endpoint}, stats.seconds)
+
+    repeated_statement, repeats = stats.statements.most_common(1)[0] if stats.statements else ('', 0)
+    if repeats > config['METRICS_N_PLUS_ONE_THRESHOLD']:
+        registry.inc('db_n_plus_one_requests_total', {'endpoint': endpoint})
+        logger.warning('Possibile N+1 in %s: query ripetuta %s volte: %s', endpoint, repeats, repeated_statement)
+
+    slow_ms = config['SLOW_REQUEST_MS']
+    if slow_ms > 0 and duration * 1000 >= slow_ms:
+        registry.inc('http_slow_requests_total', {'endpoint': endpoint})
+        captured = '\n'.join(f'  {seconds * 1000:8.1f} ms  {sql}' for sql, seconds in stats.captured or [])
+        logger.warning(
+            'Richiesta lenta %s %s (%s): %.0f ms, %s query in %.0f ms\n%s',
+            request.method, request.path, endpoint, duration * 1000, stats.queries, stats.seconds * 1000, captured,
+        )
+    return response
+
+
+class MetricsCollector:
+    def __init__(self, directory: str, flush_seconds: float) -> None:
+        self.registry = MetricsRegistry()
+        self.directory = Path(directory) if directory else None
+        self.flush_seconds = flush_seconds
+        self._flusher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot_path(self) -> Optional[Path]:
+        return self.directory / f'metrics-{os.getpid()}.json' if self.directory else None
+
+    def start_flusher(self) -> None:
+        if self.directory is None or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.registry.dump(self.snapshot_path)
+            except OSError:
+                logger.warning('Metriche non salvate in %s', self.directory, exc_info=True)
+
+    def collect(self) -> Dict[str, Dict[str, List]]:
+        if self.directory is None:
+            return self.registry.snapshot()
+        self.registry.dump(self.snapshot_path)
+        snapshots = []
+        for path in self.directory.glob('metrics-*.json'):
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return merge_snapshots(snapshots)
+
+
+def _component_gauges(app: Flask) -> Dict[str, List[Tuple[Dict[str, object], float]]]:
+    """Statistiche dei componenti (`stats()`) del processo che risponde."""
+    gauges: Dict[str, List[Tuple[Dict[str, object], float]]] = {}
+    labels = {'pid': os.getpid()}
+    for extension_name, extension in sorted(app.extensions.items()):
+        stats = getattr(extension, 'stats', None)
+        if not callable(stats):
+            continue
+        for key, value in stats().items():
+            if isinstance(value, (bool, int, float)):
+                gauges.setdefault(f'{extension_name}_{key}', []).append((labels, float(value)))
+    return gauges
+
+
+def metrics_view():
+    token = current_app.config['METRICS_BEARER_TOKEN']
+    if token:
+        provided = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(provided.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'message': 'Token non valido'}), 401
+    collector: MetricsCollector = current_app.extensions['metrics']
+    body = render(collector.collect(), _component_gauges(current_app))
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app: Flask) -> None:
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['metrics'] = MetricsCollector(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_SECONDS'])
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,5 @@
+"""Migrazioni versionate dello schema, eseguite all'avvio o con `flask migrations upgrade`."""
+
+from .commands import bp  # noqa: F401
+from .runner import run_migrations  # noqa: F401
+from .versions import MigrationError  # noqa: F401
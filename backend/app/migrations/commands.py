@@ -0,0 +1,23 @@
+from flask import Blueprint
+
+from ..extensions import db
+from .runner import migration_status, run_migrations
+
+bp = Blueprint('migrations', __name__)
+
+
+@bp.cli.command('upgrade')
+def upgrade_command():
+    """Applica le migrazioni dello schema non ancora eseguite."""
+    executed = run_migrations(db.engine)
+    for migration in executed:
+        print(f'{migration.version:>4}  {migration.name}')
+    print(f'Migrazioni applicate: {len(executed)}')
+
+
+@bp.cli.command('status')
+def status_command():
+    """Elenca le migrazioni con la data di applicazione."""
+    for migration, applied_at in migration_status(db.engine):
+        state = applied_at.isoformat(sep=' ', timespec='seconds') if applied_at else 'da applicare'
+        print(f'{migration.version:>4}  {migration.name:<45} {state}')
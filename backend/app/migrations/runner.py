@@ -0,0 +1,85 @@
+"""Applica le migrazioni mancanti, una sola istanza alla volta.
+
+Su PostgreSQL i worker che partono insieme si serializzano su un advisory
+lock di sessione: il primo applica le migrazioni, gli altri attendono e poi
+le trovano già registrate in `schema_migration`. SQLite (sviluppo) non ha
+advisory lock: le migrazioni idempotenti rendono innocua una corsa.
+"""
+
+from __future__ import annotations
+
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from ..models import SchemaMigration
+from .versions import MIGRATIONS, Migration
+
+
+logger = logging.getLogger(__name__)
+
+# Chiave arbitraria ma fissa per pg_advisory_lock, condivisa da tutti i processi.
+MIGRATION_LOCK_ID = 7_242_018
+
+
+@contextmanager
+def migration_lock(connection: Connection) -> Iterator[None]:
+    if connection.dialect.name != 'postgresql':
+        yield
+        return
+    with connection.begin():
+        connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+    try:
+        yield
+    finally:
+        with connection.begin():
+            connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+
+
+def _applied_versions(connection: Connection) -> Dict[int, datetime]:
+    with connection.begin():
+        rows = connection.execute(select(SchemaMigration.version, SchemaMigration.applied_at)).all()
+    return {version: applied_at for version, applied_at in rows}
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    with engine.connect() as connection:
+        applied = _applied_versions(connection)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def migration_status(engine: Engine) -> List[Tuple[Migration, object]]:
+    with engine.connect() as connection:
+        applied = _applied_versions(connection)
+    return [(migration, applied.get(migration.version)) for migration in MIGRATIONS]
+
+
+def run_migrations(engine: Engine) -> List[Migration]:
+    """Applica in ordine le migrazioni non ancora registrate; restituisce quelle eseguite."""
+    executed: List[Migration] = []
+    with engine.connect() as connection, migration_lock(connection):
+        # Letto dopo il lock: un altro worker potrebbe averle appena applicate.
+        applied = _applied_versions(connection)
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            try:
+                with connection.begin():
+                    migration.upgrade(connection)
+                    connection.execute(SchemaMigration.__table__.insert().values(
+                        version=migration.version,
+                        name=migration.name,
+                        applied_at=datetime.utcnow(),
+                    ))
+            except IntegrityError:
+                # SQLite: un altro processo l'ha registrata nel frattempo.
+                logger.info('Migrazione %s già applicata da un altro processo', migration.version)
+                continue
+            logger.info('Migrazione %s applicata: %s', migration.version, migration.name)
+            executed.append(migration)
+    return executed
@@ -0,0 +1,69 @@
+"""Elenco delle migrazioni dello schema, in ordine di versione.
+
+Ogni migrazione gira nella propria transazione e deve essere idempotente:
+su un database nuovo `create_all` ha già creato colonne e indici dai modelli
+e la migrazione viene solo registrata. Le versioni non si rinumerano mai.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+
+class MigrationError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def _inventory_version_column(connection: Connection) -> None:
+    columns = {column['name'] for column in inspect(connection).get_columns('inventory')}
+    if 'version' not in columns:
+        connection.execute(text('ALTER TABLE inventory ADD COLUMN version BIGINT NOT NULL DEFAULT 0'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_inventory_version ON inventory (version)'))
+
+
+def _token_expires_at_index(connection: Connection) -> None:
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_token_expires_at ON token (expires_at)'))
+
+
+def _inventory_codice_unique(connection: Connection) -> None:
+    duplicates = connection.execute(text(
+        'SELECT codice_articolo FROM inventory GROUP BY codice_articolo '
+        'HAVING COUNT(*) > 1 ORDER BY codice_articolo LIMIT 10'
+    )).scalars().all()
+    if duplicates:
+        raise MigrationError(
+            'Codici articolo duplicati, impossibile creare l\'indice univoco: '
+            + ', '.join(duplicates)
+            + '. Unisci o rinomina gli articoli e rilancia `flask migrations upgrade`.'
+        )
+    connection.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_inventory_codice_articolo ON inventory (codice_articolo)'
+    ))
+
+
+def _inventory_locazione_index(connection: Connection) -> None:
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_inventory_locazione ON inventory (locazione)'))
+
+
+def _token_user_id_index(connection: Connection) -> None:
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_token_user_id ON token (user_id)'))
+
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(1, 'inventory.version e indice', _inventory_version_column),
+    Migration(2, 'indice token.expires_at', _token_expires_at_index),
+    Migration(3, 'indice univoco inventory.codice_articolo', _inventory_codice_unique),
+    Migration(4, 'indice inventory.locazione', _inventory_locazione_index),
+    Migration(5, 'indice token.user_id', _token_user_id_index),
+)
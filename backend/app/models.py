@@ -11,27 +11,142 @@ class User(db.Model):
 
 class Inventory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    codice_articolo = db.Column(db.String(50), nullable=False)
+    codice_articolo = db.Column(db.String(50), nullable=False, unique=True, index=True)
     descrizione = db.Column(db.String(200))
     unita_misura = db.Column(db.String(20))
     quantita = db.Column(db.Integer, default=0)
-    locazione = db.Column(db.String(100))
+    locazione = db.Column(db.String(100), index=True)
     foto = db.Column(db.String(200))
     data_ingresso = db.Column(db.String(50))
     carico = db.Column(db.Integer, default=0)
     scarico = db.Column(db.Integer, default=0)
     created_by = db.Column(db.String(80))
     modified_by = db.Column(db.String(80))
+    # Versione dell'inventario all'ultima modifica della riga (vedi InventoryVersion).
+    version = db.Column(db.BigInteger, nullable=False, default=0, index=True)
 
 
 class Token(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(64), unique=True, nullable=False, index=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     user = db.relationship('User', backref=db.backref('tokens', lazy='dynamic'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
     @property
     def is_expired(self) -> bool:
         return self.expires_at <= datetime.utcnow()
+
+
+class StockMovement(db.Model):
+    """Registro append-only dei movimenti: delta di carico/scarico per articolo.
+
+    Niente foreign key su inventory: lo storico sopravvive all'eliminazione
+    dell'articolo, che viene registrata come movimento di azzeramento.
+    """
+
+    __table_args__ = (
+        db.Index('ix_stock_movement_inventory_id_id', 'inventory_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, nullable=False)
+    codice_articolo = db.Column(db.String(50))
+    kind = db.Column(db.String(20), nullable=False)
+    carico = db.Column(db.Integer, nullable=False, default=0)
+    scarico = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    created_by = db.Column(db.String(80))
+
+
+class StockCheckpoint(db.Model):
+    """Totali cumulativi di un articolo fino al movimento `movement_id` incluso."""
+
+    __table_args__ = (
+        db.Index('ix_stock_checkpoint_inventory_id_as_of', 'inventory_id', 'as_of'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    carico = db.Column(db.Integer, nullable=False)
+    scarico = db.Column(db.Integer, nullable=False)
+
+
+class InventoryVersion(db.Model):
+    """Contatore globale (riga singola) incrementato da ogni scrittura sull'inventario."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class InventoryTombstone(db.Model):
+    """Traccia delle eliminazioni per la sincronizzazione incrementale dei client."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, nullable=False)
+    codice_articolo = db.Column(db.String(50))
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class StoredFile(db.Model):
+    """File caricato, salvato una sola volta per contenuto (sha256 + estensione).
+
+    `ref_count` conta gli articoli che lo usano come allegato: a zero il file
+    diventa orfano e viene rimosso da `flask files gc` dopo il periodo di grazia.
+    """
+
+    key = db.Column(db.String(120), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class UploadSession(db.Model):
+    """Upload a blocchi ripristinabile: `received` byte già scritti nel file parziale."""
+
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_by = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class Job(db.Model):
+    """Operazione lunga (export, import) eseguita dai worker locali fuori dalla richiesta."""
+
+    __table_args__ = (
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.Text, nullable=False, default='{}')
+    progress = db.Column(db.BigInteger, nullable=False, default=0)
+    total = db.Column(db.BigInteger)
+    result = db.Column(db.Text)
+    result_filename = db.Column(db.String(200))
+    result_mimetype = db.Column(db.String(120))
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_by = db.Column(db.String(80), index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class SchemaMigration(db.Model):
+    """Migrazioni dello schema già applicate (vedi `app.migrations`)."""
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
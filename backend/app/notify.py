@@ -0,0 +1,80 @@
+"""Ascolto di un canale PostgreSQL `LISTEN` su una connessione dedicata per worker."""
+
+from __future__ import annotations
+
+import logging
+import select
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotifyListener(threading.Thread):
+    """Inoltra i payload di `NOTIFY <channel>` a `on_message`.
+
+    `on_connect(reconnected)` viene chiamata dopo ogni `LISTEN` riuscito e
+    `on_disconnect()` quando la connessione cade: nel frattempo le notifiche
+    possono essere andate perse.
+    """
+
+    poll_seconds = 5.0
+    retry_seconds = 2.0
+
+    def __init__(
+        self,
+        engine: Engine,
+        channel: str,
+        on_message: Callable[[str], None],
+        on_connect: Optional[Callable[[bool], None]] = None,
+        on_disconnect: Optional[Callable[[], None]] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        super().__init__(name=name or f'{channel}-listener', daemon=True)
+        self.engine = engine
+        self.channel = channel
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+
+    def run(self) -> None:
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = self.engine.raw_connection()
+                # Connessione dedicata: non torna nel pool.
+                connection.detach()
+                dbapi_connection = connection.connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                if self.on_connect is not None:
+                    self.on_connect(connected_before)
+                connected_before = True
+                self._listen(dbapi_connection)
+            except Exception:  # pragma: no cover - dipende dalla rete
+                logger.exception('Listener %s interrotto, nuovo tentativo', self.channel)
+                if self.on_disconnect is not None:
+                    self.on_disconnect()
+                time.sleep(self.retry_seconds)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def _listen(self, dbapi_connection) -> None:
+        while True:
+            readable, _, _ = select.select([dbapi_connection], [], [], self.poll_seconds)
+            if not readable:
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                notification = dbapi_connection.notifies.pop(0)
+                self.on_message(notification.payload)
@@ -2,12 +2,15 @@ from __future__ import annotations
 
 import os
 import re
-from typing import Dict, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from flask import current_app, request
 from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
 from werkzeug.datastructures import FileStorage
-from werkzeug.utils import secure_filename
 
 
 def allowed_file(filename: str) -> bool:
@@ -34,7 +37,11 @@ def safe_int(value: object) -> int:
     return int(text)
 
 
-def inventory_to_dict(item: "Inventory", include_tracking: bool = False) -> Dict[str, object]:
+def inventory_to_dict(
+    item: "Inventory",
+    include_tracking: bool = False,
+    token_bucket: Optional[int] = None,
+) -> Dict[str, object]:
     data = {
         'id': item.id,
         'codice_articolo': item.codice_articolo,
@@ -44,7 +51,7 @@ def inventory_to_dict(item: "Inventory", include_tracking: bool = False) -> Dict
         'locazione': item.locazione,
         'data_ingresso': item.data_ingresso
     }
-    attachment_payload = _build_attachment_payload(item)
+    attachment_payload = _build_attachment_payload(item, token_bucket)
     if attachment_payload:
         data['attachment'] = attachment_payload
     if include_tracking:
@@ -53,6 +60,41 @@ def inventory_to_dict(item: "Inventory", include_tracking: bool = False) -> Dict
     return data
 
 
+def inventory_list_to_dicts(items: Iterable["Inventory"], include_tracking: bool = False) -> List[Dict[str, object]]:
+    """Serializza una pagina calcolando una sola volta la finestra dei token file."""
+    token_bucket = current_file_token_bucket()
+    return [inventory_to_dict(item, include_tracking, token_bucket) for item in items]
+
+
+# Colonne lette dagli elenchi senza passare dagli oggetti ORM: le prime
+# INVENTORY_ROW_FIELDS diventano chiavi del dizionario nello stesso ordine di
+# `inventory_to_dict`.
+INVENTORY_LIST_COLUMNS = (
+    'id', 'codice_articolo', 'descrizione', 'unita_misura', 'quantita', 'locazione', 'data_ingresso',
+    'foto', 'created_by', 'modified_by',
+)
+INVENTORY_ROW_FIELDS = INVENTORY_LIST_COLUMNS[:7]
+
+
+def inventory_rows_to_dicts(rows: Iterable[Tuple], include_tracking: bool = False) -> List[Dict[str, object]]:
+    """Come `inventory_list_to_dicts`, ma da tuple di `INVENTORY_LIST_COLUMNS`."""
+    token_bucket = current_file_token_bucket()
+    fields = INVENTORY_ROW_FIELDS
+    items = []
+    append = items.append
+    for row in rows:
+        data = dict(zip(fields, row))
+        if row[7]:
+            attachment_payload = _build_attachment_payload(row, token_bucket)
+            if attachment_payload:
+                data['attachment'] = attachment_payload
+        if include_tracking:
+            data['created_by'] = row[8]
+            data['modified_by'] = row[9]
+        append(data)
+    return items
+
+
 def extract_inventory_payload() -> Tuple[Dict[str, object], Optional[FileStorage]]:
     is_form_data = (request.content_type or '').startswith('multipart/form-data')
     source = request.form if is_form_data else (request.get_json(silent=True) or {})
@@ -78,30 +120,85 @@ def extract_inventory_payload() -> Tuple[Dict[str, object], Optional[FileStorage
     return payload, uploaded_file
 
 
-def save_uploaded_file(file: Optional[FileStorage]) -> Optional[str]:
-    if not file or not file.filename:
+def _get_file_serializer() -> URLSafeTimedSerializer:
+    serializer = current_app.extensions.get('file_serializer')
+    if serializer is None:
+        secret_key = current_app.config.get('SECRET_KEY')
+        if not secret_key:
+            raise RuntimeError('SECRET_KEY non configurata')
+        serializer = URLSafeTimedSerializer(secret_key=secret_key, salt='file-download')
+        current_app.extensions['file_serializer'] = serializer
+    return serializer
+
+
+class FileTokenMemo:
+    """Memo LRU (filename, finestra) -> token firmato, condiviso dai worker thread."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Tuple[str, int], factory: Callable[[], str]) -> str:
+        with self._lock:
+            token = self._entries.get(key)
+            if token is not None:
+                self._entries.move_to_end(key)
+                return token
+        token = factory()
+        with self._lock:
+            self._entries[key] = token
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+
+def _get_file_token_memo() -> FileTokenMemo:
+    memo = current_app.extensions.get('file_token_memo')
+    if memo is None:
+        memo = FileTokenMemo(current_app.config.get('FILE_TOKEN_MEMO_MAX_ENTRIES', 50000))
+        current_app.extensions['file_token_memo'] = memo
+    return memo
+
+
+def current_file_token_bucket() -> Optional[int]:
+    """Finestra temporale corrente per il riuso dei token, None se disattivato."""
+    bucket_seconds = current_app.config.get('FILE_TOKEN_BUCKET_SECONDS', 0)
+    if not bucket_seconds or bucket_seconds <= 0:
         return None
-    if not allowed_file(file.filename):
-        raise ValueError('Estensione file non consentita')
-    filename = secure_filename(file.filename)
-    destination = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    file.save(destination)
-    return filename
+    return int(time.time() // bucket_seconds)
 
 
-def _get_file_serializer() -> URLSafeTimedSerializer:
-    secret_key = current_app.config.get('SECRET_KEY')
-    if not secret_key:
-        raise RuntimeError('SECRET_KEY non configurata')
-    return URLSafeTimedSerializer(secret_key=secret_key, salt='file-download')
+def current_file_token_window() -> int:
+    """Finestra in cui i link degli allegati di una risposta restano validi.
+
+    È la finestra di riuso dei token; se il riuso è disattivato ogni link viene
+    firmato di nuovo, quindi una risposta in cache (o confermata con 304) resta
+    buona per un quarto di `FILE_TOKEN_TTL_SECONDS`. 0 se i link non scadono.
+    """
+    bucket = current_file_token_bucket()
+    if bucket is not None:
+        return bucket
+    ttl_seconds = current_app.config.get('FILE_TOKEN_TTL_SECONDS') or 0
+    if ttl_seconds <= 0:
+        return 0
+    return int(time.time() // max(1, ttl_seconds // 4))
+
 
+def _sign_file_token(filename: str) -> str:
+    return _get_file_serializer().dumps({'filename': filename})
 
-def generate_file_token(filename: Optional[str]) -> Optional[str]:
+
+def generate_file_token(filename: Optional[str], token_bucket: Optional[int] = None) -> Optional[str]:
     if not filename:
         return None
-    serializer = _get_file_serializer()
-    payload = {'filename': filename}
-    return serializer.dumps(payload)
+    if token_bucket is None:
+        token_bucket = current_file_token_bucket()
+    if token_bucket is None:
+        return _sign_file_token(filename)
+    # Un token creato all'inizio della finestra resta valido per almeno
+    # FILE_TOKEN_TTL_SECONDS - FILE_TOKEN_BUCKET_SECONDS secondi.
+    return _get_file_token_memo().get_or_create((filename, token_bucket), lambda: _sign_file_token(filename))
 
 
 def resolve_file_token(token: str) -> str:
@@ -122,32 +219,59 @@ def resolve_file_token(token: str) -> str:
     return filename
 
 
-def _build_attachment_payload(item: "Inventory") -> Optional[Dict[str, str]]:
-    if not getattr(item, 'foto', None):
-        return None
-    token = generate_file_token(item.foto)
-    if not token:
-        return None
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9_-]+')
+IMAGE_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'webp'})
+_THUMBNAIL_NAME = re.compile(r'^derived/(.+)\.thumb\d+\.webp$')
+
+
+def thumbnail_key(filename: str, size: int) -> str:
+    """Percorso (relativo a UPLOAD_FOLDER) della miniatura WebP di un allegato."""
+    return f'derived/{filename}.thumb{size}.webp'
+
+
+def thumbnail_source(filename: str) -> Optional[str]:
+    match = _THUMBNAIL_NAME.match(filename)
+    return match.group(1) if match else None
 
-    _, extension = os.path.splitext(item.foto)
+
+@lru_cache(maxsize=1024)
+def _attachment_kind(foto: str) -> Tuple[str, str]:
+    _, extension = os.path.splitext(foto)
     extension = extension.lstrip('.').lower()
     if not extension:
         extension = 'bin'
 
     if extension == 'pdf':
         kind = 'pdf'
-    elif extension in {'png', 'jpg', 'jpeg', 'gif', 'webp'}:
+    elif extension in IMAGE_EXTENSIONS:
         kind = 'image'
     else:
         kind = 'file'
+    return extension, kind
+
+
+@lru_cache(maxsize=8192)
+def _suggested_filename(codice_articolo: Optional[str], extension: str) -> str:
+    base_code = codice_articolo or 'allegato'
+    safe_base = _UNSAFE_FILENAME_CHARS.sub('-', base_code).strip('-') or 'allegato'
+    return f"{safe_base}.{extension}"
 
-    base_code = item.codice_articolo or 'allegato'
-    safe_base = re.sub(r'[^A-Za-z0-9_-]+', '-', base_code).strip('-') or 'allegato'
-    suggested_filename = f"{safe_base}.{extension}"
 
-    return {
+def _build_attachment_payload(item: "Inventory", token_bucket: Optional[int] = None) -> Optional[Dict[str, str]]:
+    if not getattr(item, 'foto', None):
+        return None
+    token = generate_file_token(item.foto, token_bucket)
+    if not token:
+        return None
+
+    extension, kind = _attachment_kind(item.foto)
+    payload = {
         'token': token,
         'kind': kind,
         'extension': extension,
-        'suggested_filename': suggested_filename
+        'suggested_filename': _suggested_filename(item.codice_articolo, extension)
     }
+    derivatives = current_app.extensions.get('derivatives')
+    if derivatives is not None and kind in derivatives.supported_kinds:
+        payload['thumbnail_token'] = generate_file_token(thumbnail_key(item.foto, derivatives.size), token_bucket)
+    return payload
@@ -0,0 +1 @@
+"""Benchmark del backend: da eseguire su un database di prova."""
@@ -0,0 +1,152 @@
+"""Popola un database di prova con articoli, utenti, token e allegati.
+
+Da eseguire dalla cartella backend; ogni funzione aggiunge solo ciò che
+manca, quindi si può rilanciare su un database già popolato:
+
+    DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.datagen --articles 100000 --users 50
+
+Gli utenti si chiamano `bench-<n>` e hanno tutti la password `BENCH_PASSWORD`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import random
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import func
+from werkzeug.datastructures import FileStorage
+
+from app import create_app
+from app.auth.service import hash_password
+from app.extensions import db
+from app.files.storage import save_uploaded_file
+from app.models import Inventory, StoredFile, Token, User
+
+
+BENCH_PASSWORD = 'BenchPassw0rd'
+USER_PREFIX = 'bench-'
+WORDS = (
+    'cavo', 'connettore', 'colonnina', 'inverter', 'fusibile', 'relè', 'scheda',
+    'display', 'presa', 'tipo2', 'rame', 'guaina', 'staffa', 'bullone', 'modulo',
+)
+
+
+def seed_articles(rows: int, batch_size: int = 5000) -> None:
+    existing = db.session.query(Inventory.id).count()
+    rng = random.Random(42)
+    for start in range(existing, rows, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, rows)):
+            prefix = rng.choice(('CAV', 'INV', 'CON', 'FUS', 'SCH'))
+            batch.append({
+                'codice_articolo': f'{prefix}-{index:06d}',
+                'descrizione': ' '.join(rng.sample(WORDS, 3)),
+                'unita_misura': 'pz',
+                'quantita': rng.randint(0, 500),
+                'locazione': f'M{rng.randint(1, 4)}/Scaffale{rng.randint(1, 30)}/Ripiano{rng.randint(1, 6)}',
+                'carico': 0,
+                'scarico': 0,
+            })
+        db.session.execute(Inventory.__table__.insert(), batch)
+        db.session.commit()
+
+
+def bench_usernames(count: int) -> List[str]:
+    return [f'{USER_PREFIX}{index}' for index in range(count)]
+
+
+def seed_users(count: int) -> List[str]:
+    """Crea gli utenti mancanti; l'hash della password è calcolato una sola volta."""
+    usernames = bench_usernames(count)
+    existing = {name for (name,) in db.session.query(User.username).filter(User.username.in_(usernames))}
+    missing = [name for name in usernames if name not in existing]
+    if missing:
+        password_hash = hash_password(BENCH_PASSWORD)
+        db.session.execute(User.__table__.insert(), [{'username': name, 'password': password_hash} for name in missing])
+        db.session.commit()
+    return usernames
+
+
+def seed_tokens(users: int, tokens_per_user: int) -> None:
+    """Token validi per gli utenti di prova, per dare dimensione alla tabella token."""
+    if db.session.query(Token.id).count() >= users * tokens_per_user:
+        return
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    for (user_id,) in db.session.query(User.id).filter(User.username.in_(bench_usernames(users))):
+        db.session.execute(Token.__table__.insert(), [
+            {'token': f'{user_id:08d}{n:056d}', 'user_id': user_id, 'expires_at': expires_at}
+            for n in range(tokens_per_user)
+        ])
+    db.session.commit()
+
+
+def noise_png(size_bytes: int, seed: int) -> bytes:
+    """PNG in scala di grigi con pixel casuali (quindi incomprimibile) di circa `size_bytes`."""
+    side = max(8, int(size_bytes ** 0.5))
+    rng = random.Random(seed)
+    raw = b''.join(b'\x00' + bytes(rng.getrandbits(8) for _ in range(side)) for _ in range(side))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', side, side, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+
+def seed_attachments(files: int, every: int = 10, size_bytes: int = 64 * 1024) -> None:
+    """Salva `files` immagini e le assegna a un articolo ogni `every`, a rotazione."""
+    if files <= 0 or db.session.query(Inventory.id).filter(Inventory.foto.isnot(None)).first() is not None:
+        return
+    period = every * files
+    for index in range(files):
+        upload = FileStorage(stream=io.BytesIO(noise_png(size_bytes, index)), filename=f'bench-{index}.png')
+        key = save_uploaded_file(upload)
+        assigned = db.session.execute(
+            Inventory.__table__.update()
+            .where(Inventory.id % period == every * index + every - 1)
+            .values(foto=key)
+        ).rowcount
+        db.session.execute(
+            StoredFile.__table__.update().where(StoredFile.key == key).values(ref_count=StoredFile.ref_count + assigned)
+        )
+        db.session.commit()
+
+
+def seed_all(articles: int, users: int, tokens_per_user: int, files: int) -> List[str]:
+    seed_articles(articles)
+    usernames = seed_users(users)
+    seed_tokens(users, tokens_per_user)
+    seed_attachments(files)
+    return usernames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--articles', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--tokens-per-user', type=int, default=20)
+    parser.add_argument('--files', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        seed_all(args.articles, args.users, args.tokens_per_user, args.files)
+        report = {
+            'dialect': db.engine.dialect.name,
+            'articles': db.session.query(Inventory.id).count(),
+            'with_attachment': db.session.query(Inventory.id).filter(Inventory.foto.isnot(None)).count(),
+            'users': db.session.query(User.id).count(),
+            'tokens': db.session.query(Token.id).count(),
+            'stored_files': db.session.query(func.count(StoredFile.key)).scalar(),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
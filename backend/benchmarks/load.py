@@ -0,0 +1,242 @@
+"""Carico HTTP con un mix realistico: login, elenco/filtri, dettaglio, modifica, export, file.
+
+Senza `--url` le richieste vanno all'app creata da `create_app` nello
+stesso processo (test client di Flask, un thread per utente virtuale) e il
+database indicato da DATABASE_URL viene popolato con `benchmarks.datagen`:
+
+    python -m benchmarks.load --articles 20000 --duration 30 --concurrency 8
+    DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.load --output risultati.json
+
+Con `--url http://localhost:5000` si misura un server già avviato: il suo
+database va popolato prima con `python -m benchmarks.datagen`.
+
+Il risultato è JSON con latenze p50/p95/p99 e throughput per operazione.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from app import create_app
+from app.extensions import db
+from benchmarks.datagen import BENCH_PASSWORD, bench_usernames, seed_all
+from benchmarks.stats import run_metadata, summarize
+
+
+# Operazione -> peso nel mix (proporzione delle richieste).
+DEFAULT_MIX = {
+    'login': 3,
+    'list_page': 30,
+    'list_full': 3,
+    'filter': 25,
+    'get_item': 14,
+    'update': 10,
+    'export': 2,
+    'file': 13,
+}
+FILTER_WORDS = ('cavo', 'tipo2', 'inverter', 'relè', 'staffa', 'modulo')
+
+
+class TestClientTransport:
+    """Richieste all'app in-process tramite il test client di Flask."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    def request(self, method: str, path: str, token: Optional[str] = None,
+                json_body: Optional[dict] = None) -> Tuple[int, bytes]:
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.app.test_client().open(path, method=method, headers=headers, json=json_body)
+        # get_data() consuma anche le risposte in streaming (export).
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method: str, path: str, token: Optional[str] = None,
+                json_body: Optional[dict] = None) -> Tuple[int, bytes]:
+        data = json.dumps(json_body).encode() if json_body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if token:
+            request.add_header('Authorization', f'Bearer {token}')
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+class VirtualUser:
+    def __init__(self, transport, username: str, password: str, catalog: List[dict],
+                 file_tokens: List[str], mix: Dict[str, int], rng: random.Random) -> None:
+        self.transport = transport
+        self.username = username
+        self.password = password
+        self.catalog = catalog
+        self.file_tokens = file_tokens
+        self.operations = [name for name in mix if mix[name] > 0 and (name != 'file' or file_tokens)]
+        self.weights = [mix[name] for name in self.operations]
+        self.rng = rng
+        self.token: Optional[str] = None
+
+    def run(self, operation: str) -> Tuple[int, bytes]:
+        return getattr(self, f'op_{operation}')()
+
+    def op_login(self) -> Tuple[int, bytes]:
+        status, body = self.transport.request(
+            'POST', '/api/login', json_body={'username': self.username, 'password': self.password}
+        )
+        if status == 200:
+            self.token = json.loads(body)['token']
+        return status, body
+
+    def op_list_page(self) -> Tuple[int, bytes]:
+        sort = self.rng.choice(('id', '-quantita', 'codice_articolo'))
+        return self.transport.request('GET', f'/api/inventory?limit=100&sort={sort}', self.token)
+
+    def op_list_full(self) -> Tuple[int, bytes]:
+        return self.transport.request('GET', '/api/inventory', self.token)
+
+    def op_filter(self) -> Tuple[int, bytes]:
+        if self.rng.random() < 0.5:
+            query = f'descrizione={urllib.parse.quote(self.rng.choice(FILTER_WORDS))}'
+        else:
+            query = f'locazione_exact=M{self.rng.randint(1, 4)}/Scaffale{self.rng.randint(1, 30)}/Ripiano1'
+        return self.transport.request('GET', f'/api/inventory?limit=50&{query}', self.token)
+
+    def op_get_item(self) -> Tuple[int, bytes]:
+        item = self.rng.choice(self.catalog)
+        return self.transport.request('GET', f"/api/inventory/{item['id']}", self.token)
+
+    def op_update(self) -> Tuple[int, bytes]:
+        item = self.rng.choice(self.catalog)
+        payload = {'descrizione': f'aggiornato {self.rng.randint(0, 1_000_000)}', 'carico': 1}
+        return self.transport.request('PUT', f"/api/inventory/{item['id']}", self.token, payload)
+
+    def op_export(self) -> Tuple[int, bytes]:
+        return self.transport.request('GET', f'/api/inventory/export?locazione=M{self.rng.randint(1, 4)}/', self.token)
+
+    def op_file(self) -> Tuple[int, bytes]:
+        return self.transport.request('GET', f'/api/files/{self.rng.choice(self.file_tokens)}', self.token)
+
+
+def _prepare_app(args):
+    app = create_app()
+    with app.app_context():
+        usernames = seed_all(args.articles, args.users, args.tokens_per_user, args.files)
+        dialect = db.engine.dialect.name
+    return TestClientTransport(app), usernames, dialect
+
+
+def _load_catalog(transport, username: str, password: str) -> Tuple[List[dict], List[str]]:
+    """Id e token degli allegati, letti dall'API come farebbe il frontend."""
+    status, body = transport.request('POST', '/api/login', json_body={'username': username, 'password': password})
+    if status != 200:
+        raise SystemExit(f'Login di {username} non riuscito ({status}): popolare il database con benchmarks.datagen')
+    token = json.loads(body)['token']
+    status, body = transport.request('GET', '/api/inventory?fields=id,attachment', token)
+    if status != 200:
+        raise SystemExit(f'Elenco articoli non disponibile ({status})')
+    items = json.loads(body)
+    if not items:
+        raise SystemExit('Nessun articolo: popolare il database con benchmarks.datagen')
+    file_tokens = [item['attachment']['token'] for item in items if item.get('attachment')]
+    return items, file_tokens
+
+
+def run_load(transport, usernames: List[str], password: str, args) -> Dict[str, object]:
+    catalog, file_tokens = _load_catalog(transport, usernames[0], password)
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def worker(index: int) -> None:
+        rng = random.Random(args.seed + index)
+        user = VirtualUser(transport, usernames[index % len(usernames)], password, catalog, file_tokens,
+                           DEFAULT_MIX, rng)
+        operation = 'login'
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                status, _ = user.run(operation)
+            except Exception:  # noqa: BLE001 - un errore di rete conta come richiesta fallita
+                status = 0
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                samples[operation].append(elapsed_ms)
+                if status == 0 or status >= 400:
+                    errors[operation] += 1
+            operation = 'login' if user.token is None else rng.choices(user.operations, user.weights)[0]
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    operations = {}
+    for name in sorted(samples):
+        operations[name] = dict(
+            summarize(samples[name]),
+            errors=errors[name],
+            throughput_rps=round(len(samples[name]) / elapsed, 2),
+        )
+    all_samples = [value for values in samples.values() for value in values]
+    return {
+        'duration_s': round(elapsed, 2),
+        'concurrency': args.concurrency,
+        'articles': len(catalog),
+        'overall': dict(
+            summarize(all_samples),
+            errors=sum(errors.values()),
+            throughput_rps=round(len(all_samples) / elapsed, 2),
+        ),
+        'operations': operations,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='server già avviato; senza, app in-process da create_app')
+    parser.add_argument('--articles', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--tokens-per-user', type=int, default=20)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30, help='secondi di carico')
+    parser.add_argument('--concurrency', type=int, default=8, help='utenti virtuali (thread)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='salva il JSON anche in questo file')
+    args = parser.parse_args()
+
+    if args.url:
+        transport, usernames, dialect = HTTPTransport(args.url), bench_usernames(args.users), None
+    else:
+        transport, usernames, dialect = _prepare_app(args)
+    report = {'meta': dict(run_metadata(dialect), target=args.url or 'in-process')}
+    report.update(run_load(transport, usernames, BENCH_PASSWORD, args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
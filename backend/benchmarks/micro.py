@@ -0,0 +1,66 @@
+"""Micro-benchmark delle funzioni chiamate per ogni riga o richiesta.
+
+Non serve un database popolato: `inventory_to_dict` lavora su un articolo
+in memoria. Da eseguire dalla cartella backend:
+
+    python -m benchmarks.micro --number 20000
+
+Per ogni caso riporta il tempo medio per chiamata (migliore delle ripetizioni).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from typing import Callable, Dict
+
+from app import create_app
+from app.extensions import db
+from app.models import Inventory
+from app.utils import _sign_file_token, generate_file_token, inventory_to_dict, resolve_file_token, safe_int
+from benchmarks.stats import run_metadata
+
+
+def sample_item(foto: str = 'a' * 64 + '.png') -> Inventory:
+    return Inventory(
+        id=1, codice_articolo='CAV-000001', descrizione='cavo tipo2 rame', unita_misura='pz', quantita=10,
+        locazione='M1/Scaffale1/Ripiano1', foto=foto, data_ingresso='2024-01-01', carico=10, scarico=0,
+        created_by='mario', modified_by='mario',
+    )
+
+
+def cases() -> Dict[str, Callable[[], object]]:
+    with_attachment = sample_item()
+    without_attachment = sample_item(foto=None)
+    signed = _sign_file_token(with_attachment.foto)
+    return {
+        'inventory_to_dict': lambda: inventory_to_dict(without_attachment, include_tracking=True),
+        'inventory_to_dict_attachment': lambda: inventory_to_dict(with_attachment, include_tracking=True),
+        'safe_int_str': lambda: safe_int('1234'),
+        'safe_int_int': lambda: safe_int(1234),
+        'safe_int_empty': lambda: safe_int(''),
+        'file_token_sign': lambda: _sign_file_token(with_attachment.foto),
+        'file_token_memoized': lambda: generate_file_token(with_attachment.foto),
+        'file_token_resolve': lambda: resolve_file_token(signed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20_000, help='chiamate per ripetizione')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    results = {}
+    with app.test_request_context():
+        dialect = db.engine.dialect.name
+        for name, run in cases().items():
+            best = min(timeit.repeat(run, number=args.number, repeat=args.repeat))
+            results[name] = {'us_per_call': round(best / args.number * 1_000_000, 3)}
+    print(json.dumps({'meta': run_metadata(dialect), 'number': args.number, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Confronta la ricerca indicizzata con il vecchio filtro ILIKE.
+
+Da eseguire dalla cartella backend su un database di prova (gli articoli
+vengono inseriti davvero):
+
+    DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.search_bench --rows 100000
+
+Su SQLite gli indici trigram non esistono e il confronto mostra solo il
+percorso di fallback.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.inventory.queries import apply_filters
+from app.inventory.search import drop_search_indexes, ensure_search_indexes, search_inventory
+from app.models import Inventory
+from benchmarks.datagen import seed_articles
+
+
+TERMS = ('cavo', 'tipo2 rame', 'INV-004', 'scaffale7', 'fusib', 'xyz-non-esiste')
+
+
+def measure(run: Callable[[str], object], repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        for term in TERMS:
+            started = time.perf_counter()
+            run(term)
+            samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def legacy_filter(term: str) -> object:
+    return apply_filters(Inventory.query, {'descrizione': term}).all()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        seed_articles(args.rows)
+        is_postgres = db.engine.dialect.name == 'postgresql'
+
+        drop_search_indexes(db.engine)
+        if is_postgres:
+            db.session.execute(text('ANALYZE inventory'))
+        report = {
+            'dialect': db.engine.dialect.name,
+            'rows': db.session.query(Inventory.id).count(),
+            'ilike_without_index': measure(legacy_filter, args.repeat),
+        }
+
+        ensure_search_indexes(db.engine)
+        if is_postgres:
+            db.session.execute(text('ANALYZE inventory'))
+        report['ilike_with_trigram_index'] = measure(legacy_filter, args.repeat)
+        report['ranked_search'] = measure(lambda term: search_inventory(term, args.limit), args.repeat)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
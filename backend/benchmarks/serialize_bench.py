@@ -0,0 +1,95 @@
+"""Confronta la serializzazione dell'elenco articoli: ORM + jsonify contro tuple di colonne + provider JSON.
+
+Da eseguire dalla cartella backend su un database di prova (gli articoli
+vengono inseriti davvero, uno su dieci con allegato):
+
+    DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.serialize_bench --rows 20000
+
+Oltre ai tempi verifica che tutte le varianti producano gli stessi byte;
+altrimenti esce con codice 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from flask import jsonify
+
+from app import create_app
+from app.extensions import db
+from app.json_provider import OrjsonJSONProvider, StdlibJSONProvider, orjson
+from app.models import Inventory
+from app.utils import INVENTORY_LIST_COLUMNS, inventory_list_to_dicts, inventory_rows_to_dicts
+from benchmarks.datagen import seed_articles, seed_attachments
+
+
+def orm_jsonify() -> bytes:
+    rows = Inventory.query.all()
+    return jsonify(inventory_list_to_dicts(rows, include_tracking=True)).get_data()
+
+
+def column_rows(provider) -> Callable[[], bytes]:
+    def run() -> bytes:
+        rows = db.session.query(*[getattr(Inventory, name) for name in INVENTORY_LIST_COLUMNS]).all()
+        return provider.dumps(inventory_rows_to_dicts(rows, include_tracking=True))
+
+    return run
+
+
+def measure(run: Callable[[], bytes], repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+        # Ogni giro riparte con la sessione vuota, come una nuova richiesta.
+        db.session.remove()
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    variants = {
+        'orm_jsonify': orm_jsonify,
+        'columns_stdlib': column_rows(StdlibJSONProvider()),
+    }
+    if orjson is not None:
+        variants['columns_orjson'] = column_rows(OrjsonJSONProvider())
+
+    with app.test_request_context():
+        seed_articles(args.rows)
+        seed_attachments(files=50)
+        outputs = {name: run() for name, run in variants.items()}
+        db.session.remove()
+        reference = outputs['orm_jsonify']
+        mismatches = [name for name, output in outputs.items() if output != reference]
+        report = {
+            'dialect': db.engine.dialect.name,
+            'rows': db.session.query(Inventory.id).count(),
+            'response_bytes': len(reference),
+            'mismatches': mismatches,
+        }
+        for name, run in variants.items():
+            report[name] = measure(run, args.repeat)
+
+    print(json.dumps(report, indent=2))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
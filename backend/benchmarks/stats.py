@@ -0,0 +1,46 @@
+"""Riepiloghi comuni ai benchmark, in JSON confrontabile tra commit."""
+
+from __future__ import annotations
+
+import math
+import platform
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+
+def percentile(sorted_samples: Sequence[float], percent: float) -> float:
+    """Percentile nearest-rank di una lista già ordinata."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples_ms: Sequence[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(percentile(ordered, 50), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'max_ms': round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(dialect: Optional[str] = None) -> Dict[str, Optional[str]]:
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'dialect': dialect,
+    }
@@ -0,0 +1,66 @@
+"""Profilo gunicorn di produzione: `gunicorn -c gunicorn.conf.py wsgi:app`.
+
+L'app è caricata una sola volta nel master (`preload_app`): schema,
+migrazioni e indici vengono preparati prima del fork e i worker partono
+già importati, senza connettersi al database. Il carico è I/O-bound
+(PostgreSQL, file, stream SSE che occupano un thread ciascuno), quindi
+pochi processi con molti thread (`gthread`).
+"""
+
+import glob
+import multiprocessing
+import os
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', max(2, min(multiprocessing.cpu_count(), 4))))
+worker_class = 'gthread'
+# Ogni stream SSE (/api/inventory/stream) tiene un thread per tutta la sua
+# durata: EVENTS_MAX_SUBSCRIBERS (default threads // 2) lascia sempre metà dei
+# thread alle altre richieste; oltre il limite lo stream risponde 503.
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+preload_app = True
+# Con gthread il battito del worker non dipende dalla durata delle richieste (export, stream).
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+# File di heartbeat su tmpfs: sull'overlay di Docker le scritture possono bloccarsi.
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+
+# Più worker: le metriche di ciascuno vengono sommate da /metrics (vedi app/metrics.py).
+# Va impostato qui, prima che il preload importi la configurazione dell'app.
+os.environ.setdefault('METRICS_DIR', '/tmp/gestionale-metrics')
+
+
+def on_starting(server):
+    # Le istantanee dei worker di un avvio precedente falserebbero i contatori.
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], 'metrics-*.json')):
+        os.unlink(path)
+
+
+def post_fork(server, worker):
+    app = server.app.callable
+    # Il worker non ha ancora avviato i suoi thread: è il momento sicuro per il fork
+    # dei processi che calcolano gli hash delle password.
+    app.extensions['password_hasher'].start()
+
+    # `--threads` da riga di comando vince su GUNICORN_THREADS: riallinea il limite degli stream.
+    config = app.config
+    if config['EVENTS_MAX_SUBSCRIBERS'] >= worker.cfg.threads:
+        limit = max(1, worker.cfg.threads // 2)
+        server.log.warning(
+            'EVENTS_MAX_SUBSCRIBERS=%s non lascia thread alle API (threads=%s): uso %s',
+            config['EVENTS_MAX_SUBSCRIBERS'], worker.cfg.threads, limit,
+        )
+        config['EVENTS_MAX_SUBSCRIBERS'] = limit
+
+
+def pre_fork(server, worker):
+    # Il preload ha usato il database: nessuna connessione del master va condivisa col worker.
+    from app.database import dispose_engines
+    from app.extensions import db
+
+    dispose_engines(server.app.callable, db)
@@ -0,0 +1,76 @@
+"""Fixture comuni: ogni test ha la sua app con database SQLite e cartelle temporanee."""
+
+import os
+
+# La configurazione viene letta all'import di `app.config`: senza DATABASE_URL
+# le opzioni del pool sarebbero quelle di PostgreSQL.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.config import Config  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+
+PASSWORD = 'Passw0rd!'
+
+
+@pytest.fixture
+def config_overrides():
+    """Da ridefinire in un modulo di test per cambiare la configurazione dell'app."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, config_overrides):
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'SQLALCHEMY_BINDS': None,
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'JOBS_FOLDER': str(tmp_path / 'jobs'),
+        # I job vengono eseguiti dai test, non da thread in background.
+        'JOBS_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_HASH_WORKERS': 0,
+        'THUMBNAIL_SIZE': 0,
+        'TOKEN_REAPER_INTERVAL_SECONDS': 0,
+        'STOCK_CHECKPOINT_INTERVAL_SECONDS': 0,
+        'METRICS_ENABLED': False,
+    }
+    settings.update(config_overrides)
+    for name, value in settings.items():
+        monkeypatch.setattr(Config, name, value)
+    app = create_app()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    def login(username: str = 'mario') -> dict:
+        client.post('/api/register', json={'username': username, 'password': PASSWORD, 'confirm_password': PASSWORD})
+        response = client.post('/api/login', json={'username': username, 'password': PASSWORD})
+        assert response.status_code == 200, response.json
+        return {'Authorization': f"Bearer {response.json['token']}"}
+
+    return login
+
+
+@pytest.fixture
+def auth_headers(login):
+    return login()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.test_request_context():
+        yield
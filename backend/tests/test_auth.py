@@ -0,0 +1,35 @@
+import pytest
+
+
+@pytest.fixture
+def config_overrides():
+    return {'PROXY_FIX_X_FOR': 1, 'LOGIN_MAX_FAILURES_PER_IP': 3, 'LOGIN_MAX_FAILURES_PER_USER': 100}
+
+
+def attempt(client, password: str, forwarded_for: str):
+    return client.post(
+        '/api/login',
+        json={'username': 'mario', 'password': password},
+        headers={'X-Forwarded-For': forwarded_for},
+        environ_base={'REMOTE_ADDR': '172.18.0.3'},
+    )
+
+
+def test_ip_limit_uses_the_client_address_behind_the_proxy(client, login):
+    login('mario')
+    for _ in range(3):
+        assert attempt(client, 'sbagliata', '203.0.113.7').status_code == 401
+    blocked = attempt(client, 'sbagliata', '203.0.113.7')
+    assert blocked.status_code == 429
+    assert int(blocked.headers['Retry-After']) > 0
+
+    # Stesso proxy, altro client: non è bloccato.
+    assert attempt(client, 'Passw0rd!', '198.51.100.20').status_code == 200
+
+
+def test_only_the_trusted_hop_is_used(client, login):
+    login('mario')
+    # Il client può scrivere quello che vuole prima dell'hop aggiunto da nginx.
+    for forged in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+        assert attempt(client, 'sbagliata', f'{forged}, 203.0.113.7').status_code == 401
+    assert attempt(client, 'sbagliata', '4.4.4.4, 203.0.113.7').status_code == 429
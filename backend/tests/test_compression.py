@@ -0,0 +1,166 @@
+import gzip
+import io
+import zlib
+
+import brotli
+import pytest
+import zstandard
+from flask import jsonify
+from werkzeug.datastructures import FileStorage
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+from app.files.storage import save_uploaded_file
+from app.models import Inventory
+from app.utils import generate_file_token
+
+
+DECODERS = {
+    'gzip': gzip.decompress,
+    'br': brotli.decompress,
+    'zstd': lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+# Decodificatori incrementali, per leggere uno stream blocco per blocco.
+STREAM_DECODERS = {
+    'gzip': lambda: zlib.decompressobj(31).decompress,
+    'br': lambda: brotli.Decompressor().process,
+    'zstd': lambda: zstandard.ZstdDecompressor().decompressobj().decompress,
+}
+
+
+@pytest.fixture
+def config_overrides():
+    return {'COMPRESSION_MIN_BYTES': 200, 'EXPORT_CHUNK_SIZE': 5}
+
+
+@pytest.fixture
+def items(app):
+    with app.app_context():
+        db.session.add_all([
+            Inventory(codice_articolo=f'CMP-{index:03}', descrizione='Cavo elettrico tripolare', quantita=index)
+            for index in range(40)
+        ])
+        db.session.commit()
+
+
+def get(client, headers, url: str, encoding=None, **extra):
+    if encoding is not None:
+        extra['Accept-Encoding'] = encoding
+    return client.get(url, headers=dict(headers, **extra))
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('gzip', 'gzip'),
+    ('br', 'br'),
+    ('zstd', 'zstd'),
+    ('gzip, deflate, br, zstd', 'zstd'),
+    ('gzip;q=1.0, br;q=0.5', 'gzip'),
+    ('*', 'zstd'),
+    ('br, zstd;q=0', 'br'),
+])
+def test_negotiated_encoding(client, auth_headers, items, accept, expected):
+    plain = get(client, auth_headers, '/api/inventory')
+    response = get(client, auth_headers, '/api/inventory', accept)
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == expected
+    assert 'Accept-Encoding' in response.vary
+    assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data)
+    assert DECODERS[expected](response.data) == plain.data
+
+
+@pytest.mark.parametrize('accept', [None, 'identity', 'deflate', 'gzip;q=0'])
+def test_identity_when_nothing_acceptable(client, auth_headers, items, accept):
+    response = get(client, auth_headers, '/api/inventory', accept)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    assert response.json[0]['codice_articolo'] == 'CMP-000'
+
+
+def test_small_bodies_stay_uncompressed(client, auth_headers):
+    response = get(client, auth_headers, '/api/inventory', 'gzip')
+    assert response.data == b'[]\n'
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_head_and_errors_are_not_compressed(client, auth_headers, items):
+    head = client.head('/api/inventory', headers=dict(auth_headers, **{'Accept-Encoding': 'gzip'}))
+    assert 'Content-Encoding' not in head.headers
+    missing = get(client, auth_headers, '/api/inventory/999', 'gzip')
+    assert missing.status_code == 404
+    assert 'Content-Encoding' not in missing.headers
+
+
+def test_weak_etag_still_revalidates(client, auth_headers, items):
+    response = get(client, auth_headers, '/api/inventory', 'gzip')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    not_modified = get(client, auth_headers, '/api/inventory', 'br', **{'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert 'Content-Encoding' not in not_modified.headers
+
+
+def test_strong_etag_becomes_weak_once_compressed(app):
+    @app.route('/prova-etag')
+    def strong_etag():
+        response = jsonify({'testo': 'x' * 500})
+        response.set_etag('abc')
+        return response
+
+    client = app.test_client()
+    assert client.get('/prova-etag').headers['ETag'] == '"abc"'
+    compressed = client.get('/prova-etag', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['ETag'] == 'W/"abc"'
+
+
+def test_no_transform_is_respected(app):
+    @app.route('/prova-no-transform')
+    def no_transform():
+        response = jsonify({'testo': 'x' * 500})
+        response.cache_control.no_transform = True
+        return response
+
+    response = app.test_client().get('/prova-no-transform', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_attachments_are_not_compressed(app, client, auth_headers):
+    with app.app_context():
+        key = save_uploaded_file(FileStorage(stream=io.BytesIO(b'%PDF-1.4 ' + b'a' * 5000), filename='scheda.pdf'))
+        db.session.commit()
+        token = generate_file_token(key)
+    response = get(client, auth_headers, f'/api/files/{token}', 'gzip')
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.data) == 5009
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br', 'zstd'])
+def test_streamed_export_is_compressed_chunk_by_chunk(client, auth_headers, items, encoding):
+    plain = get(client, auth_headers, '/api/inventory/export?format=csv').data
+
+    response = client.get(
+        '/api/inventory/export?format=csv',
+        headers=dict(auth_headers, **{'Accept-Encoding': encoding}),
+        buffered=False,
+    )
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Content-Length' not in response.headers
+
+    decode = STREAM_DECODERS[encoding]()
+    chunks = list(response.response)
+    response.close()
+    # Ogni blocco compresso si decodifica da solo: il client vede le righe man mano.
+    first = decode(chunks[0])
+    assert first.startswith(b'Codice Articolo,')
+    # Intestazione più un chunk da EXPORT_CHUNK_SIZE righe.
+    assert first.count(b'\n') == 1 + 5
+    rest = b''.join(decode(chunk) for chunk in chunks[1:])
+    assert first + rest == plain
+    assert len(chunks) > 8
+
+
+def test_disabled_compression(app, monkeypatch):
+    monkeypatch.setattr(Config, 'COMPRESSION_ENABLED', False)
+    disabled = create_app()
+    assert 'response_compressor' not in disabled.extensions
@@ -0,0 +1,79 @@
+import logging
+import runpy
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def config_overrides():
+    return {'EVENTS_MAX_SUBSCRIBERS': 1, 'EVENTS_RETRY_AFTER_SECONDS': 7, 'EVENTS_HEARTBEAT_SECONDS': 0.05}
+
+
+def test_streams_beyond_the_limit_get_503_with_retry_after(client, auth_headers):
+    first = client.get('/api/inventory/stream', headers=auth_headers, buffered=False)
+    assert first.status_code == 200
+    assert next(first.response) == b'retry: 3000\n\n'
+
+    refused = client.get('/api/inventory/stream', headers=auth_headers)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '7'
+
+    # Chiudere lo stream libera il posto.
+    first.close()
+    again = client.get('/api/inventory/stream', headers=auth_headers, buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_events_reach_open_streams(client, auth_headers):
+    stream = client.get('/api/inventory/stream', headers=auth_headers, buffered=False)
+    chunks = iter(stream.response)
+    next(chunks)
+    client.post('/api/inventory', json={'codice_articolo': 'A1', 'carico': 1}, headers=auth_headers)
+    event = next(chunk for chunk in chunks if not chunk.startswith(b':'))
+    stream.close()
+    assert event.startswith(b'event: created\n')
+
+
+def test_gunicorn_caps_subscribers_below_the_thread_count(app, monkeypatch, tmp_path):
+    # Il profilo imposta METRICS_DIR con setdefault: non deve restare nell'ambiente.
+    monkeypatch.setenv('METRICS_DIR', str(tmp_path))
+    hooks = runpy.run_path(str(Path(__file__).resolve().parent.parent / 'gunicorn.conf.py'))
+    server = SimpleNamespace(app=SimpleNamespace(callable=app), log=logging.getLogger('test'))
+
+    app.config['EVENTS_MAX_SUBSCRIBERS'] = 50
+    hooks['post_fork'](server, SimpleNamespace(cfg=SimpleNamespace(threads=16)))
+    assert app.config['EVENTS_MAX_SUBSCRIBERS'] == 8
+
+    app.config['EVENTS_MAX_SUBSCRIBERS'] = 4
+    hooks['post_fork'](server, SimpleNamespace(cfg=SimpleNamespace(threads=16)))
+    assert app.config['EVENTS_MAX_SUBSCRIBERS'] == 4
+
+
+def test_stream_that_never_starts_releases_its_slot(app, client, auth_headers):
+    from werkzeug.test import EnvironBuilder
+
+    environ = EnvironBuilder(path='/api/inventory/stream', headers=auth_headers).get_environ()
+    app_iter = app(environ, lambda status, headers, exc_info=None: None)
+    # Il server chiude la risposta senza averla mai letta: il generatore non parte.
+    app_iter.close()
+    again = client.get('/api/inventory/stream', headers=auth_headers, buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_failing_after_request_hook_releases_the_slot(app, client, auth_headers):
+    from app.inventory.events import get_event_broker
+
+    @app.after_request
+    def explode(response):
+        if response.mimetype == 'text/event-stream':
+            raise RuntimeError('hook rotto')
+        return response
+
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    assert client.get('/api/inventory/stream', headers=auth_headers).status_code == 500
+    with app.app_context():
+        assert get_event_broker().stats()['subscribers'] == 0
@@ -0,0 +1,95 @@
+"""Le query più frequenti devono usare un indice, non una scansione completa della tabella.
+
+Su PostgreSQL il controllo gira con `enable_seqscan = off`: con poche righe il
+planner sceglierebbe comunque la scansione sequenziale, mentre così la sceglie
+solo se nessun indice può servire la query. I casi PostgreSQL girano solo se
+`TEST_POSTGRES_URL` punta a un database di prova (vengono inseriti dati).
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import OperationalError
+
+from app.extensions import db
+from app.inventory.queries import apply_filters
+from app.models import Inventory, Token
+from benchmarks.datagen import seed_articles, seed_tokens, seed_users
+
+
+POSTGRES_URL = os.getenv('TEST_POSTGRES_URL', '')
+
+
+def _hot_queries() -> List[Tuple[str, str, Callable[[], object]]]:
+    """(nome, tabella, statement) delle query da controllare."""
+    horizon = datetime.utcnow() - timedelta(days=365)
+    return [
+        ('inventory by codice_articolo', 'inventory',
+         lambda: select(Inventory.id).where(Inventory.codice_articolo == 'CAV-000123')),
+        ('inventory by locazione', 'inventory',
+         lambda: apply_filters(select(Inventory.id), {'locazione_exact': 'M1/Scaffale1/Ripiano1'})),
+        ('inventory changes since version', 'inventory',
+         lambda: select(Inventory.id).where(Inventory.version > 1_000_000)),
+        ('token lookup', 'token', lambda: select(Token.id).where(Token.token == 'f' * 64)),
+        ('tokens of a user', 'token', lambda: select(Token.id).where(Token.user_id == 1)),
+        ('expired tokens batch', 'token',
+         lambda: select(Token.id).where(Token.expires_at <= horizon).limit(1000)),
+    ]
+
+
+def _postgres_reachable() -> bool:
+    engine = create_engine(POSTGRES_URL)
+    try:
+        with engine.connect():
+            return True
+    except OperationalError:
+        return False
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def config_overrides(request):
+    if request.param == 'sqlite':
+        return {}
+    if not POSTGRES_URL:
+        pytest.skip('TEST_POSTGRES_URL non impostata')
+    if not _postgres_reachable():
+        pytest.skip('PostgreSQL di prova non raggiungibile')
+    return {'SQLALCHEMY_DATABASE_URI': POSTGRES_URL}
+
+
+@pytest.fixture
+def seeded(app_context):
+    seed_articles(2000)
+    seed_users(10)
+    seed_tokens(10, 20)
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE inventory'))
+            connection.execute(text('ANALYZE token'))
+
+
+def explain(connection, statement) -> Tuple[List[str], Callable[[str], bool]]:
+    """Righe del piano e una funzione che dice se la tabella viene letta per intero."""
+    compiled = statement.compile(dialect=connection.dialect)
+    sql = str(compiled)
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql('EXPLAIN ' + sql, compiled.params).scalars().all()
+        return rows, lambda table: any(f'Seq Scan on {table}' in row for row in rows)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+    # SQLite: "SCAN <tabella>" è la scansione completa, "SEARCH ... USING INDEX" no.
+    return rows, lambda table: any(row.split(' USING ')[0] in (f'SCAN {table}', f'SCAN TABLE {table}') for row in rows)
+
+
+@pytest.mark.parametrize('name, table, build', _hot_queries(), ids=[name for name, _, _ in _hot_queries()])
+def test_hot_query_uses_an_index(seeded, name, table, build):
+    with db.engine.connect() as connection, connection.begin():
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SET LOCAL enable_seqscan = off'))
+        plan, is_full_scan = explain(connection, build())
+    assert not is_full_scan(table), '\n'.join(plan)
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+from app.extensions import db
+from app.inventory.export import EXPORT_FIELDS
+from app.models import Inventory
+
+
+HEADERS = [header for _, header in EXPORT_FIELDS]
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+@pytest.fixture
+def config_overrides():
+    # Blocchi piccoli, così ogni export attraversa più chunk.
+    return {'EXPORT_CHUNK_SIZE': 2}
+
+
+@pytest.fixture
+def items(app):
+    with app.app_context():
+        db.session.add_all([
+            Inventory(codice_articolo='EXP-1', descrizione='Cavo, 3 poli', unita_misura='m', quantita=12,
+                      locazione='M1', data_ingresso='2024-01-10'),
+            Inventory(codice_articolo='EXP-2', descrizione='Presa "schuko" <16A> & più', quantita=0),
+            Inventory(codice_articolo='EXP-3', descrizione='Riga\ncon a capo\x01', quantita=5, locazione='M2'),
+            Inventory(codice_articolo='ALTRO', descrizione='Spina', quantita=1, locazione='M1'),
+        ])
+        db.session.commit()
+
+
+def export(client, headers, query: str):
+    response = client.get(f'/api/inventory/export?{query}', headers=headers)
+    assert response.status_code == 200, response.data
+    assert response.is_streamed
+    return response
+
+
+def test_csv_export(client, auth_headers, items):
+    response = export(client, auth_headers, 'format=csv')
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=inventario.csv'
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == HEADERS
+    assert rows[1] == ['EXP-1', 'Cavo, 3 poli', 'm', '12', 'M1', '2024-01-10']
+    assert rows[2] == ['EXP-2', 'Presa "schuko" <16A> & più', '', '0', '', '']
+    assert rows[3][1] == 'Riga\ncon a capo\x01'
+    assert len(rows) == 5
+
+
+def test_csv_is_the_default_format(client, auth_headers, items):
+    assert export(client, auth_headers, '').mimetype == 'text/csv'
+
+
+def test_ndjson_export_applies_the_listing_filters(client, auth_headers, items):
+    response = export(client, auth_headers, 'format=NDJSON&codice_articolo=EXP')
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = response.get_data(as_text=True).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['codice_articolo'] for record in records] == ['EXP-1', 'EXP-2', 'EXP-3']
+    assert list(records[0]) == [field for field, _ in EXPORT_FIELDS]
+    assert records[1]['locazione'] is None
+    assert records[2]['descrizione'] == 'Riga\ncon a capo\x01'
+
+
+def test_xlsx_export(client, auth_headers, items):
+    response = export(client, auth_headers, 'format=xlsx')
+    assert response.headers['Content-Disposition'] == 'attachment; filename=inventario.xlsx'
+
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.testzip() is None
+        assert '[Content_Types].xml' in archive.namelist()
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+
+    rows = []
+    for row in sheet.iter(f'{SHEET_NS}row'):
+        values = []
+        for cell in row:
+            text = ''.join(cell.itertext())
+            values.append(int(text) if cell.get('t') == 'n' else (text if len(cell) else None))
+        rows.append(values)
+
+    assert rows[0] == HEADERS
+    assert rows[1] == ['EXP-1', 'Cavo, 3 poli', 'm', 12, 'M1', '2024-01-10']
+    assert rows[2] == ['EXP-2', 'Presa "schuko" <16A> & più', None, 0, None, None]
+    # I caratteri di controllo non ammessi in XML vengono scartati.
+    assert rows[3][1] == 'Riga\ncon a capo'
+    assert len(rows) == 5
+
+
+def test_empty_export_has_only_the_header(client, auth_headers):
+    response = export(client, auth_headers, 'format=csv')
+    assert response.get_data(as_text=True).splitlines() == [','.join(HEADERS)]
+    assert export(client, auth_headers, 'format=ndjson').data == b''
+
+
+def test_unknown_format_is_400(client, auth_headers):
+    response = client.get('/api/inventory/export?format=pdf', headers=auth_headers)
+    assert response.status_code == 400
+    assert 'pdf' in response.json['message']
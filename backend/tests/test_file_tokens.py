@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from app import utils
+from app.extensions import db
+from app.models import Inventory
+from app.utils import FileTokenMemo, generate_file_token, resolve_file_token
+
+
+@pytest.fixture
+def config_overrides():
+    return {'FILE_TOKEN_TTL_SECONDS': 400, 'FILE_TOKEN_BUCKET_SECONDS': 100}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {'value': 1_000_000.0}
+    monkeypatch.setattr(time, 'time', lambda: now['value'])
+    return now
+
+
+@pytest.fixture
+def items(app):
+    with app.app_context():
+        db.session.add_all([
+            Inventory(codice_articolo='TOK-1', foto='scheda.pdf'),
+            Inventory(codice_articolo='TOK-2', foto='scheda.pdf'),
+            Inventory(codice_articolo='TOK-3'),
+        ])
+        db.session.commit()
+
+
+def tokens(client, headers, url: str = '/api/inventory'):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    listing = response.json['items'] if isinstance(response.json, dict) else response.json
+    return {
+        item['codice_articolo']: item.get('attachment', {}).get('token')
+        for item in listing
+    }
+
+
+def test_listings_reuse_tokens_within_a_window(client, auth_headers, items, clock):
+    first = tokens(client, auth_headers)
+    assert first['TOK-1'] is not None
+    assert first['TOK-1'] == first['TOK-2']
+    assert first['TOK-3'] is None
+
+    clock['value'] += 30
+    assert tokens(client, auth_headers) == first
+    assert tokens(client, auth_headers, '/api/inventory?limit=2')['TOK-1'] == first['TOK-1']
+    search = client.get('/api/inventory/search?q=TOK', headers=auth_headers).json
+    assert search[0]['attachment']['token'] == first['TOK-1']
+
+    # Nella finestra successiva il token viene firmato di nuovo.
+    clock['value'] += 100
+    assert tokens(client, auth_headers)['TOK-1'] != first['TOK-1']
+
+
+def test_reused_token_stays_valid_for_ttl_minus_window(app, client, auth_headers, items, clock):
+    clock['value'] = 1_000_099.0
+    token = tokens(client, auth_headers)['TOK-1']
+    # Firmato alla fine della finestra: a partire da lì vale per tutto il TTL.
+    with app.app_context():
+        clock['value'] = 1_000_099.0 + 300
+        assert resolve_file_token(token) == 'scheda.pdf'
+        clock['value'] += 101
+        with pytest.raises(ValueError):
+            resolve_file_token(token)
+
+
+def test_tokens_are_signed_per_call_without_reuse(app, clock):
+    app.config['FILE_TOKEN_BUCKET_SECONDS'] = 0
+    with app.app_context():
+        first = generate_file_token('scheda.pdf')
+        clock['value'] += 1
+        assert generate_file_token('scheda.pdf') != first
+        assert app.extensions.get('file_token_memo') is None
+        assert generate_file_token(None) is None
+
+
+def test_memo_evicts_the_least_recently_used_entry():
+    memo = FileTokenMemo(max_entries=2)
+    calls = []
+
+    def sign(value):
+        return lambda: calls.append(value) or value
+
+    memo.get_or_create(('a', 1), sign('A'))
+    memo.get_or_create(('b', 1), sign('B'))
+    assert memo.get_or_create(('a', 1), sign('A2')) == 'A'
+    memo.get_or_create(('c', 1), sign('C'))
+    assert memo.get_or_create(('a', 1), sign('A3')) == 'A'
+    assert memo.get_or_create(('b', 1), sign('B2')) == 'B2'
+    assert calls == ['A', 'B', 'C', 'B2']
+
+
+def test_bucket_helpers(app, clock):
+    with app.app_context():
+        assert utils.current_file_token_bucket() == 10_000
+        app.config['FILE_TOKEN_BUCKET_SECONDS'] = 0
+        assert utils.current_file_token_bucket() is None
@@ -0,0 +1,111 @@
+import io
+from pathlib import Path
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app.extensions import db
+from app.files.storage import save_uploaded_file, upload_root
+from app.utils import generate_file_token
+
+
+CONTENT = b'%PDF-1.4 contenuto di prova per le richieste parziali'
+
+
+@pytest.fixture
+def blob(app):
+    """(token, chiave) di un PDF salvato per contenuto."""
+    with app.app_context():
+        key = save_uploaded_file(FileStorage(stream=io.BytesIO(CONTENT), filename='scheda.pdf'))
+        db.session.commit()
+        return generate_file_token(key), key
+
+
+def fetch(client, headers, token: str, **extra):
+    return client.get(f'/api/files/{token}', headers=dict(headers, **extra))
+
+
+def test_full_download_has_a_strong_content_etag(client, auth_headers, blob):
+    token, key = blob
+    response = fetch(client, auth_headers, token)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['ETag'] == f'"{Path(key).stem}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.mimetype == 'application/pdf'
+    assert response.cache_control.private
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 3600
+    assert 'Expires' not in response.headers
+
+
+def test_revalidation_answers_304(client, auth_headers, blob):
+    token, _ = blob
+    etag = fetch(client, auth_headers, token).headers['ETag']
+    response = fetch(client, auth_headers, token, **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+@pytest.mark.parametrize('byte_range, start, end', [
+    ('bytes=0-3', 0, 3),
+    ('bytes=5-', 5, len(CONTENT) - 1),
+    ('bytes=-6', len(CONTENT) - 6, len(CONTENT) - 1),
+])
+def test_range_requests(client, auth_headers, blob, byte_range, start, end):
+    token, _ = blob
+    response = fetch(client, auth_headers, token, Range=byte_range)
+    assert response.status_code == 206
+    assert response.data == CONTENT[start:end + 1]
+    assert response.headers['Content-Range'] == f'bytes {start}-{end}/{len(CONTENT)}'
+
+
+def test_unsatisfiable_range_is_416(client, auth_headers, blob):
+    token, _ = blob
+    response = fetch(client, auth_headers, token, Range=f'bytes={len(CONTENT) + 10}-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_if_range_only_honours_the_current_etag(client, auth_headers, blob):
+    token, _ = blob
+    etag = fetch(client, auth_headers, token).headers['ETag']
+
+    resumed = fetch(client, auth_headers, token, Range='bytes=10-', **{'If-Range': etag})
+    assert resumed.status_code == 206
+    assert resumed.data == CONTENT[10:]
+
+    stale = fetch(client, auth_headers, token, Range='bytes=10-', **{'If-Range': '"altro"'})
+    assert stale.status_code == 200
+    assert stale.data == CONTENT
+
+
+def test_legacy_files_fall_back_to_werkzeug_etag(app, client, auth_headers):
+    with app.app_context():
+        (upload_root() / 'vecchio.pdf').write_bytes(CONTENT)
+        token = generate_file_token('vecchio.pdf')
+    response = fetch(client, auth_headers, token)
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert fetch(client, auth_headers, token, Range='bytes=0-3').data == CONTENT[:4]
+
+
+def test_missing_and_invalid_tokens(app, client, auth_headers):
+    with app.app_context():
+        missing = generate_file_token('sparito.pdf')
+    assert fetch(client, auth_headers, missing).status_code == 404
+    assert fetch(client, auth_headers, 'non-un-token').status_code == 400
+    assert client.get(f'/api/files/{missing}').status_code == 401
+
+
+def test_offload_to_the_proxy(app, client, auth_headers, blob):
+    token, key = blob
+    app.config['FILES_ACCEL_REDIRECT_PREFIX'] = '/protected/'
+    response = fetch(client, auth_headers, token, **{'X-Files-Offload': '1'})
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f'/protected/{key}'
+    assert response.data == b''
+    assert response.cache_control.immutable
+    # Senza l'intestazione del proxy il file viene servito dall'app.
+    assert fetch(client, auth_headers, token).data == CONTENT
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from app.auth import hashing
+from app.auth.hashing import PasswordHasher, PasswordHasherBusy
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, max_pending=1, timeout=0.05)
+    # Come in post_fork: il processo del pool esiste già, il timeout misura solo l'hash.
+    hasher.start()
+    yield hasher
+    hasher._reset_executor()
+
+
+def wait_until(condition, seconds: float = 5) -> None:
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_hash_and_verify_in_the_pool(hasher):
+    password_hash = hasher.hash('Passw0rd!')
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(password_hash, 'Passw0rd!')
+    assert not hasher.verify(password_hash, 'sbagliata')
+    assert hasher.stats()['pending'] == 0
+
+
+def test_timed_out_work_keeps_its_slot_until_it_finishes(hasher):
+    with pytest.raises(PasswordHasherBusy):
+        hasher._run(time.sleep, 0.5)
+    assert hasher.stats()['timed_out'] == 1
+    # Il processo sta ancora lavorando: niente nuovi hash oltre il limite.
+    assert hasher.stats()['pending'] == 1
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('Passw0rd!')
+    assert hasher.stats()['rejected'] == 1
+
+    wait_until(lambda: hasher.stats()['pending'] == 0)
+    assert hasher.hash('Passw0rd!')
+
+
+def test_inline_hashing_releases_the_slot():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=0, max_pending=1, timeout=0.05)
+    for _ in range(3):
+        assert hasher.verify(hasher.hash('Passw0rd!'), 'Passw0rd!')
+    assert hasher.stats()['pending'] == 0
+
+
+def test_timed_out_hash_is_not_counted_as_completed(hasher):
+    with pytest.raises(PasswordHasherBusy):
+        hasher._run(time.sleep, 0.2)
+    wait_until(lambda: hasher.stats()['pending'] == 0)
+    assert hasher.stats()['timed_out'] == 1
+    assert hasher.stats()['completed'] == 0
+
+    hasher.hash('Passw0rd!')
+    assert hasher.stats()['completed'] == 1
+
+
+def test_start_forks_every_pool_process_up_front(monkeypatch):
+    # Come in post_fork: il worker non ha ancora altri thread.
+    monkeypatch.setattr(hashing.threading, 'active_count', lambda: 1)
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=2, max_pending=2, timeout=5)
+    try:
+        hasher.start()
+        assert len(hasher._executor._processes) == 2
+        assert hasher.stats()['completed'] == 0
+    finally:
+        hasher._reset_executor()
+
+
+def test_pool_is_not_forked_from_a_threaded_process(monkeypatch):
+    monkeypatch.setattr(hashing.threading, 'active_count', lambda: 1)
+    assert hashing._pool_context().get_start_method() == 'fork'
+    monkeypatch.setattr(hashing.threading, 'active_count', lambda: 8)
+    assert hashing._pool_context().get_start_method() == 'forkserver'
@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.extensions import db
+
+
+@pytest.fixture
+def config_overrides():
+    return {'HEALTH_DB_CHECK_SECONDS': 3600}
+
+
+@pytest.fixture
+def engine(app):
+    with app.app_context():
+        return db.engine
+
+
+@pytest.fixture
+def readiness(app):
+    return app.extensions['readiness_check']
+
+
+@pytest.fixture
+def statements(engine):
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def database_down(engine, monkeypatch):
+    def connect(*args, **kwargs):
+        raise OperationalError('SELECT 1', {}, Exception('connessione rifiutata'))
+
+    def down():
+        monkeypatch.setattr(engine, 'connect', connect)
+
+    return down
+
+
+def test_liveness_never_touches_the_database(client, statements, database_down):
+    database_down()
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.json == {'status': 'ok'}
+    assert statements == []
+
+
+def test_readiness_checks_the_database_once_per_interval(client, readiness, statements):
+    for _ in range(3):
+        response = client.get('/readyz')
+        assert response.status_code == 200
+        assert response.json == {'status': 'ok'}
+    assert statements == ['SELECT 1']
+    assert readiness.stats() == {'ready': True, 'checks': 1, 'failures': 0}
+
+
+def test_unreachable_database_is_503(client, readiness, database_down):
+    readiness.interval_seconds = 0
+    assert client.get('/readyz').status_code == 200
+
+    database_down()
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.json['status'] == 'unavailable'
+    assert readiness.stats() == {'ready': False, 'checks': 2, 'failures': 1}
+    # La liveness resta ok: il processo non va riavviato.
+    assert client.get('/healthz').status_code == 200
+
+
+def test_cached_result_is_served_while_a_check_runs(client, readiness, statements):
+    assert client.get('/readyz').status_code == 200
+    readiness.interval_seconds = 0
+    with readiness._lock:
+        # Un altro thread sta verificando: la sonda non aspetta e non rifà la query.
+        assert client.get('/readyz').status_code == 200
+    assert statements == ['SELECT 1']
+
+
+def test_probes_need_no_token(client):
+    assert client.get('/healthz', headers={'Authorization': 'Bearer non-valido'}).status_code == 200
+    assert client.get('/readyz').status_code == 200
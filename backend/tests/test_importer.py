@@ -0,0 +1,172 @@
+import io
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.inventory.importer import detect_import_format, import_inventory
+from app.inventory.versioning import current_inventory_version
+from app.models import Inventory, StockMovement
+
+
+def run_import(content: str, import_format: str = 'csv', max_errors: int = 10):
+    return import_inventory(io.StringIO(content), import_format, 'mario', batch_size=2, max_errors=max_errors)
+
+
+@pytest.fixture
+def statements(app_context):
+    """SQL eseguito sulla connessione, nell'ordine."""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(' '.join(statement.split()))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_version_counter_is_locked_after_the_articles(statements):
+    db.session.add(Inventory(codice_articolo='IMP-1', carico=1, scarico=0, quantita=1))
+    db.session.commit()
+    version = current_inventory_version()
+    statements.clear()
+
+    run_import('codice_articolo,quantita\nIMP-1,5\nIMP-2,3\n')
+
+    def position(prefix: str, last: bool = False) -> int:
+        matches = [index for index, statement in enumerate(statements) if statement.startswith(prefix)]
+        assert matches, prefix
+        return matches[-1] if last else matches[0]
+
+    counter = position('UPDATE inventory_version')
+    # Tutte le scritture sugli articoli precedono il lock sul contatore...
+    assert position('UPDATE inventory SET descrizione', last=True) < counter
+    assert position('INSERT INTO inventory ', last=True) < counter
+    assert position('INSERT INTO stock_movement', last=True) < counter
+    # ...e la versione definitiva viene scritta subito dopo.
+    assert position('UPDATE inventory SET version') > counter
+
+    new_version = current_inventory_version()
+    assert new_version == version + 1
+    assert {row.codice_articolo: row.version for row in Inventory.query} == {'IMP-1': new_version, 'IMP-2': new_version}
+
+
+def test_import_without_valid_rows_keeps_the_version(statements):
+    version = current_inventory_version()
+    statements.clear()
+
+    result = run_import('codice_articolo,quantita\n,5\n')
+
+    assert result['inserted'] == result['updated'] == 0
+    assert not any(statement.startswith('UPDATE inventory_version') for statement in statements)
+    assert current_inventory_version() == version
+
+
+def ledger(codice: str):
+    return [
+        (row.kind, row.carico, row.scarico)
+        for row in StockMovement.query.filter_by(codice_articolo=codice).order_by(StockMovement.id)
+    ]
+
+
+def test_insert_and_update_counts_with_ledger_adjustments(app_context):
+    db.session.add(Inventory(codice_articolo='OLD-1', descrizione='Cavo', carico=10, scarico=4, quantita=6))
+    db.session.add(Inventory(codice_articolo='OLD-2', descrizione='Presa', carico=3, scarico=0, quantita=3))
+    db.session.commit()
+
+    result = run_import(
+        'Codice Articolo,Descrizione,Quantità,Locazione\n'
+        'OLD-1,,9,M1/Scaffale2\n'
+        'OLD-2,Presa schuko,,\n'
+        'NEW-1,Interruttore,5,M2\n'
+    )
+
+    assert (result['inserted'], result['updated']) == (1, 2)
+    assert (result['valid_rows'], result['error_count']) == (3, 0)
+    rows = {row.codice_articolo: row for row in Inventory.query}
+    # Una quantità presente diventa la giacenza; le colonne vuote non sovrascrivono.
+    old = rows['OLD-1']
+    assert (old.descrizione, old.locazione, old.carico, old.scarico, old.quantita) == ('Cavo', 'M1/Scaffale2', 13, 4, 9)
+    assert (rows['OLD-2'].descrizione, rows['OLD-2'].quantita) == ('Presa schuko', 3)
+    new = rows['NEW-1']
+    assert (new.carico, new.scarico, new.quantita, new.created_by) == (5, 0, 5, 'mario')
+
+    assert ledger('OLD-1') == [('import', 3, 0)]
+    assert ledger('OLD-2') == []
+    assert ledger('NEW-1') == [('import', 5, 0)]
+
+
+def test_error_report_is_capped_at_max_errors(app_context):
+    result = run_import(
+        'codice_articolo,quantita\n'
+        'A,1\n'
+        ',2\n'
+        'B,-1\n'
+        'C,tre\n'
+        'A,4\n'
+        f"{'X' * 60},1\n",
+        max_errors=3,
+    )
+
+    assert (result['inserted'], result['valid_rows'], result['error_count']) == (1, 1, 5)
+    assert result['errors_truncated'] is True
+    assert [error['line'] for error in result['errors']] == [3, 4, 5]
+    assert result['errors'][0] == {'line': 3, 'codice_articolo': None, 'message': 'Codice articolo mancante'}
+    assert [row.codice_articolo for row in Inventory.query] == ['A']
+
+
+def test_ndjson_import(app_context):
+    result = run_import(
+        '{"codice_articolo": "N-1", "quantita": 2, "locazione": "M3"}\n'
+        '\n'
+        'non json\n'
+        '[1, 2]\n'
+        '{"codice_articolo": "N-2"}\n',
+        import_format='ndjson',
+    )
+
+    assert (result['inserted'], result['updated'], result['error_count']) == (2, 0, 2)
+    assert [error['message'] for error in result['errors']] == ['JSON non valido', 'Ogni riga deve essere un oggetto JSON']
+    assert {row.codice_articolo: row.quantita for row in Inventory.query} == {'N-1': 2, 'N-2': 0}
+
+
+def test_csv_without_code_column_is_rejected(app_context):
+    with pytest.raises(ValueError):
+        run_import('descrizione,quantita\nCavo,1\n')
+    assert Inventory.query.count() == 0
+
+
+@pytest.mark.parametrize('explicit, content_type, filename, expected', [
+    ('NDJSON', 'text/csv', 'a.csv', 'ndjson'),
+    (None, '', 'articoli.jsonl', 'ndjson'),
+    (None, '', 'articoli.NDJSON', 'ndjson'),
+    (None, 'multipart/form-data', 'articoli.csv', 'csv'),
+    (None, 'application/x-ndjson', None, 'ndjson'),
+    (None, 'text/plain', None, 'csv'),
+    ('xlsx', '', None, 'xlsx'),
+])
+def test_format_detection(explicit, content_type, filename, expected):
+    assert detect_import_format(explicit, content_type, filename) == expected
+
+
+def test_import_endpoint(client, auth_headers):
+    response = client.post(
+        '/api/inventory/import',
+        data={'file': (io.BytesIO('\ufeffcodice_articolo,quantita\nEP-1,3\n'.encode('utf-8')), 'articoli.csv')},
+        headers=auth_headers,
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 200, response.json
+    assert (response.json['inserted'], response.json['updated']) == (1, 0)
+
+    raw = client.post(
+        '/api/inventory/import',
+        data='{"codice_articolo": "EP-1", "quantita": 1}\n',
+        headers=dict(auth_headers, **{'Content-Type': 'application/x-ndjson'}),
+    )
+    assert raw.status_code == 200, raw.json
+    assert (raw.json['inserted'], raw.json['updated']) == (0, 1)
+
+    unsupported = client.post('/api/inventory/import?format=xlsx', data='x', headers=auth_headers)
+    assert unsupported.status_code == 400
@@ -0,0 +1,231 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.jobs.runner import (
+    JOB_KINDS,
+    RESULT_SUFFIX,
+    STATUS_FAILED,
+    STATUS_QUEUED,
+    STATUS_RUNNING,
+    STATUS_SUCCEEDED,
+    JobContext,
+    JobKind,
+    claim_next_job,
+    create_job,
+    execute_job,
+    job_file,
+    purge_finished_jobs,
+    requeue_stale_jobs,
+)
+from app.models import Job
+
+
+def run_queued_jobs(app) -> int:
+    """Esegue i job in coda come farebbe un worker del JobPool."""
+    executed = 0
+    with app.app_context():
+        while True:
+            job_id = claim_next_job()
+            if job_id is None:
+                return executed
+            execute_job(job_id, progress_interval=0)
+            executed += 1
+
+
+def add_items(client, headers, count: int) -> None:
+    for index in range(count):
+        response = client.post(
+            '/api/inventory',
+            json={'codice_articolo': f'ART-{index:03d}', 'carico': index + 1, 'locazione': 'M1/Scaffale1'},
+            headers=headers,
+        )
+        assert response.status_code == 201
+
+
+@pytest.fixture
+def echo_kind(monkeypatch):
+    """Tipo di job di prova: restituisce i parametri o fallisce su richiesta."""
+
+    def run(context: JobContext):
+        if context.params.get('fail'):
+            raise ValueError('Parametri non validi')
+        if context.params.get('crash'):
+            raise RuntimeError('boom')
+        return {'echo': context.params}
+
+    def prepare(job_id: str):
+        from flask import request
+
+        return (request.get_json(silent=True) or {}).get('params') or {}
+
+    monkeypatch.setitem(JOB_KINDS, 'echo', JobKind(prepare, run))
+    return 'echo'
+
+
+def _insert_job(job_id: str, status: str = STATUS_QUEUED, **values) -> None:
+    db.session.add(Job(id=job_id, kind='echo', status=status, created_by='mario', **values))
+    db.session.commit()
+
+
+def test_jobs_are_claimed_once_in_creation_order(app):
+    with app.app_context():
+        now = datetime.utcnow()
+        _insert_job('b' * 32, created_at=now)
+        _insert_job('a' * 32, created_at=now - timedelta(seconds=5))
+
+        assert claim_next_job() == 'a' * 32
+        assert claim_next_job() == 'b' * 32
+        assert claim_next_job() is None
+
+        job = db.session.get(Job, 'a' * 32)
+        assert job.status == STATUS_RUNNING
+        assert job.attempts == 1
+        assert job.started_at is not None and job.heartbeat_at is not None
+
+
+def test_claim_ignores_jobs_taken_by_another_worker(app):
+    with app.app_context():
+        _insert_job('a' * 32, status=STATUS_RUNNING, attempts=1)
+        _insert_job('b' * 32, status=STATUS_SUCCEEDED)
+        assert claim_next_job() is None
+
+
+def test_stale_running_jobs_are_requeued_until_max_attempts(app):
+    with app.app_context():
+        old = datetime.utcnow() - timedelta(seconds=600)
+        _insert_job('a' * 32, status=STATUS_RUNNING, attempts=1, heartbeat_at=old)
+        _insert_job('b' * 32, status=STATUS_RUNNING, attempts=3, heartbeat_at=old)
+        _insert_job('c' * 32, status=STATUS_RUNNING, attempts=1, heartbeat_at=datetime.utcnow())
+
+        assert requeue_stale_jobs(stale_seconds=120, max_attempts=3) == 1
+
+        statuses = {job.id[0]: job for job in Job.query.all()}
+        assert statuses['a'].status == STATUS_QUEUED
+        assert statuses['b'].status == STATUS_FAILED
+        assert statuses['b'].error == 'Job interrotto troppe volte'
+        assert statuses['c'].status == STATUS_RUNNING
+        assert claim_next_job() == 'a' * 32
+        assert db.session.get(Job, 'a' * 32).attempts == 2
+
+
+def test_export_job_reports_progress_and_serves_result(app, client, auth_headers):
+    add_items(client, auth_headers, 5)
+    response = client.post('/api/jobs', json={'kind': 'export', 'params': {'format': 'csv'}}, headers=auth_headers)
+    assert response.status_code == 202
+    assert response.json['status'] == STATUS_QUEUED
+    status_url = response.headers['Location']
+
+    assert run_queued_jobs(app) == 1
+
+    job = client.get(status_url, headers=auth_headers).json
+    assert job['status'] == STATUS_SUCCEEDED
+    assert job['progress'] == {'done': 5, 'total': 5, 'percent': 100}
+    assert job['result'] == {'rows': 5, 'format': 'csv'}
+
+    download = client.get(job['result_url'], headers=auth_headers)
+    body = download.get_data(as_text=True)
+    download.close()
+    assert download.status_code == 200
+    assert 'inventario.csv' in download.headers['Content-Disposition']
+    assert all(f'ART-{index:03d}' in body for index in range(5))
+
+
+def test_job_status_and_result_are_scoped_to_owner(app, client, login):
+    owner = login('mario')
+    other = login('luigi')
+    add_items(client, owner, 1)
+    job_id = client.post('/api/jobs', json={'kind': 'export', 'params': {}}, headers=owner).json['id']
+    run_queued_jobs(app)
+
+    assert client.get(f'/api/jobs/{job_id}', headers=other).status_code == 404
+    assert client.get(f'/api/jobs/{job_id}/result', headers=other).status_code == 404
+    response = client.get(f'/api/jobs/{job_id}/result', headers=owner)
+    response.close()
+    assert response.status_code == 200
+
+
+def test_result_is_unavailable_until_job_succeeds(app, client, auth_headers):
+    job_id = client.post('/api/jobs', json={'kind': 'export', 'params': {}}, headers=auth_headers).json['id']
+    assert client.get(f'/api/jobs/{job_id}/result', headers=auth_headers).status_code == 409
+
+    run_queued_jobs(app)
+    with app.app_context():
+        job_file(job_id, RESULT_SUFFIX).unlink()
+    assert client.get(f'/api/jobs/{job_id}/result', headers=auth_headers).status_code == 410
+
+
+def test_invalid_job_requests_are_rejected(client, auth_headers):
+    response = client.post('/api/jobs', json={'kind': 'sconosciuto'}, headers=auth_headers)
+    assert response.status_code == 400
+    response = client.post('/api/jobs', json={'kind': 'export', 'params': {'format': 'zip'}}, headers=auth_headers)
+    assert response.status_code == 400
+    assert 'Formato export non supportato' in response.json['message']
+
+
+def test_failed_jobs_record_the_error(app, client, auth_headers, echo_kind):
+    failing = client.post('/api/jobs', json={'kind': echo_kind, 'params': {'fail': True}}, headers=auth_headers)
+    crashing = client.post('/api/jobs', json={'kind': echo_kind, 'params': {'crash': True}}, headers=auth_headers)
+    working = client.post('/api/jobs', json={'kind': echo_kind, 'params': {'x': 1}}, headers=auth_headers)
+    run_queued_jobs(app)
+
+    failed = client.get(f"/api/jobs/{failing.json['id']}", headers=auth_headers).json
+    assert failed['status'] == STATUS_FAILED
+    assert failed['error'] == 'Parametri non validi'
+    crashed = client.get(f"/api/jobs/{crashing.json['id']}", headers=auth_headers).json
+    assert crashed['status'] == STATUS_FAILED
+    # I dettagli delle eccezioni inattese restano nei log.
+    assert crashed['error'] == 'Errore interno durante il job'
+    succeeded = client.get(f"/api/jobs/{working.json['id']}", headers=auth_headers).json
+    assert succeeded['result'] == {'echo': {'x': 1}}
+    assert 'result_url' not in succeeded
+
+
+def test_progress_updates_are_throttled(app, echo_kind):
+    with app.test_request_context(json={'params': {}}):
+        job = create_job(echo_kind, 'mario')
+        context = JobContext(job, progress_interval=3600)
+
+        context.progress(10, 100)
+        context.progress(20, 100)
+        db.session.expire_all()
+        assert (job.progress, job.total) == (10, 100)
+
+        context.progress(30, 100, force=True)
+        db.session.expire_all()
+        assert job.progress == 30
+
+
+def test_import_job_creates_items(app, client, auth_headers):
+    csv = 'codice_articolo,descrizione,quantita,locazione\nIMP-1,Cavo,4,M2/Scaffale3\nIMP-2,Presa,2,M2/Scaffale3\n'
+    response = client.post(
+        '/api/jobs',
+        data={'kind': 'import', 'file': (io.BytesIO(csv.encode()), 'articoli.csv')},
+        headers=auth_headers,
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 202
+    run_queued_jobs(app)
+
+    job = client.get(response.headers['Location'], headers=auth_headers).json
+    assert job['status'] == STATUS_SUCCEEDED, job
+    codes = {item['codice_articolo'] for item in client.get('/api/inventory', headers=auth_headers).json}
+    assert codes == {'IMP-1', 'IMP-2'}
+    with app.app_context():
+        assert not job_file(job['id'], '.input').exists()
+
+
+def test_purge_removes_expired_jobs_and_results(app, client, auth_headers):
+    job_id = client.post('/api/jobs', json={'kind': 'export', 'params': {}}, headers=auth_headers).json['id']
+    run_queued_jobs(app)
+    with app.app_context():
+        result = job_file(job_id, RESULT_SUFFIX)
+        assert result.exists()
+        assert purge_finished_jobs(ttl_seconds=3600) == 0
+        db.session.query(Job).update({'finished_at': datetime.utcnow() - timedelta(hours=2)})
+        db.session.commit()
+        assert purge_finished_jobs(ttl_seconds=3600) == 1
+        assert not result.exists()
+        assert Job.query.count() == 0
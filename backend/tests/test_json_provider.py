@@ -0,0 +1,81 @@
+from datetime import date, datetime
+
+import pytest
+from flask import jsonify
+
+from app import json_provider
+from app.extensions import db
+from app.json_provider import OrjsonJSONProvider, StdlibJSONProvider, get_json_provider, json_response
+from app.models import Inventory
+
+
+PAYLOADS = [
+    [],
+    {'b': 1, 'a': [True, False, None], 'c': {'z': '', 'y': 'testo'}},
+    'àèìòù €',
+    'emoji 📦 e \U0001f600',
+    'controllo \x00\x01\x1f\t\n\r "virgolette" \\ / \x7f',
+    '</script> & <b>',
+    {'zero': 0, 'negativo': -42, 'grande': 2 ** 63 - 1, 'enorme': 2 ** 70},
+    [1.5, 0.1, -0.0, 1e16, 1e-05, 123456789.123, 1e300],
+    {'testo con numeri': 'Cavo 2.5mm, ore 10:30.5, [1.5]'},
+    {1: 'chiave intera'},
+    {'data': date(2024, 1, 10), 'istante': datetime(2024, 1, 10, 8, 30, 5)},
+    ('tupla', 1),
+]
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+@pytest.mark.parametrize('provider', [StdlibJSONProvider(), OrjsonJSONProvider()], ids=lambda p: p.name)
+def test_output_is_byte_identical_to_jsonify(app_context, provider, payload):
+    assert provider.dumps(payload) == jsonify(payload).get_data()
+
+
+def test_output_without_ascii_escapes(app, app_context):
+    app.config['JSON_AS_ASCII'] = False
+    payload = {'descrizione': 'Presa schuko àè 📦'}
+    assert OrjsonJSONProvider().dumps(payload) == jsonify(payload).get_data()
+
+
+def test_unsorted_keys(app, app_context):
+    app.config['JSON_SORT_KEYS'] = False
+    payload = {'b': 1, 'a': 2}
+    assert OrjsonJSONProvider().dumps(payload) == jsonify(payload).get_data() == b'{"b":1,"a":2}\n'
+
+
+@pytest.mark.parametrize('name, expected', [('auto', 'orjson'), ('orjson', 'orjson'), ('STDLIB', 'stdlib')])
+def test_provider_selection(app, name, expected):
+    app.config['JSON_PROVIDER'] = name
+    json_provider.init_app(app)
+    with app.app_context():
+        assert get_json_provider().name == expected
+
+
+def test_unknown_provider(app):
+    app.config['JSON_PROVIDER'] = 'simplejson'
+    with pytest.raises(RuntimeError):
+        json_provider.init_app(app)
+
+
+def test_pretty_print_uses_jsonify(app, app_context):
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+    assert json_response({'a': 1}).get_data() == jsonify({'a': 1}).get_data()
+
+
+def test_listing_bytes_do_not_depend_on_the_provider(app, client, auth_headers):
+    with app.app_context():
+        db.session.add_all([
+            Inventory(codice_articolo='JS-1', descrizione='Cavo 2,5 mm² — «rosso»', quantita=3, foto='scheda.pdf'),
+            Inventory(codice_articolo='JS-2', descrizione='Presa 📦', locazione='M1'),
+        ])
+        db.session.commit()
+
+    bodies = {}
+    for name in ('stdlib', 'orjson'):
+        app.config['JSON_PROVIDER'] = name
+        json_provider.init_app(app)
+        for url in ('/api/inventory', '/api/inventory?limit=1&sort=-codice_articolo'):
+            response = client.get(url, headers=auth_headers)
+            assert response.status_code == 200
+            bodies.setdefault(url, set()).add((response.data, response.headers['ETag']))
+    assert all(len(variants) == 1 for variants in bodies.values())
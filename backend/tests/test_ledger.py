@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.inventory.checkpointer import get_stock_checkpointer
+from app.inventory.ledger import KIND_OPENING, checkpoint_stock, stock_as_of
+from app.models import Inventory, StockCheckpoint, StockMovement
+
+
+@pytest.fixture
+def config_overrides():
+    return {'STOCK_CHECKPOINT_MIN_MOVEMENTS': 2, 'STOCK_CHECKPOINT_LAG_SECONDS': 0}
+
+
+@pytest.fixture
+def item_id(app, client, auth_headers):
+    response = client.post('/api/inventory', json={'codice_articolo': 'LED-1', 'carico': 10}, headers=auth_headers)
+    assert response.status_code == 201, response.json
+    with app.app_context():
+        return Inventory.query.filter_by(codice_articolo='LED-1').one().id
+
+
+def move(client, headers, item_id: int, carico: int = 0, scarico: int = 0) -> None:
+    response = client.post(
+        '/api/inventory/movements',
+        json={'movements': [{'id': item_id, 'carico': carico, 'scarico': scarico}]},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.json
+
+
+def backdate_movements(seconds: int) -> None:
+    for movement in StockMovement.query:
+        movement.created_at -= timedelta(seconds=seconds)
+    db.session.commit()
+
+
+def test_stock_as_of_matches_with_and_without_checkpoints(app, client, auth_headers, item_id):
+    for carico, scarico in ((5, 0), (0, 3), (2, 1)):
+        move(client, auth_headers, item_id, carico, scarico)
+    expected = {'carico': 17, 'scarico': 4, 'quantita': 13}
+
+    with app.app_context():
+        before = stock_as_of(item_id, datetime.utcnow())
+        assert {key: before[key] for key in expected} == expected
+        assert before['checkpoint_movement_id'] is None
+
+        assert checkpoint_stock(2, 0) == (0, 1)
+        after = stock_as_of(item_id, datetime.utcnow())
+        assert {key: after[key] for key in expected} == expected
+        assert after['checkpoint_movement_id'] == db.session.query(db.func.max(StockMovement.id)).scalar()
+
+        # Niente di nuovo dall'ultimo checkpoint: nessuna riga in più.
+        assert checkpoint_stock(2, 0) == (0, 0)
+        assert StockCheckpoint.query.count() == 1
+
+
+def test_stock_as_of_a_past_date_ignores_later_movements(app, client, auth_headers, item_id):
+    with app.app_context():
+        backdate_movements(86400 * 2)
+    move(client, auth_headers, item_id, scarico=4)
+
+    yesterday = (datetime.utcnow() - timedelta(days=1)).date().isoformat()
+    response = client.get(f'/api/inventory/{item_id}/stock?at={yesterday}', headers=auth_headers)
+    assert response.status_code == 200
+    assert (response.json['carico'], response.json['scarico'], response.json['quantita']) == (10, 0, 10)
+
+    now = client.get(f'/api/inventory/{item_id}/stock', headers=auth_headers).json
+    assert now['quantita'] == 6
+
+
+def test_recent_movements_wait_for_the_lag(app, client, auth_headers, item_id):
+    move(client, auth_headers, item_id, carico=1)
+    with app.app_context():
+        assert checkpoint_stock(2, 3600) == (0, 0)
+        backdate_movements(7200)
+        assert checkpoint_stock(2, 3600) == (0, 1)
+
+
+def test_opening_balance_for_items_without_ledger(app):
+    with app.app_context():
+        db.session.add(Inventory(codice_articolo='OLD-1', carico=7, scarico=2, quantita=5))
+        db.session.commit()
+        assert checkpoint_stock(2, 0) == (1, 0)
+        opening = StockMovement.query.filter_by(kind=KIND_OPENING).one()
+        assert (opening.carico, opening.scarico) == (7, 2)
+        assert checkpoint_stock(2, 0) == (0, 0)
+
+
+def test_unknown_item_is_404(client, auth_headers):
+    assert client.get('/api/inventory/999/stock', headers=auth_headers).status_code == 404
+    assert client.get('/api/inventory/999/movements', headers=auth_headers).status_code == 404
+
+
+def test_deleted_item_keeps_its_history(client, auth_headers, item_id):
+    assert client.delete(f'/api/inventory/{item_id}', headers=auth_headers).status_code == 200
+    stock = client.get(f'/api/inventory/{item_id}/stock', headers=auth_headers)
+    assert stock.status_code == 200
+    assert stock.json['quantita'] == 0
+    history = client.get(f'/api/inventory/{item_id}/movements', headers=auth_headers)
+    assert [row['kind'] for row in history.json['items']] == ['eliminazione', 'creazione']
+
+
+def test_movement_history_pages_with_a_cursor(client, auth_headers, item_id):
+    for quantity in range(1, 5):
+        move(client, auth_headers, item_id, carico=quantity)
+
+    seen, cursor = [], None
+    while True:
+        url = f'/api/inventory/{item_id}/movements?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url, headers=auth_headers).json
+        seen.extend(page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert [row['carico'] for row in seen] == [4, 3, 2, 1, 10]
+    ids = [row['id'] for row in seen]
+    assert ids == sorted(ids, reverse=True)
+    assert client.get(f'/api/inventory/{item_id}/movements?cursor=rotto', headers=auth_headers).status_code == 400
+
+
+def test_checkpointer_runs_on_its_own(app, client, auth_headers, item_id):
+    move(client, auth_headers, item_id, carico=1)
+    with app.app_context():
+        checkpointer = get_stock_checkpointer()
+        assert checkpointer.run_once() == 1
+        stats = checkpointer.stats()
+    assert (stats['runs'], stats['created_total'], stats['running']) == (1, 1, False)
+
+
+def test_checkpointer_thread_starts_with_the_first_request(app, client, auth_headers, monkeypatch):
+    with app.app_context():
+        checkpointer = get_stock_checkpointer()
+    monkeypatch.setattr(checkpointer, 'interval_seconds', 3600)
+    client.get('/api/inventory', headers=auth_headers)
+    assert checkpointer.stats()['running']
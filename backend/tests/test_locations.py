@@ -0,0 +1,43 @@
+from app.extensions import db
+from app.inventory.locations import cached_location_tree, get_location_cache
+from app.inventory.versioning import next_inventory_version
+from app.models import Inventory
+
+
+def test_location_tree_aggregates_along_paths(client, auth_headers):
+    for code, location, quantity in [('A', 'M1/Scaffale1', 3), ('B', 'M1/Scaffale2', 4), ('C', None, 1)]:
+        client.post('/api/inventory', json={'codice_articolo': code, 'carico': quantity, 'locazione': location},
+                    headers=auth_headers)
+
+    tree = client.get('/api/inventory/locations', headers=auth_headers).json
+    assert (tree['article_count'], tree['total_quantity']) == (3, 8)
+    magazzino, unassigned = tree['locations']
+    assert (magazzino['path'], magazzino['article_count'], magazzino['total_quantity']) == ('M1', 2, 7)
+    assert [child['path'] for child in magazzino['children']] == ['M1/Scaffale1', 'M1/Scaffale2']
+    assert (unassigned['path'], unassigned['article_count']) == ('', 1)
+
+
+def test_writes_from_another_process_refresh_the_tree(app_context):
+    db.session.add(Inventory(codice_articolo='A', locazione='M1', quantita=3, carico=3, scarico=0))
+    next_inventory_version()
+    db.session.commit()
+    assert cached_location_tree()['total_quantity'] == 3
+
+    # Scrittura di un altro worker: nessun after_request in questo processo.
+    db.session.add(Inventory(codice_articolo='B', locazione='M2', quantita=5, carico=5, scarico=0))
+    next_inventory_version()
+    db.session.commit()
+    assert cached_location_tree()['total_quantity'] == 8
+
+
+def test_tree_is_cached_while_the_version_is_unchanged(app_context):
+    db.session.add(Inventory(codice_articolo='A', locazione='M1', quantita=3, carico=3, scarico=0))
+    db.session.commit()
+    first = cached_location_tree()
+    # Modifica senza nuova versione: la cache non se ne accorge fino al TTL.
+    db.session.query(Inventory).update({'quantita': 10})
+    db.session.commit()
+    assert cached_location_tree() is first
+
+    get_location_cache().invalidate()
+    assert cached_location_tree()['total_quantity'] == 10
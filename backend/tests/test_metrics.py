@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from app import create_app
+from app.config import Config
+from app.metrics import MetricsRegistry, merge_snapshots, render
+
+
+@pytest.fixture
+def config_overrides():
+    return {'METRICS_ENABLED': True, 'METRICS_N_PLUS_ONE_THRESHOLD': 1000}
+
+
+def scrape(client, headers=None) -> str:
+    response = client.get('/metrics', headers=headers or {})
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    return response.get_data(as_text=True)
+
+
+def samples(body: str) -> dict:
+    return dict(line.rsplit(' ', 1) for line in body.splitlines() if line and not line.startswith('#'))
+
+
+def test_requests_are_counted_per_endpoint(client, auth_headers):
+    for _ in range(2):
+        assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    assert client.get('/api/inventory/999', headers=auth_headers).status_code == 404
+
+    body = scrape(client)
+    values = samples(body)
+    requests = 'gestionale_http_requests_total'
+    assert values[f'{requests}{{endpoint="inventory.list_inventory",method="GET",status="200"}}'] == '2'
+    assert values[f'{requests}{{endpoint="inventory.get_inventory_item",method="GET",status="404"}}'] == '1'
+    assert '# TYPE gestionale_http_request_duration_seconds histogram' in body
+    duration = 'gestionale_http_request_duration_seconds'
+    labels = 'endpoint="inventory.list_inventory",method="GET"'
+    assert values[f'{duration}_count{{{labels}}}'] == '2'
+    # Le etichette sono in ordine alfabetico, `le` compresa.
+    assert values[f'{duration}_bucket{{endpoint="inventory.list_inventory",le="+Inf",method="GET"}}'] == '2'
+    assert int(values['gestionale_db_queries_per_request_count{endpoint="inventory.list_inventory"}']) == 2
+    assert float(values['gestionale_db_queries_per_request_sum{endpoint="inventory.list_inventory"}']) >= 2
+    # Le statistiche dei componenti diventano gauge del processo.
+    assert '# TYPE gestionale_token_reaper_runs gauge' in body
+    assert 'gestionale_http_slow_requests_total' not in body
+
+
+def test_repeated_queries_are_flagged(app, client, auth_headers, caplog):
+    app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = 0
+    client.get('/api/inventory', headers=auth_headers)
+    values = samples(scrape(client))
+    assert int(values['gestionale_db_n_plus_one_requests_total{endpoint="inventory.list_inventory"}']) >= 1
+    assert 'Possibile N+1' in caplog.text
+
+
+def test_bearer_token(app, client):
+    app.config['METRICS_BEARER_TOKEN'] = 'segreto'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer altro'}).status_code == 401
+    scrape(client, {'Authorization': 'Bearer segreto'})
+
+
+def test_snapshots_of_every_worker_are_summed(app, client, tmp_path):
+    directory = tmp_path / 'metrics'
+    app.extensions['metrics'].directory = directory
+    other = MetricsRegistry()
+    other.inc('http_requests_total', {'method': 'GET', 'endpoint': 'metrics', 'status': '200'}, 5)
+    other.dump(directory / 'metrics-1.json')
+    (directory / 'metrics-2.json').write_text('troncato')
+
+    client.get('/metrics')
+    values = samples(scrape(client))
+    # 5 dall'altro worker, 1 dallo scrape precedente di questo processo.
+    assert values['gestionale_http_requests_total{endpoint="metrics",method="GET",status="200"}'] == '6'
+    assert json.loads(app.extensions['metrics'].snapshot_path.read_text())['counters']
+
+
+def test_render_histograms_are_cumulative():
+    registry = MetricsRegistry()
+    for value in (0, 1, 4, 200):
+        registry.observe('db_queries_per_request', {'endpoint': 'a"b\\c'}, value)
+    merged = merge_snapshots([registry.snapshot(), registry.snapshot()])
+    values = samples(render(merged, {'extra': [({'pid': 1}, 0.5)]}))
+
+    series = 'gestionale_db_queries_per_request'
+    labels = 'endpoint="a\\"b\\\\c"'
+    assert values[f'{series}_bucket{{{labels},le="0"}}'] == '2'
+    assert values[f'{series}_bucket{{{labels},le="1"}}'] == '4'
+    assert values[f'{series}_bucket{{{labels},le="5"}}'] == '6'
+    assert values[f'{series}_bucket{{{labels},le="100"}}'] == '6'
+    assert values[f'{series}_bucket{{{labels},le="+Inf"}}'] == '8'
+    assert values[f'{series}_sum{{{labels}}}'] == '410'
+    assert values[f'{series}_count{{{labels}}}'] == '8'
+    assert values['gestionale_extra{pid="1"}'] == '0.5'
+
+
+def test_disabled_metrics_have_no_endpoint(app, monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_ENABLED', False)
+    disabled = create_app()
+    assert disabled.test_client().get('/metrics').status_code == 404
+    assert 'metrics' not in disabled.extensions
@@ -0,0 +1,115 @@
+import pytest
+
+from app.extensions import db
+from app.inventory.movements import Movement, apply_movements, parse_movements
+from app.inventory.versioning import current_inventory_version
+from app.models import Inventory, StockMovement
+
+
+@pytest.fixture
+def items(app_context):
+    rows = [
+        Inventory(codice_articolo='CAV-1', carico=10, scarico=0, quantita=10),
+        Inventory(codice_articolo='INV-1', carico=5, scarico=2, quantita=3),
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return {row.codice_articolo: row.id for row in rows}
+
+
+def stock(item_id: int):
+    row = db.session.query(Inventory.carico, Inventory.scarico, Inventory.quantita).filter_by(id=item_id).one()
+    return tuple(row)
+
+
+def test_parse_movements_reports_invalid_lines():
+    movements, errors = parse_movements({'movements': [
+        {'id': 1, 'carico': 2},
+        {'codice_articolo': ' CAV-1 ', 'scarico': '3'},
+        {'carico': 1},
+        {'id': 1, 'codice_articolo': 'CAV-1', 'carico': 1},
+        {'id': 1, 'carico': -1},
+        {'id': 1},
+        {'id': 'uno', 'carico': 1},
+        'non un oggetto',
+    ]}, max_batch=10)
+
+    assert movements == [Movement(0, 1, None, 2, 0), Movement(1, None, 'CAV-1', 0, 3)]
+    assert [error['index'] for error in errors] == [2, 3, 4, 5, 6, 7]
+
+
+@pytest.mark.parametrize('payload', [None, {}, {'movements': []}, {'movements': [{'id': 1, 'carico': 1}] * 3}])
+def test_parse_movements_rejects_empty_or_oversized_batches(payload):
+    with pytest.raises(ValueError):
+        parse_movements(payload, max_batch=2)
+
+
+def test_movements_are_summed_per_item(items):
+    version = current_inventory_version()
+    updated, errors = apply_movements([
+        Movement(0, items['CAV-1'], None, 4, 0),
+        Movement(1, None, 'CAV-1', 0, 6),
+        Movement(2, None, 'INV-1', 1, 0),
+    ], 'mario')
+
+    assert errors == []
+    assert [(row['codice_articolo'], row['quantita']) for row in updated] == [('CAV-1', 8), ('INV-1', 4)]
+    assert stock(items['CAV-1']) == (14, 6, 8)
+    assert stock(items['INV-1']) == (6, 2, 4)
+
+    new_version = current_inventory_version()
+    assert new_version == version + 1
+    assert {row.version for row in Inventory.query} == {new_version}
+    assert {row.modified_by for row in Inventory.query} == {'mario'}
+    ledger = StockMovement.query.order_by(StockMovement.id).all()
+    assert [(row.codice_articolo, row.carico, row.scarico) for row in ledger] == [
+        ('CAV-1', 4, 0), ('CAV-1', 0, 6), ('INV-1', 1, 0),
+    ]
+
+
+def test_batch_with_unknown_item_writes_nothing(items):
+    version = current_inventory_version()
+    updated, errors = apply_movements([
+        Movement(0, items['CAV-1'], None, 4, 0),
+        Movement(1, 9999, None, 1, 0),
+        Movement(2, None, 'NON-ESISTE', 1, 0),
+    ], 'mario')
+
+    assert updated == []
+    assert errors == [
+        {'index': 1, 'message': 'Articolo non trovato'},
+        {'index': 2, 'message': 'Articolo non trovato'},
+    ]
+    assert stock(items['CAV-1']) == (10, 0, 10)
+    assert StockMovement.query.count() == 0
+    assert current_inventory_version() == version
+
+
+def test_movements_add_to_current_totals_not_to_a_stale_read(items):
+    stale = db.session.get(Inventory, items['CAV-1'])
+    assert stale.carico == 10
+    # Un altro processo modifica l'articolo dopo la lettura.
+    db.session.query(Inventory).filter_by(id=items['CAV-1']).update({'carico': 20, 'quantita': 20})
+    db.session.commit()
+
+    apply_movements([Movement(0, items['CAV-1'], None, 1, 0)], 'mario')
+    assert stock(items['CAV-1']) == (21, 0, 21)
+
+
+def test_movements_endpoint(client, auth_headers):
+    client.post('/api/inventory', json={'codice_articolo': 'CAV-1', 'carico': 10}, headers=auth_headers)
+
+    response = client.post('/api/inventory/movements', json={'movements': [
+        {'codice_articolo': 'CAV-1', 'scarico': 3},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    item = response.json['items'][0]
+    assert item['quantita'] == 7
+
+    response = client.post('/api/inventory/movements', json=[{'codice_articolo': 'ALTRO', 'carico': 1}],
+                           headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json['errors'] == [{'index': 0, 'message': 'Articolo non trovato'}]
+
+    history = client.get(f"/api/inventory/{item['id']}/movements", headers=auth_headers).json['items']
+    assert [(entry['carico'], entry['scarico']) for entry in history] == [(0, 3), (10, 0)]
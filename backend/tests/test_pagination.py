@@ -0,0 +1,111 @@
+import pytest
+
+from app.extensions import db
+from app.inventory.queries import decode_cursor, encode_cursor
+from app.models import Inventory
+
+
+ROWS = [
+    ('P-05', 'Cavo', 3, 'M1'),
+    ('P-02', 'Presa', 7, None),
+    ('P-04', 'Cavo', 3, 'M2'),
+    ('P-01', None, 0, 'M1'),
+    ('P-03', 'Interruttore', 7, None),
+    ('P-06', 'Cavo', 1, 'M1'),
+    ('P-07', 'Spina', 3, ''),
+]
+
+
+@pytest.fixture
+def config_overrides():
+    return {'INVENTORY_PAGE_MAX_LIMIT': 4}
+
+
+@pytest.fixture
+def items(app):
+    with app.app_context():
+        db.session.add_all([
+            Inventory(codice_articolo=codice, descrizione=descrizione, quantita=quantita, locazione=locazione)
+            for codice, descrizione, quantita, locazione in ROWS
+        ])
+        db.session.commit()
+
+
+def expected_order(sort_name: str, descending: bool):
+    rows = [dict(zip(('codice_articolo', 'descrizione', 'quantita', 'locazione'), row), id=index)
+            for index, row in enumerate(ROWS, start=1)]
+    present = [row for row in rows if row[sort_name] is not None]
+    missing = [row for row in rows if row[sort_name] is None]
+    present.sort(key=lambda row: (row[sort_name], row['id']), reverse=descending)
+    missing.sort(key=lambda row: row['id'], reverse=descending)
+    # I NULL vanno in coda in entrambe le direzioni.
+    return [row['codice_articolo'] for row in present + missing]
+
+
+def walk(client, headers, query: str):
+    seen, cursor, pages = [], None, 0
+    while True:
+        url = f'/api/inventory?{query}&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.json
+        seen.extend(item['codice_articolo'] for item in response.json['items'])
+        cursor = response.json['next_cursor']
+        pages += 1
+        if cursor is None:
+            return seen, pages
+
+
+@pytest.mark.parametrize('sort', ['id', '-id', 'quantita', '-quantita', 'descrizione', '-descrizione', 'locazione', '-locazione'])
+def test_cursor_walk_returns_every_row_once_in_order(client, auth_headers, items, sort):
+    seen, pages = walk(client, auth_headers, f'sort={sort}')
+    assert seen == expected_order(sort.lstrip('-'), sort.startswith('-'))
+    assert pages == 4
+
+
+def test_cursor_walk_keeps_filters(client, auth_headers, items):
+    seen, _ = walk(client, auth_headers, 'sort=-quantita&descrizione=cavo')
+    # A parità di quantità l'id segue la direzione dell'ordinamento.
+    assert seen == ['P-04', 'P-05', 'P-06']
+
+
+def test_unpaginated_listing_is_a_plain_list(client, auth_headers, items):
+    response = client.get('/api/inventory', headers=auth_headers)
+    assert isinstance(response.json, list)
+    assert [item['codice_articolo'] for item in response.json] == [row[0] for row in ROWS]
+
+
+def test_limit_is_capped(client, auth_headers, items):
+    page = client.get('/api/inventory?limit=100', headers=auth_headers).json
+    assert len(page['items']) == 4
+    assert page['next_cursor'] is not None
+
+
+def test_field_projection(client, auth_headers, items):
+    page = client.get('/api/inventory?limit=1&fields=quantita,codice_articolo', headers=auth_headers).json
+    # L'ordine dei campi è quello dell'elenco completo, non quello richiesto.
+    assert page['items'] == [{'codice_articolo': 'P-05', 'quantita': 3}]
+
+
+@pytest.mark.parametrize('query', [
+    'sort=prezzo',
+    'fields=prezzo',
+    'limit=0',
+    'limit=dieci',
+    'cursor=non-un-cursore',
+])
+def test_invalid_parameters_are_400(client, auth_headers, items, query):
+    assert client.get(f'/api/inventory?{query}', headers=auth_headers).status_code == 400
+
+
+def test_cursor_is_bound_to_its_sort(client, auth_headers, items):
+    cursor = client.get('/api/inventory?sort=quantita&limit=2', headers=auth_headers).json['next_cursor']
+    assert client.get(f'/api/inventory?sort=-quantita&cursor={cursor}', headers=auth_headers).status_code == 400
+
+
+def test_cursor_round_trip():
+    for value in (None, 3, 'M1/Scaffale 2', 'àè'):
+        cursor = encode_cursor('locazione', True, value, 42)
+        assert '=' not in cursor
+        assert decode_cursor(cursor, 'locazione', True) == (value, 42)
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor('locazione', True, 'M1', 42), 'locazione', False)
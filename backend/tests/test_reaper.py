@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.auth.reaper import delete_expired_tokens, get_token_reaper
+from app.extensions import db
+from app.models import Token, User
+
+
+@pytest.fixture
+def config_overrides():
+    return {'TOKEN_REAPER_BATCH_SIZE': 2}
+
+
+@pytest.fixture
+def deletes(app_context):
+    """Numero di DELETE sui token eseguiti sulla connessione."""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('DELETE FROM TOKEN'):
+            executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def add_tokens(expired: int, valid: int) -> None:
+    user = User(username='mario', password='x')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.utcnow()
+    for index in range(expired):
+        db.session.add(Token(token=f'scaduto-{index}', user_id=user.id, expires_at=now - timedelta(minutes=index + 1)))
+    for index in range(valid):
+        db.session.add(Token(token=f'valido-{index}', user_id=user.id, expires_at=now + timedelta(hours=1)))
+    db.session.commit()
+
+
+def remaining() -> list:
+    return sorted(token for token, in db.session.query(Token.token))
+
+
+@pytest.mark.parametrize('expired, statements', [(5, 3), (4, 3), (1, 1), (0, 1)])
+def test_expired_tokens_are_deleted_in_batches(deletes, expired, statements):
+    add_tokens(expired=expired, valid=2)
+
+    assert delete_expired_tokens(2) == expired
+    # Un DELETE per lotto; l'ultimo, incompleto, chiude il ciclo.
+    assert len(deletes) == statements
+    assert remaining() == ['valido-0', 'valido-1']
+
+
+def test_cutoff_can_be_moved(app_context):
+    add_tokens(expired=3, valid=2)
+    assert delete_expired_tokens(10, now=datetime.utcnow() - timedelta(seconds=90)) == 2
+    assert remaining() == ['scaduto-0', 'valido-0', 'valido-1']
+    assert delete_expired_tokens(10, now=datetime.utcnow() + timedelta(hours=2)) == 3
+    assert remaining() == []
+
+
+def test_run_once_updates_the_stats(app_context):
+    add_tokens(expired=3, valid=1)
+    reaper = get_token_reaper()
+    assert reaper.batch_size == 2
+
+    assert reaper.run_once() == 3
+    assert reaper.run_once() == 0
+    stats = reaper.stats()
+    assert (stats['runs'], stats['deleted_total'], stats['last_deleted'], stats['failures']) == (2, 3, 0, 0)
+    assert stats['last_run_at'] is not None
+    # Con intervallo 0 il thread periodico non parte.
+    reaper.start()
+    assert reaper.stats()['running'] is False
+
+
+def test_expired_token_is_rejected_before_the_reaper_runs(app, client, auth_headers):
+    with app.app_context():
+        db.session.query(Token).update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 401
+    with app.app_context():
+        assert Token.query.count() == 1
+
+
+def test_cli_command(app):
+    with app.app_context():
+        add_tokens(expired=2, valid=0)
+    result = app.test_cli_runner().invoke(args=['auth', 'reap-tokens'])
+    assert result.exit_code == 0, result.output
+    assert 'Token scaduti eliminati: 2' in result.output
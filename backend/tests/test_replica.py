@@ -0,0 +1,51 @@
+import pytest
+
+from app.database import ReplicaRouter, get_replica_router
+
+
+@pytest.fixture
+def config_overrides(tmp_path):
+    # La "replica" è lo stesso file del primario: replicazione istantanea.
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    return {'SQLALCHEMY_BINDS': {'replica': url}, 'DB_REPLICA_VERSION_CACHE_SECONDS': 60}
+
+
+def router_stats(app):
+    with app.app_context():
+        return get_replica_router().stats()
+
+
+def test_replica_version_is_read_once_per_interval(app, client, auth_headers):
+    for _ in range(5):
+        assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+
+    stats = router_stats(app)
+    assert stats['version_checks'] == 1
+    assert stats['replica_reads'] == 5
+
+
+def test_writes_are_read_from_the_primary_until_the_replica_catches_up(app, client, auth_headers):
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    created = client.post('/api/inventory', json={'codice_articolo': 'A1', 'carico': 1}, headers=auth_headers)
+    written = int(created.headers['X-Inventory-Version'])
+
+    # La versione in cache è quella di prima della scrittura: si legge dal primario.
+    items = client.get('/api/inventory', headers=dict(auth_headers, **{'X-Inventory-Min-Version': str(written)})).json
+    assert [item['codice_articolo'] for item in items] == ['A1']
+    assert router_stats(app)['primary_reads'] == 1
+
+
+def test_cached_version_expires(app, monkeypatch):
+    router = ReplicaRouter(max_entries=10, version_ttl_seconds=1)
+    versions = iter([3, 7])
+    monkeypatch.setattr(router, '_read_replica_version', lambda: next(versions))
+    clock = [100.0]
+    monkeypatch.setattr('app.database.time.monotonic', lambda: clock[0])
+
+    assert router.replica_version() == 3
+    clock[0] += 0.5
+    assert router.replica_version() == 3
+    assert not router.use_replica('mario', '5')
+    clock[0] += 1
+    assert router.replica_version() == 7
+    assert router.use_replica('mario', '5')
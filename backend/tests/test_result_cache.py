@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from app.inventory.result_cache import InventoryResultCache, get_result_cache
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condizione non raggiunta'
+        time.sleep(0.005)
+
+
+class SlowQuery:
+    """Calcolo che resta in corso finché il test non lo sblocca."""
+
+    def __init__(self, body=b'corpo', error: Exception = None) -> None:
+        self.body = body
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            self.release.wait(5)
+            if self.error is not None:
+                raise self.error
+        return self.body
+
+
+def run_concurrently(cache: InventoryResultCache, query: SlowQuery, followers: int, key='k'):
+    results, errors = [], []
+
+    def request():
+        try:
+            results.append(cache.get_or_compute(key, query))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=request) for _ in range(followers + 1)]
+    threads[0].start()
+    wait_until(lambda: query.calls == 1)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: cache.stats()['coalesced'] == followers)
+    query.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_concurrent_requests_run_one_query():
+    cache = InventoryResultCache(max_entries=10, max_bytes=1000, wait_seconds=5)
+    query = SlowQuery()
+
+    results, errors = run_concurrently(cache, query, followers=5)
+
+    assert errors == []
+    assert results == [b'corpo'] * 6
+    assert query.calls == 1
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced'], stats['hits'], stats['entries']) == (1, 5, 0, 1)
+    assert cache.get_or_compute('k', query) == b'corpo'
+    assert cache.stats()['hit_ratio'] == round(6 / 7, 4)
+
+
+def test_followers_compute_on_their_own_when_the_leader_fails():
+    cache = InventoryResultCache(max_entries=10, max_bytes=1000, wait_seconds=5)
+    query = SlowQuery(error=RuntimeError('query fallita'))
+
+    results, errors = run_concurrently(cache, query, followers=3)
+
+    assert [str(error) for error in errors] == ['query fallita']
+    assert results == [b'corpo'] * 3
+    assert query.calls == 4
+
+
+def test_followers_stop_waiting_after_wait_seconds():
+    cache = InventoryResultCache(max_entries=10, max_bytes=1000, wait_seconds=0.01)
+    query = SlowQuery()
+    leader = threading.Thread(target=cache.get_or_compute, args=('k', query))
+    leader.start()
+    wait_until(lambda: query.calls == 1)
+
+    assert cache.get_or_compute('k', query) == b'corpo'
+    assert query.calls == 2
+    query.release.set()
+    leader.join(5)
+
+
+def test_result_computed_before_a_write_is_not_stored():
+    cache = InventoryResultCache(max_entries=10, max_bytes=1000, wait_seconds=5)
+    query = SlowQuery(body=b'vecchio')
+    leader = threading.Thread(target=cache.get_or_compute, args=('k', query))
+    leader.start()
+    wait_until(lambda: query.calls == 1)
+    cache.invalidate()
+    query.release.set()
+    leader.join(5)
+
+    assert cache.stats()['entries'] == 0
+    assert cache.get_or_compute('k', lambda: b'nuovo') == b'nuovo'
+
+
+def test_none_is_not_cached():
+    cache = InventoryResultCache(max_entries=10, max_bytes=1000, wait_seconds=5)
+    assert cache.get_or_compute('k', lambda: None) is None
+    assert cache.get_or_compute('k', lambda: b'x') == b'x'
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = InventoryResultCache(max_entries=2, max_bytes=10, wait_seconds=5)
+    cache.get_or_compute('a', lambda: b'aaa')
+    cache.get_or_compute('b', lambda: b'bbb')
+    cache.get_or_compute('a', lambda: b'non usato')
+    cache.get_or_compute('c', lambda: b'ccc')
+    assert cache.get_or_compute('a', lambda: b'ricalcolato') == b'aaa'
+    assert cache.get_or_compute('b', lambda: b'ricalcolato') == b'ricalcolato'
+
+    cache.get_or_compute('d', lambda: b'd' * 9)
+    # Oltre max_bytes escono le voci meno recenti.
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == (1, 9)
+    assert cache.get_or_compute('big', lambda: b'x' * 11) == b'x' * 11
+    assert cache.get_or_compute('big', lambda: b'ricalcolato') == b'ricalcolato'
+
+
+def test_disabled_cache_always_computes():
+    cache = InventoryResultCache(max_entries=0, max_bytes=1000, wait_seconds=5)
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute('k', lambda: calls.append(1) or b'x')
+    assert len(calls) == 2
+    assert cache.stats()['misses'] == 0
+
+
+@pytest.fixture
+def result_cache(app):
+    with app.app_context():
+        return get_result_cache()
+
+
+def test_listing_is_served_from_the_cache_until_a_write(client, auth_headers, result_cache):
+    first = client.get('/api/inventory', headers=auth_headers)
+    second = client.get('/api/inventory', headers=auth_headers)
+    assert first.data == second.data
+    assert (result_cache.stats()['misses'], result_cache.stats()['hits']) == (1, 1)
+
+    response = client.post('/api/inventory', json={'codice_articolo': 'RC-1', 'carico': 2}, headers=auth_headers)
+    assert response.status_code == 201
+    assert result_cache.stats()['entries'] == 0
+    listing = client.get('/api/inventory', headers=auth_headers).json
+    assert [item['codice_articolo'] for item in listing] == ['RC-1']
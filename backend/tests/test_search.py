@@ -0,0 +1,62 @@
+import pytest
+
+from app.extensions import db
+from app.models import Inventory
+
+
+@pytest.fixture
+def config_overrides():
+    return {'SEARCH_DEFAULT_LIMIT': 3}
+
+
+@pytest.fixture
+def items(app):
+    with app.app_context():
+        db.session.add_all([
+            Inventory(codice_articolo='XCAVO-9', descrizione='Ricambio', locazione='M1'),
+            Inventory(codice_articolo='P-1', descrizione='Cavo elettrico', locazione='M1'),
+            Inventory(codice_articolo='CAVO', descrizione='Matassa', locazione='M2'),
+            Inventory(codice_articolo='P-2', descrizione='Presa', locazione='Cavo/Scaffale1'),
+            Inventory(codice_articolo='CAVO-3', descrizione='Cavo tripolare', locazione='M3'),
+            Inventory(codice_articolo='P-3', descrizione='Sconto 50% su 10_A', locazione='M3'),
+            Inventory(codice_articolo='P-4', descrizione='Spina', locazione='M4'),
+        ])
+        db.session.commit()
+
+
+def search(client, headers, query: str):
+    response = client.get(f'/api/inventory/search?{query}', headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_results_are_ranked_by_field_and_match_kind(client, auth_headers, items):
+    results = search(client, auth_headers, 'q=cavo&limit=10')
+    assert [item['codice_articolo'] for item in results] == ['CAVO', 'CAVO-3', 'XCAVO-9', 'P-1', 'P-2']
+    # Codice uguale (50), codice per prefisso + descrizione per prefisso (20 + 8), ...
+    assert [item['score'] for item in results] == [50, 28, 10, 8, 4]
+    assert 'created_by' in results[0]
+
+
+def test_default_limit(client, auth_headers, items):
+    assert len(search(client, auth_headers, 'q=cavo')) == 3
+
+
+def test_like_wildcards_are_literal(client, auth_headers, items):
+    assert [item['codice_articolo'] for item in search(client, auth_headers, 'q=50%25')] == ['P-3']
+    assert [item['codice_articolo'] for item in search(client, auth_headers, 'q=10_a')] == ['P-3']
+    assert search(client, auth_headers, 'q=%25') == [search(client, auth_headers, 'q=50%25')[0]]
+    assert search(client, auth_headers, 'q=_') == [search(client, auth_headers, 'q=10_A')[0]]
+
+
+def test_no_match(client, auth_headers, items):
+    assert search(client, auth_headers, 'q=inesistente') == []
+
+
+@pytest.mark.parametrize('query', ['', 'q=', 'q=%20%20', 'q=cavo&limit=0', 'q=cavo&limit=molti'])
+def test_invalid_requests_are_400(client, auth_headers, query):
+    assert client.get(f'/api/inventory/search?{query}', headers=auth_headers).status_code == 400
+
+
+def test_search_requires_a_token(client):
+    assert client.get('/api/inventory/search?q=cavo').status_code == 401
@@ -0,0 +1,201 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app.extensions import db
+from app.files.storage import (
+    acquire_file,
+    collect_garbage,
+    create_upload_session,
+    release_file,
+    save_uploaded_file,
+    upload_root,
+)
+from app.models import Inventory, StoredFile, UploadSession
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'contenuto di prova'
+
+
+def upload(content: bytes = PNG, filename: str = 'foto.png') -> FileStorage:
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+def ref_count(key: str) -> int:
+    db.session.expire_all()
+    return db.session.get(StoredFile, key).ref_count
+
+
+def age_row(key: str, seconds: int = 3600) -> None:
+    db.session.query(StoredFile).filter_by(key=key).update(
+        {'updated_at': datetime.utcnow() - timedelta(seconds=seconds)}
+    )
+    db.session.commit()
+
+
+def age_file(path, seconds: int = 3600) -> None:
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_identical_uploads_share_one_blob(app_context):
+    first = save_uploaded_file(upload())
+    second = save_uploaded_file(upload(filename='copia.PNG'))
+    db.session.commit()
+
+    assert first == second
+    assert first.startswith('objects/') and first.endswith('.png')
+    assert (upload_root() / first).read_bytes() == PNG
+    assert StoredFile.query.count() == 1
+    assert ref_count(first) == 0
+
+
+def test_disallowed_extension_is_rejected(app_context):
+    with pytest.raises(ValueError):
+        save_uploaded_file(upload(filename='script.sh'))
+
+
+def test_acquire_and_release_track_references(app_context):
+    key = save_uploaded_file(upload())
+    db.session.commit()
+
+    acquire_file(key)
+    acquire_file(key)
+    assert ref_count(key) == 2
+    release_file(key)
+    release_file(key)
+    release_file(key)
+    assert ref_count(key) == 0
+
+
+def test_acquire_unknown_blob_fails_and_legacy_names_are_ignored(app_context):
+    with pytest.raises(ValueError):
+        acquire_file('objects/ab/cd/' + 'ab' * 32 + '.png')
+    acquire_file('vecchia-foto.png')
+    release_file('vecchia-foto.png')
+    acquire_file(None)
+
+
+def test_garbage_collection_keeps_referenced_and_recent_files(app_context):
+    referenced = save_uploaded_file(upload(PNG + b'1'))
+    orphan = save_uploaded_file(upload(PNG + b'2'))
+    recent = save_uploaded_file(upload(PNG + b'3'))
+    db.session.commit()
+    acquire_file(referenced)
+    db.session.commit()
+    age_row(referenced)
+    age_row(orphan)
+    thumbnail = upload_root() / 'derived' / f'{orphan}.thumb256.webp'
+    thumbnail.parent.mkdir(parents=True)
+    thumbnail.write_bytes(b'webp')
+
+    stats = collect_garbage(grace_seconds=60, session_ttl_seconds=3600)
+
+    assert stats['files_removed'] == 1
+    assert stats['bytes_freed'] == len(PNG) + 1 + len(b'webp')
+    assert not (upload_root() / orphan).exists()
+    assert not thumbnail.exists()
+    assert db.session.get(StoredFile, orphan) is None
+    assert (upload_root() / referenced).exists()
+    assert (upload_root() / recent).exists()
+
+
+def test_garbage_collection_removes_untracked_blobs(app_context):
+    key = save_uploaded_file(upload())
+    # Transazione annullata dopo il salvataggio: il file resta senza riga.
+    db.session.rollback()
+    path = upload_root() / key
+    assert path.exists()
+
+    assert collect_garbage(grace_seconds=60, session_ttl_seconds=3600)['files_removed'] == 0
+    age_file(path)
+    assert collect_garbage(grace_seconds=60, session_ttl_seconds=3600)['files_removed'] == 1
+    assert not path.exists()
+
+
+def test_garbage_collection_expires_upload_sessions(app_context):
+    session = create_upload_session('foto.png', 10, 'mario', max_bytes=100)
+    partial = upload_root() / '.partial' / session.id
+    assert partial.exists()
+    db.session.query(UploadSession).update({'updated_at': datetime.utcnow() - timedelta(hours=2)})
+    db.session.commit()
+
+    assert collect_garbage(grace_seconds=60, session_ttl_seconds=3600)['sessions_expired'] == 1
+    assert UploadSession.query.count() == 0
+    assert not partial.exists()
+
+
+def test_inventory_writes_move_references(app, client, auth_headers):
+    def create(code: str, content: bytes):
+        return client.post(
+            '/api/inventory',
+            data={'codice_articolo': code, 'carico': '1', 'foto': (io.BytesIO(content), 'foto.png')},
+            headers=auth_headers,
+            content_type='multipart/form-data',
+        )
+
+    assert create('A1', PNG).status_code == 201
+    assert create('A2', PNG).status_code == 201
+    with app.app_context():
+        first = Inventory.query.filter_by(codice_articolo='A1').one()
+        shared_key, item_id = first.foto, first.id
+        assert ref_count(shared_key) == 2
+
+    response = client.put(
+        f'/api/inventory/{item_id}',
+        data={'foto': (io.BytesIO(PNG + b'nuova'), 'nuova.png')},
+        headers=auth_headers,
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 200
+    with app.app_context():
+        new_key = db.session.get(Inventory, item_id).foto
+        assert new_key != shared_key
+        assert ref_count(shared_key) == 1
+        assert ref_count(new_key) == 1
+
+    assert client.delete(f'/api/inventory/{item_id}', headers=auth_headers).status_code == 200
+    with app.app_context():
+        assert ref_count(new_key) == 0
+
+
+@pytest.mark.parametrize('foto', ['../outside/victim.png', '../../etc/passwd', 'legacy.png', {'key': 'x'}])
+def test_foto_must_reference_a_stored_blob(client, auth_headers, foto):
+    response = client.post('/api/inventory', json={'codice_articolo': 'A1', 'foto': foto}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_chunked_upload_resumes_and_returns_the_key(client, auth_headers):
+    started = client.post('/api/files/uploads', json={'filename': 'foto.png', 'size': len(PNG)}, headers=auth_headers)
+    assert started.status_code == 201
+    url = f"/api/files/uploads/{started.json['id']}"
+
+    first = client.patch(url, data=PNG[:5], headers=dict(auth_headers, **{'Upload-Offset': '0'}))
+    assert (first.json['offset'], first.json['complete']) == (5, False)
+    mismatch = client.patch(url, data=PNG[2:], headers=dict(auth_headers, **{'Upload-Offset': '2'}))
+    assert (mismatch.status_code, mismatch.json['offset']) == (409, 5)
+    assert client.get(url, headers=auth_headers).json['offset'] == 5
+
+    last = client.patch(url, data=PNG[5:], headers=dict(auth_headers, **{'Upload-Offset': '5'}))
+    assert last.json['complete'] is True
+    assert last.json['key'].startswith('objects/')
+    assert client.get(url, headers=auth_headers).status_code == 404
+
+
+@pytest.mark.parametrize('payload', [
+    {'filename': 'foto.png', 'size': {'a': 1}},
+    {'filename': 'foto.png', 'size': [1]},
+    {'filename': 'foto.png', 'size': True},
+    {'filename': 'foto.png', 'size': 1.5},
+    {'filename': 'foto.png', 'size': '-3'},
+    {'filename': 'foto.png', 'size': 0},
+    {'filename': 'foto.png'},
+    ['foto.png', 10],
+])
+def test_chunked_upload_rejects_invalid_sizes(client, auth_headers, payload):
+    response = client.post('/api/files/uploads', json=payload, headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.auth.cache import REVOCATION_BATCH_SIZE, cache_key, revocation_payloads
+from app.auth.service import get_user_from_token
+from app.extensions import db, token_cache
+from app.models import Token
+
+
+@pytest.fixture
+def token_queries(app):
+    """Conta le query sulla tabella token."""
+    counter = {'count': 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM token' in statement:
+            counter['count'] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        yield counter
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_validated_token_is_served_from_the_cache(client, auth_headers, token_queries):
+    hits = token_cache.hits
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    queries = token_queries['count']
+
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    assert token_queries['count'] == queries
+    assert token_cache.hits == hits + 1
+
+
+def test_logout_invalidates_the_cached_token(client, auth_headers):
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    assert client.post('/api/logout', headers=auth_headers).status_code == 200
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 401
+
+
+def test_password_reset_invalidates_every_cached_token(client, login):
+    first, second = login('mario'), login('mario')
+    for headers in (first, second):
+        assert client.get('/api/inventory', headers=headers).status_code == 200
+
+    response = client.post('/api/reset-password', json={
+        'username': 'mario', 'new_password': 'Nuova0Password', 'confirm_password': 'Nuova0Password',
+    })
+    assert response.status_code == 200
+    for headers in (first, second):
+        assert client.get('/api/inventory', headers=headers).status_code == 401
+
+
+def test_cached_entry_does_not_outlive_the_token(app, client, auth_headers):
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    token_value = auth_headers['Authorization'].split(' ', 1)[1]
+    with app.app_context():
+        token_cache.set(token_value, 1, 'mario', datetime.utcnow() - timedelta(seconds=1))
+        Token.query.filter_by(token=token_value).update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 401
+
+
+def test_read_started_before_an_invalidation_is_not_cached(app, auth_headers):
+    token_value = auth_headers['Authorization'].split(' ', 1)[1]
+    with app.app_context():
+        token_cache.invalidate([token_value])
+        generation = token_cache.generation
+        # Un altro thread revoca il token mentre questa richiesta lo legge dal database.
+        token_cache.invalidate([token_value])
+        token_cache.set(token_value, 1, 'mario', datetime.utcnow() + timedelta(hours=1), generation)
+        assert token_cache.get(token_value) is None
+
+
+def test_remote_revocation_drops_the_cached_token(app, client, auth_headers):
+    token_value = auth_headers['Authorization'].split(' ', 1)[1]
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    assert token_cache.get(token_value) is not None
+
+    # Quello che riceve il listener quando la revoca avviene in un altro worker.
+    (payload,) = revocation_payloads([token_value])
+    assert token_value not in payload
+    token_cache._on_remote_revocation(payload)
+    assert token_cache.get(token_value) is None
+    with app.app_context():
+        assert get_user_from_token(token_value).username == 'mario'
+
+
+def test_malformed_remote_revocation_clears_the_cache(app, client, auth_headers):
+    token_value = auth_headers['Authorization'].split(' ', 1)[1]
+    assert client.get('/api/inventory', headers=auth_headers).status_code == 200
+    token_cache._on_remote_revocation('{')
+    assert token_cache.get(token_value) is None
+
+
+def test_revocation_payloads_fit_in_a_notify():
+    tokens = [f'token-{index}' for index in range(REVOCATION_BATCH_SIZE * 2 + 1)]
+    payloads = revocation_payloads(tokens)
+    assert len(payloads) == 3
+    assert all(len(payload) < 8000 for payload in payloads)
+    assert sum((json.loads(payload) for payload in payloads), []) == [cache_key(token) for token in tokens]
+
+
+def test_nothing_is_cached_until_the_listener_is_connected(app, auth_headers):
+    token_value = auth_headers['Authorization'].split(' ', 1)[1]
+    with app.app_context():
+        token_cache.invalidate([token_value])
+        token_cache._on_listener_disconnected()
+        assert get_user_from_token(token_value) is not None
+        assert token_cache.get(token_value) is None
+
+        token_cache._on_listener_connected(True)
+        assert get_user_from_token(token_value) is not None
+        assert token_cache.get(token_value) is not None
+
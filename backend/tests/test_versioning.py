@@ -0,0 +1,111 @@
+import pytest
+
+from app import utils
+
+
+@pytest.fixture
+def config_overrides():
+    return {'FILE_TOKEN_BUCKET_SECONDS': 0, 'FILE_TOKEN_TTL_SECONDS': 400, 'CHANGES_MAX_ITEMS': 3}
+
+
+def add(client, headers, codice: str, carico: int = 1) -> None:
+    response = client.post('/api/inventory', json={'codice_articolo': codice, 'carico': carico}, headers=headers)
+    assert response.status_code == 201, response.json
+
+
+def item_ids(client, headers) -> dict:
+    return {item['codice_articolo']: item['id'] for item in client.get('/api/inventory', headers=headers).json}
+
+
+def revalidate(client, headers, url: str, etag: str):
+    return client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+
+
+@pytest.mark.parametrize('url', ['/api/inventory', '/api/inventory?limit=1&sort=codice_articolo'])
+def test_unchanged_listing_answers_304(client, auth_headers, url):
+    add(client, auth_headers, 'VER-1')
+    first = client.get(url, headers=auth_headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    not_modified = revalidate(client, auth_headers, url, etag)
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+    assert not_modified.data == b''
+
+    add(client, auth_headers, 'VER-2')
+    changed = revalidate(client, auth_headers, url, etag)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_item_etag_changes_when_the_item_is_written(client, auth_headers):
+    add(client, auth_headers, 'VER-1')
+    item_id = item_ids(client, auth_headers)['VER-1']
+    url = f'/api/inventory/{item_id}'
+    etag = client.get(url, headers=auth_headers).headers['ETag']
+
+    add(client, auth_headers, 'VER-2')
+    assert revalidate(client, auth_headers, url, etag).status_code == 304
+
+    response = client.put(url, json={'descrizione': 'Cavo', 'carico': 0, 'scarico': 0}, headers=auth_headers)
+    assert response.status_code == 200, response.json
+    changed = revalidate(client, auth_headers, url, etag)
+    assert changed.status_code == 200
+    assert changed.json['descrizione'] == 'Cavo'
+
+
+def test_etag_follows_the_link_ttl_when_tokens_are_not_reused(client, auth_headers, monkeypatch):
+    add(client, auth_headers, 'VER-1')
+    clock = {'now': 1_000_000.0}
+    monkeypatch.setattr(utils.time, 'time', lambda: clock['now'])
+
+    etag = client.get('/api/inventory', headers=auth_headers).headers['ETag']
+    # Entro un quarto del TTL (100 s) la risposta resta valida...
+    clock['now'] += 50
+    assert revalidate(client, auth_headers, '/api/inventory', etag).status_code == 304
+    # ...poi cambia, così i link degli allegati vengono firmati di nuovo.
+    clock['now'] += 100
+    refreshed = revalidate(client, auth_headers, '/api/inventory', etag)
+    assert refreshed.status_code == 200
+    assert refreshed.headers['ETag'] != etag
+
+
+def test_changes_feed_reports_updates_and_deletions(client, auth_headers):
+    add(client, auth_headers, 'VER-1')
+    add(client, auth_headers, 'VER-2')
+    since = int(client.get('/api/inventory', headers=auth_headers).headers['X-Inventory-Version'])
+    ids = item_ids(client, auth_headers)
+
+    assert client.delete(f"/api/inventory/{ids['VER-1']}", headers=auth_headers).status_code == 200
+    response = client.put(
+        f"/api/inventory/{ids['VER-2']}",
+        json={'descrizione': 'Presa', 'carico': 0, 'scarico': 0},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+
+    changes = client.get(f'/api/inventory/changes?since={since}', headers=auth_headers)
+    assert changes.status_code == 200
+    assert changes.json['full_resync'] is False
+    assert changes.json['deleted'] == [ids['VER-1']]
+    assert [item['codice_articolo'] for item in changes.json['items']] == ['VER-2']
+    assert changes.json['version'] == since + 2
+    assert changes.headers['X-Inventory-Version'] == str(since + 2)
+
+    empty = client.get(f"/api/inventory/changes?since={changes.json['version']}", headers=auth_headers).json
+    assert (empty['items'], empty['deleted']) == ([], [])
+
+
+def test_changes_feed_asks_for_a_resync_beyond_the_limit(client, auth_headers):
+    for index in range(4):
+        add(client, auth_headers, f'VER-{index}')
+    changes = client.get('/api/inventory/changes?since=0', headers=auth_headers).json
+    assert changes['full_resync'] is True
+    assert changes['items'] == []
+
+
+@pytest.mark.parametrize('since', ['', 'abc', '-1'])
+def test_changes_feed_rejects_invalid_since(client, auth_headers, since):
+    assert client.get(f'/api/inventory/changes?since={since}', headers=auth_headers).status_code == 400
@@ -5,4 +5,5 @@ app = create_app()
 
 
 if __name__ == '__main__':
+    app.extensions['password_hasher'].start()
     app.run(host='0.0.0.0', port=5000, debug=False)
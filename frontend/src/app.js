@@ -30,6 +30,26 @@ async function safeJson(response) {
   }
 }
 
+// Versione dell'inventario dopo l'ultima modifica fatta da questo utente: le
+// letture la inviano al backend, che non usa la replica finché non l'ha raggiunta.
+const MIN_VERSION_KEY = 'inventoryMinVersion';
+
+function rememberWriteVersion(response) {
+  const version = Number(response.headers.get('X-Inventory-Version'));
+  if (version > Number(sessionStorage.getItem(MIN_VERSION_KEY) || 0)) {
+    sessionStorage.setItem(MIN_VERSION_KEY, String(version));
+  }
+}
+
+function readHeaders(token) {
+  const headers = { Authorization: 'Bearer ' + token };
+  const minVersion = sessionStorage.getItem(MIN_VERSION_KEY);
+  if (minVersion) {
+    headers['X-Inventory-Min-Version'] = minVersion;
+  }
+  return headers;
+}
+
 function ensurePopupElements() {
   if (popupOverlay) return;
 
@@ -231,6 +251,74 @@ function triggerDownload(url, filename) {
   setTimeout(() => window.URL.revokeObjectURL(url), 1500);
 }
 
+// Oltre questa soglia l'allegato viaggia a blocchi e l'upload riprende
+// da dove si era interrotto (anche dopo un ricaricamento della pagina).
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+
+async function uploadFileInChunks(file, token) {
+  const headers = { Authorization: 'Bearer ' + token };
+  const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let status = null;
+  const savedId = localStorage.getItem(resumeKey);
+  if (savedId) {
+    const response = await fetch(`${API_BASE_URL}/files/uploads/${savedId}`, { headers });
+    if (response.ok) {
+      status = await response.json();
+    }
+  }
+  if (!status) {
+    const response = await fetch(`${API_BASE_URL}/files/uploads`, {
+      method: 'POST',
+      headers: { ...headers, 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    status = await safeJson(response);
+    if (!response.ok) {
+      throw new Error(status.message || "Impossibile avviare l'upload");
+    }
+    localStorage.setItem(resumeKey, status.id);
+  }
+
+  const chunkSize = status.chunk_size || 5 * 1024 * 1024;
+  let offset = status.offset;
+  let retries = 0;
+  while (offset < file.size) {
+    let response;
+    try {
+      response = await fetch(`${API_BASE_URL}/files/uploads/${status.id}`, {
+        method: 'PATCH',
+        headers: { ...headers, 'Upload-Offset': String(offset) },
+        body: file.slice(offset, offset + chunkSize)
+      });
+    } catch (error) {
+      if (++retries > 5) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+      continue;
+    }
+    const data = await safeJson(response);
+    if (!response.ok && response.status !== 409) {
+      localStorage.removeItem(resumeKey);
+      throw new Error(data.message || "Errore durante l'upload del file");
+    }
+    offset = data.offset;
+    retries = 0;
+    if (data.complete) {
+      localStorage.removeItem(resumeKey);
+      return data.key;
+    }
+  }
+  throw new Error("Upload incompleto, riprova");
+}
+
+// Aggiunge l'allegato al form: direttamente se piccolo, altrimenti a blocchi.
+async function appendAttachment(formData, file, token) {
+  if (file.size <= CHUNKED_UPLOAD_THRESHOLD) {
+    formData.append('foto', file);
+    return;
+  }
+  formData.append('foto', await uploadFileInChunks(file, token));
+}
+
 // --- LOGIN (index.html) ---
 if (document.getElementById('form-login')) {
   document.getElementById('form-login').addEventListener('submit', async function(e) {
@@ -446,72 +534,102 @@ if (document.getElementById('form-reset')) {
 })();
 
 // --- Funzione per costruire la vista cartella (tree view) ---
-function buildTreeView(items) {
-  // Raggruppa gli articoli per locazione
-  const groups = {};
-  items.forEach(item => {
-    const location = item.locazione || "Senza locazione";
-    if (!groups[location]) {
-      groups[location] = [];
-    }
-    groups[location].push(item);
-  });
-
+function buildTreeView(locations, token) {
   const root = document.getElementById("tree-view-root");
   if (!root) return;
   root.innerHTML = "";
 
-  // Crea un <li> per ogni gruppo di locazione
-  for (const locationName in groups) {
-    const locItem = document.createElement("li");
+  // Un <li> per ogni nodo: i totali arrivano già aggregati dal backend
+  locations.forEach(node => root.appendChild(createLocationNode(node, token)));
+}
 
-    const header = document.createElement('div');
-    header.className = 'tree-location';
-    header.style.display = 'flex';
-    header.style.alignItems = 'center';
-    header.style.gap = '8px';
+function createLocationNode(node, token) {
+  const locItem = document.createElement("li");
 
-    const toggle = document.createElement('button');
-    toggle.type = 'button';
-    toggle.textContent = '▶';
-    toggle.className = 'btn btn-ghost btn-small';
-    toggle.style.padding = '4px 10px';
-    toggle.style.fontSize = '12px';
+  const header = document.createElement('div');
+  header.className = 'tree-location';
+  header.style.display = 'flex';
+  header.style.alignItems = 'center';
+  header.style.gap = '8px';
 
-    const title = document.createElement('span');
-    title.textContent = locationName;
-    title.style.flex = '1';
+  const toggle = document.createElement('button');
+  toggle.type = 'button';
+  toggle.textContent = '▶';
+  toggle.className = 'btn btn-ghost btn-small';
+  toggle.style.padding = '4px 10px';
+  toggle.style.fontSize = '12px';
 
-    const qrButton = document.createElement('button');
+  const title = document.createElement('span');
+  title.textContent = `${node.name} · ${formatNumber(node.article_count)} articoli · quantità ${formatNumber(node.total_quantity)}`;
+  title.style.flex = '1';
+
+  header.appendChild(toggle);
+  header.appendChild(title);
+
+  let qrButton = null;
+  if (node.path) {
+    qrButton = document.createElement('button');
     qrButton.type = 'button';
     qrButton.className = 'btn btn-secondary btn-small';
     qrButton.textContent = 'QR area';
     qrButton.addEventListener('click', (event) => {
       event.stopPropagation();
-      generateAreaQr(locationName);
+      generateAreaQr(node.path);
     });
-
-    header.appendChild(toggle);
-    header.appendChild(title);
     header.appendChild(qrButton);
-    locItem.appendChild(header);
-
-    const articleList = document.createElement("ul");
-    groups[locationName].forEach(article => {
+  }
+  locItem.appendChild(header);
+
+  const childList = document.createElement("ul");
+  node.children.forEach(child => childList.appendChild(createLocationNode(child, token)));
+  locItem.appendChild(childList);
+
+  // Gli articoli di una locazione vengono caricati solo alla prima apertura
+  let articlesLoaded = false;
+  locItem.addEventListener("click", async function(e) {
+    if (qrButton && e.target === qrButton) return;
+    e.stopPropagation();
+    this.classList.toggle("expanded");
+    const expanded = this.classList.contains('expanded');
+    toggle.textContent = expanded ? '▼' : '▶';
+    if (!expanded || articlesLoaded || !node.direct_article_count) return;
+
+    articlesLoaded = true;
+    const articles = await fetchLocationArticles(node.path, token);
+    if (!articles) {
+      articlesLoaded = false;
+      return;
+    }
+    articles.forEach(article => {
       const articleLi = document.createElement("li");
       articleLi.textContent = `${article.codice_articolo} - ${article.descrizione || ""}`;
-      articleList.appendChild(articleLi);
+      childList.appendChild(articleLi);
     });
+  });
+  return locItem;
+}
 
-    locItem.appendChild(articleList);
-    locItem.addEventListener("click", function(e) {
-      if (e.target === qrButton) return;
-      e.stopPropagation();
-      this.classList.toggle("expanded");
-      toggle.textContent = this.classList.contains('expanded') ? '▼' : '▶';
+async function fetchLocationArticles(path, token) {
+  const params = new URLSearchParams({
+    locazione_exact: path,
+    fields: 'id,codice_articolo,descrizione'
+  });
+  let response;
+  try {
+    response = await fetch(`${API_BASE_URL}/inventory?${params.toString()}`, {
+      headers: readHeaders(token)
     });
-    root.appendChild(locItem);
+  } catch (error) {
+    console.error(error);
+    forceLogoutAndRedirect('Sessione scaduta o server non raggiungibile. Effettua di nuovo il login.');
+    return null;
+  }
+  if (!response.ok) {
+    const errorData = await safeJson(response);
+    showPopup(errorData.message || 'Errore nel caricamento degli articoli', 'error', false);
+    return null;
   }
+  return safeJson(response);
 }
 
 function generateAreaQr(locationName) {
@@ -562,11 +680,18 @@ if (document.getElementById('inventory-table')) {
     }
   });
 
+  // Stato dell'elenco mostrato: serve per applicare il feed delle modifiche
+  // invece di riscaricare tutto l'inventario.
+  let currentItems = [];
+  let inventoryVersion = null;
+  let currentQuery = '';
+
   async function fetchInventory(queryParams = '') {
+    currentQuery = queryParams;
     let response;
     try {
       response = await fetch(`${API_BASE_URL}/inventory${queryParams}`, {
-        headers: { Authorization: 'Bearer ' + token }
+        headers: readHeaders(token)
       });
     } catch (error) {
       console.error(error);
@@ -585,10 +710,43 @@ if (document.getElementById('inventory-table')) {
       return;
     }
     const items = await safeJson(response);
+    const version = response.headers.get('X-Inventory-Version');
+    inventoryVersion = version !== null ? Number(version) : null;
+    currentItems = items;
     renderInventoryRows(items);
     updateInventoryStats(items);
   }
 
+  async function syncInventoryChanges() {
+    // Con filtri attivi o senza versione nota si ricarica l'elenco completo.
+    if (currentQuery || inventoryVersion === null) {
+      fetchInventory(currentQuery);
+      return;
+    }
+    let response;
+    try {
+      response = await fetch(`${API_BASE_URL}/inventory/changes?since=${inventoryVersion}`, {
+        headers: { Authorization: 'Bearer ' + token }
+      });
+    } catch (error) {
+      console.error(error);
+      fetchInventory();
+      return;
+    }
+    const changes = response.ok ? await safeJson(response) : null;
+    if (!changes || changes.full_resync) {
+      fetchInventory();
+      return;
+    }
+    const byId = new Map(currentItems.map((item) => [item.id, item]));
+    changes.deleted.forEach((itemId) => byId.delete(itemId));
+    changes.items.forEach((item) => byId.set(item.id, item));
+    currentItems = Array.from(byId.values()).sort((a, b) => a.id - b.id);
+    inventoryVersion = changes.version;
+    renderInventoryRows(currentItems);
+    updateInventoryStats(currentItems);
+  }
+
   function createAttachmentButton(attachment) {
     const button = document.createElement('button');
     button.className = 'btn btn-ghost btn-small';
@@ -604,9 +762,44 @@ if (document.getElementById('inventory-table')) {
       label = 'Apri immagine';
     }
     button.textContent = label;
+    if (attachment.thumbnail_token) {
+      const preview = document.createElement('img');
+      preview.className = 'attachment-thumbnail';
+      preview.alt = '';
+      preview.dataset.thumbnailToken = attachment.thumbnail_token;
+      button.prepend(preview);
+      thumbnailObserver.observe(preview);
+    }
     return button;
   }
 
+  // Le miniature si scaricano solo quando la riga entra nello schermo; se non
+  // sono ancora pronte resta l'etichetta testuale.
+  const thumbnailObserver = new IntersectionObserver((entries) => {
+    entries.forEach((entry) => {
+      if (!entry.isIntersecting) return;
+      thumbnailObserver.unobserve(entry.target);
+      loadThumbnail(entry.target);
+    });
+  }, { rootMargin: '200px' });
+
+  async function loadThumbnail(img) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/files/${img.dataset.thumbnailToken}`, {
+        headers: { Authorization: 'Bearer ' + token }
+      });
+      if (!response.ok) {
+        img.remove();
+        return;
+      }
+      const url = URL.createObjectURL(await response.blob());
+      img.addEventListener('load', () => URL.revokeObjectURL(url), { once: true });
+      img.src = url;
+    } catch (error) {
+      img.remove();
+    }
+  }
+
   function renderInventoryRows(items) {
     inventoryBody.innerHTML = '';
     if (!items.length) {
@@ -678,8 +871,9 @@ if (document.getElementById('inventory-table')) {
     }
     const data = await safeJson(response);
     if (response.ok) {
+      rememberWriteVersion(response);
       showPopup(data.message || 'Articolo eliminato', 'success');
-      fetchInventory();
+      syncInventoryChanges();
     } else {
       showPopup(data.message || "Impossibile eliminare l'articolo", 'error', false);
     }
@@ -720,6 +914,64 @@ if (document.getElementById('inventory-table')) {
   if (!urlParams.size) {
     fetchInventory();
   }
+
+  // Aggiornamenti push: ogni evento applica il feed delle modifiche
+  // (raggruppando le raffiche), `resync` ricarica l'elenco.
+  let syncTimer = null;
+  function handleInventoryEvent(type) {
+    if (type === 'resync') {
+      fetchInventory(currentQuery);
+      return;
+    }
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(syncInventoryChanges, 300);
+  }
+
+  async function connectInventoryStream() {
+    let retryDelay = 3000;
+    try {
+      const response = await fetch(`${API_BASE_URL}/inventory/stream`, {
+        headers: { Authorization: 'Bearer ' + token }
+      });
+      if (response.status === 401) {
+        return;
+      }
+      if (response.status === 503) {
+        // Troppi stream aperti sul server: aggiorna dal feed e riprova più tardi.
+        retryDelay = (parseInt(response.headers.get('Retry-After'), 10) || 30) * 1000;
+        handleInventoryEvent('changes');
+      }
+      if (response.ok && response.body) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const typeLine = block.split('\n').find((line) => line.startsWith('event: '));
+            if (typeLine) {
+              handleInventoryEvent(typeLine.slice(7));
+            }
+          }
+        }
+        // Il server chiude periodicamente il flusso: recupera quanto perso.
+        handleInventoryEvent('changes');
+      }
+    } catch (error) {
+      console.error(error);
+    }
+    setTimeout(connectInventoryStream, retryDelay);
+  }
+
+  if (window.ReadableStream && window.TextDecoder) {
+    connectInventoryStream();
+  }
+
   document.getElementById('logout').addEventListener('click', function() {
     localStorage.removeItem('token');
     window.location.href = 'index.html';
@@ -735,7 +987,7 @@ if (document.getElementById('tree-view-root')) {
   async function fetchInventoryForTree() {
     let response;
     try {
-      response = await fetch(`${API_BASE_URL}/inventory`, {
+      response = await fetch(`${API_BASE_URL}/inventory/locations`, {
         headers: { "Authorization": "Bearer " + token }
       });
     } catch (error) {
@@ -754,8 +1006,8 @@ if (document.getElementById('tree-view-root')) {
       showPopup(errorData.message || 'Errore nel caricamento dell\'inventario', 'error', false);
       return;
     }
-    const items = await safeJson(response);
-    buildTreeView(items);
+    const data = await safeJson(response);
+    buildTreeView(data.locations || [], token);
   }
   fetchInventoryForTree();
   document.getElementById('logout').addEventListener('click', function() {
@@ -766,12 +1018,36 @@ if (document.getElementById('tree-view-root')) {
 
 // --- ESPORTA INVENTARIO ---
 if (document.getElementById('export-btn')) {
+  const JOB_POLL_INTERVAL_MS = 1000;
+
+  async function waitForJob(job, token, onProgress) {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const response = await fetch(`${API_BASE_URL}/jobs/${job.id}`, {
+        headers: { "Authorization": "Bearer " + token }
+      });
+      if (!response.ok) {
+        throw new Error('Stato del job non disponibile');
+      }
+      job = await response.json();
+      onProgress(job);
+    }
+    return job;
+  }
+
   async function exportInventory() {
     const token = localStorage.getItem('token');
+    const button = document.getElementById('export-btn');
+    const originalLabel = button.textContent;
     let response;
     try {
-      response = await fetch(`${API_BASE_URL}/inventory/export`, {
-        headers: { "Authorization": "Bearer " + token }
+      response = await fetch(`${API_BASE_URL}/jobs`, {
+        method: 'POST',
+        headers: {
+          "Authorization": "Bearer " + token,
+          "Content-Type": "application/json"
+        },
+        body: JSON.stringify({ kind: 'export', params: { format: 'csv' } })
       });
     } catch (error) {
       console.error(error);
@@ -783,14 +1059,38 @@ if (document.getElementById('export-btn')) {
       showPopup("Errore durante l'export: " + errorText, 'error', false);
       return;
     }
-    const blob = await response.blob();
-    const url = window.URL.createObjectURL(blob);
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = "inventario.csv";
-    document.body.appendChild(a);
-    a.click();
-    a.remove();
+    button.disabled = true;
+    try {
+      const job = await waitForJob(await response.json(), token, current => {
+        const percent = current.progress.percent;
+        button.textContent = percent === null ? 'Export in corso...' : `Export ${percent}%`;
+      });
+      if (job.status !== 'succeeded') {
+        showPopup("Errore durante l'export: " + (job.error || 'job non completato'), 'error', false);
+        return;
+      }
+      const result = await fetch(`${API_BASE_URL}/jobs/${job.id}/result`, {
+        headers: { "Authorization": "Bearer " + token }
+      });
+      if (!result.ok) {
+        showPopup("Errore durante l'export: " + await result.text(), 'error', false);
+        return;
+      }
+      const blob = await result.blob();
+      const url = window.URL.createObjectURL(blob);
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = "inventario.csv";
+      document.body.appendChild(a);
+      a.click();
+      a.remove();
+      window.URL.revokeObjectURL(url);
+    } catch (error) {
+      showPopup("Errore durante l'export: " + error.message, 'error', false);
+    } finally {
+      button.disabled = false;
+      button.textContent = originalLabel;
+    }
   }
   document.getElementById('export-btn').addEventListener('click', exportInventory);
 }
@@ -810,7 +1110,12 @@ if (document.getElementById('form-add-item')) {
     formData.append("locazione", document.getElementById('locazione').value);
     const fotoFile = document.getElementById('foto').files[0];
     if (fotoFile) {
-      formData.append("foto", fotoFile);
+      try {
+        await appendAttachment(formData, fotoFile, token);
+      } catch (error) {
+        showPopup(error.message, 'error', false);
+        return;
+      }
     }
     const rawDate = document.getElementById('data_ingresso').value;
     const normalizedDate = toBackendDate(rawDate);
@@ -836,6 +1141,7 @@ if (document.getElementById('form-add-item')) {
     }
     const data = await safeJson(response);
     if (response.ok) {
+      rememberWriteVersion(response);
       showPopup(data.message || 'Articolo aggiunto con successo', 'success');
       document.getElementById('form-add-item').reset();
     } else {
@@ -856,7 +1162,7 @@ if (document.getElementById('form-edit-item')) {
     showPopup('ID articolo non specificato', 'error', false);
   } else {
     fetch(`${API_BASE_URL}/inventory/${itemId}`, {
-      headers: { "Authorization": "Bearer " + token }
+      headers: readHeaders(token)
     })
     .then(response => response.json())
     .then(data => {
@@ -884,7 +1190,12 @@ if (document.getElementById('form-edit-item')) {
     formData.append("locazione", document.getElementById('locazione').value);
     const fotoFile = document.getElementById('foto').files[0];
     if (fotoFile) {
-      formData.append("foto", fotoFile);
+      try {
+        await appendAttachment(formData, fotoFile, token);
+      } catch (error) {
+        showPopup(error.message, 'error', false);
+        return;
+      }
     }
     const rawDate = document.getElementById('data_ingresso').value;
     const normalizedDate = toBackendDate(rawDate);
@@ -910,6 +1221,7 @@ if (document.getElementById('form-edit-item')) {
     }
     const data = await safeJson(response);
     if (response.ok) {
+      rememberWriteVersion(response);
       showPopup(data.message || 'Articolo aggiornato con successo', 'success');
       setTimeout(() => {
         window.location.href = "inventory.html";